@@ -15,25 +15,73 @@
 #  * ----------------------------------------------------------------------------
 #
 
-# TODO: Respin lots of the messy if: elif: else: statements into a dictionary lookup
-
 import ctypes as ct
 import ctypes.util as ctu
-import bb_api_h as hf
+from . import bb_api_h as hf
 
 
 import sys
 
 if sys.platform == "win32":
 	from ctypes import wintypes as wt
+
+	#: File name of the SignalHound API library on this platform
+	LIB_NAME = "bb_api.dll"
+
+	#: Calling convention of C callbacks (the raw sweep loop) on this platform
+	CALLBACK_FUNCTYPE = ct.WINFUNCTYPE
 else:
-	raise ValueError("Only windows is currently supported by the SignalHound hardware.")
+	LIB_NAME = "libbb_api.so"
+	CALLBACK_FUNCTYPE = ct.CFUNCTYPE
+
+#: Environment variable that overrides the library search with an explicit path
+LIB_PATH_ENV = "SIGNALHOUND_LIB_PATH"
 
 import logging
 
 import numpy as np
-from numpy.core.multiarray import int_asbuffer
+import numbers
+import os
 import os.path
+import time
+
+from .buffers import IQRing, SweepRing, TraceBlock
+from .background import BackgroundAcquisition
+from .metrics import LatencyHistogram
+
+
+class SignalHoundError(IOError):
+	'''
+	Base class for errors returned by the SignalHound API. Subclasses ``IOError``, so
+	code that predates the exception hierarchy (and catches ``IOError``) still works.
+
+	Attributes:
+		status: The raw ``bbStatus`` return code.
+		call: Name of the wrapper method that got the error.
+	'''
+	def __init__(self, message, status=None, call=None):
+		super(SignalHoundError, self).__init__(message)
+		self.status = status
+		self.call = call
+
+#: Bad arguments were passed to one of the configure*() calls.
+class ConfigurationError(SignalHoundError): pass
+class InvalidParameterError(ConfigurationError): pass
+
+class DeviceNotOpenError(SignalHoundError): pass
+class DeviceNotConfiguredError(SignalHoundError): pass
+class DeviceNotIdleError(SignalHoundError): pass
+class DeviceConnectionError(SignalHoundError): pass
+class BufferTooSmallError(SignalHoundError): pass
+class NullPointerError(SignalHoundError): pass
+class AllocationLimitError(SignalHoundError): pass
+class GPSError(SignalHoundError): pass
+
+#: Errors that only affect the sweep in flight. Acquisition loops can drop the sweep and carry on.
+class AcquisitionError(SignalHoundError): pass
+class ADCOverflowError(AcquisitionError): pass
+class PacketFramingError(AcquisitionError): pass
+class NoTriggerFoundError(AcquisitionError): pass
 
 
 class SignalHound(object):
@@ -56,6 +104,7 @@ class SignalHound(object):
 		"bbInvalidDetectorErr"         : -100,
 
 		# General Errors
+		"bbUSBTimeoutErr"              : -15,
 		"bbDeviceConnectionErr"        : -14,
 		"bbPacketFramingErr"           : -13,
 		"bbGPSErr"                     : -12,
@@ -77,7 +126,103 @@ class SignalHound(object):
 		# Warnings/Messages
 		"bbAdjustedParameter"          : 1,
 		"bbADCOverflow"                : 2,
-		"bbNoTriggerFound"             : 3
+		"bbNoTriggerFound"             : 3,
+		"bbClampedToUpperLimit"        : 4,
+		"bbClampedToLowerLimit"        : 5,
+		"bbUncalibratedDevice"         : 6
+	}
+
+	#: Return code -> (severity, exception class, message) lookup used by ``checkStatus()``.
+	#: Positive codes are warnings from the API, and are only logged unless the caller asks otherwise.
+	bbStatusTable = {
+		hf.bbInvalidModeErr            : ("error",   ConfigurationError,       "Invalid mode!"),
+		hf.bbReferenceLevelErr         : ("error",   ConfigurationError,       "The reference level provided exceeds 20 dBm."),
+		hf.bbInvalidVideoUnitsErr      : ("error",   ConfigurationError,       "The video-processing units did not match any available setting."),
+		hf.bbInvalidWindowErr          : ("error",   ConfigurationError,       "The specified windowing function is unknown."),
+		hf.bbInvalidBandwidthTypeErr   : ("error",   ConfigurationError,       "'rbwType' is not one of the accepted values."),
+		hf.bbInvalidSweepTimeErr       : ("error",   ConfigurationError,       "Invalid sweep time!"),
+		hf.bbBandwidthErr              : ("error",   ConfigurationError,       "'rbw' falls outside device limits or 'vbw' is greater than resolution bandwidth."),
+		hf.bbInvalidGainErr            : ("error",   ConfigurationError,       "The specified gain value is outside the range of possible gains. Valid values are 0-%d, or \"auto\"" % hf.BB60_MAX_GAIN),
+		hf.bbAttenuationErr            : ("error",   ConfigurationError,       "The attenuation value provided exceeds 30 db."),
+		hf.bbFrequencyRangeErr         : ("error",   ConfigurationError,       "The calculated start or stop frequencies fall outside of the operational frequency range of the specified device."),
+		hf.bbInvalidSpanErr            : ("error",   ConfigurationError,       "The span provided is less than the minimum acceptable span."),
+		hf.bbInvalidScaleErr           : ("error",   ConfigurationError,       "Invalid scale setting error!"),
+		hf.bbInvalidDetectorErr        : ("error",   ConfigurationError,       "Invalid Detector mode!"),
+
+		hf.bbUSBTimeoutErr             : ("error",   DeviceConnectionError,    "USB timeout!"),
+		hf.bbDeviceConnectionErr       : ("error",   DeviceConnectionError,    "Device connection issues were present in the acquisition of this sweep!"),
+		hf.bbPacketFramingErr          : ("error",   PacketFramingError,       "Data loss or miscommunication has occurred between the device and the API!"),
+		hf.bbGPSErr                    : ("error",   GPSError,                 "Could not connect to GPS!"),
+		hf.bbGainNotSetErr             : ("error",   ConfigurationError,       "Gain not set!"),
+		hf.bbDeviceNotIdleErr          : ("error",   DeviceNotIdleError,       "The device is currently operating in a mode. The device must be idle to configure ports."),
+		hf.bbDeviceInvalidErr          : ("error",   SignalHoundError,         "Invalid device!"),
+		hf.bbBufferTooSmallErr         : ("error",   BufferTooSmallError,      "The 'arraySize' parameter passed is less than the trace size returned from 'bbQueryTraceInfo'."),
+		hf.bbNullPtrErr                : ("error",   NullPointerError,         "Null pointer error!"),
+		hf.bbAllocationLimitErr        : ("error",   AllocationLimitError,     "Could not allocate sufficent RAM!"),
+		hf.bbDeviceAlreadyStreamingErr : ("error",   DeviceNotIdleError,       "Device is already streaming!"),
+		hf.bbInvalidParameterErr       : ("error",   InvalidParameterError,    "A parameter specified is not valid."),
+		hf.bbDeviceNotConfiguredErr    : ("error",   DeviceNotConfiguredError, "Device not Configured!"),
+		hf.bbDeviceNotStreamingErr     : ("error",   DeviceNotConfiguredError, "Device is not streaming!"),
+		hf.bbDeviceNotOpenErr          : ("error",   DeviceNotOpenError,       "Device not open!"),
+
+		hf.bbAdjustedParameter         : ("warning", InvalidParameterError,    "A parameter was adjusted to fit the device limits."),
+		hf.bbADCOverflow               : ("warning", ADCOverflowError,         "The ADC has detected clipping of the input signal!"),
+		hf.bbNoTriggerFound            : ("warning", NoTriggerFoundError,      "The trigger condition was not met, or the spectrum returned is not representative of the gate specified."),
+		hf.bbClampedToUpperLimit       : ("warning", InvalidParameterError,    "The bandpass filter width was clamped to the maximum value allowed by the downsample factor."),
+		hf.bbClampedToLowerLimit       : ("warning", InvalidParameterError,    "The bandpass filter width specified is lower than BB_MIN_IQ_BW, and was clamped."),
+		hf.bbUncalibratedDevice        : ("warning", SignalHoundError,         "The device is uncalibrated!"),
+	}
+
+	#: ctypes prototypes for the API functions, as ``name : (restype, argtypes)``.
+	#: These are applied once, when the DLL is loaded, so ctypes doesn't have to work out how to convert
+	#: every argument on every call. Buffer arguments are declared as ``c_void_p``, so you can pass
+	#: ctypes arrays, pointers or plain integer addresses (e.g. ``numpyArr.ctypes.data``).
+	bbPrototypes = {
+		"bbOpenDevice"             : (ct.c_int, [ct.POINTER(ct.c_int)]),
+		"bbCloseDevice"            : (ct.c_int, [ct.c_int]),
+
+		"bbConfigureAcquisition"   : (ct.c_int, [ct.c_int, ct.c_uint, ct.c_uint]),
+		"bbConfigureCenterSpan"    : (ct.c_int, [ct.c_int, ct.c_double, ct.c_double]),
+		"bbConfigureLevel"         : (ct.c_int, [ct.c_int, ct.c_double, ct.c_double]),
+		"bbConfigureGain"          : (ct.c_int, [ct.c_int, ct.c_int]),
+		"bbConfigureSweepCoupling" : (ct.c_int, [ct.c_int, ct.c_double, ct.c_double, ct.c_double, ct.c_uint, ct.c_uint]),
+		"bbConfigureWindow"        : (ct.c_int, [ct.c_int, ct.c_uint]),
+		"bbConfigureProcUnits"     : (ct.c_int, [ct.c_int, ct.c_uint]),
+		"bbConfigureTrigger"       : (ct.c_int, [ct.c_int, ct.c_uint, ct.c_uint, ct.c_double, ct.c_double]),
+		"bbConfigureTimeGate"      : (ct.c_int, [ct.c_int, ct.c_double, ct.c_double, ct.c_double]),
+		"bbConfigureRawSweep"      : (ct.c_int, [ct.c_int, ct.c_int, ct.c_int, ct.c_int, ct.c_int]),
+		"bbConfigureIO"            : (ct.c_int, [ct.c_int, ct.c_uint, ct.c_uint]),
+		"bbConfigureDemod"         : (ct.c_int, [ct.c_int, ct.c_int, ct.c_double, ct.c_float, ct.c_float, ct.c_float, ct.c_float]),
+		"bbConfigureIQ"            : (ct.c_int, [ct.c_int, ct.c_int, ct.c_double]),
+
+		"bbInitiate"               : (ct.c_int, [ct.c_int, ct.c_uint, ct.c_uint]),
+
+		"bbFetchTrace"             : (ct.c_int, [ct.c_int, ct.c_int, ct.c_void_p, ct.c_void_p]),
+		"bbFetchAudio"             : (ct.c_int, [ct.c_int, ct.c_void_p]),
+		"bbFetchRawCorrections"    : (ct.c_int, [ct.c_int, ct.c_void_p, ct.POINTER(ct.c_int), ct.POINTER(ct.c_double)]),
+		"bbFetchRaw"               : (ct.c_int, [ct.c_int, ct.c_void_p, ct.c_void_p]),
+		"bbFetchRaw_s"             : (ct.c_int, [ct.c_int, ct.c_void_p, ct.c_void_p]),
+		"bbFetchRawSweep"          : (ct.c_int, [ct.c_int, ct.c_void_p]),
+		"bbStartRawSweepLoop"      : (ct.c_int, [ct.c_int, ct.c_void_p]),
+
+		"bbQueryTraceInfo"         : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_uint), ct.POINTER(ct.c_double), ct.POINTER(ct.c_double)]),
+		"bbQueryStreamInfo"        : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_int), ct.POINTER(ct.c_double), ct.POINTER(ct.c_int)]),
+		"bbQueryStreamingCenter"   : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_double)]),
+		"bbQueryTimestamp"         : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_uint), ct.POINTER(ct.c_uint)]),
+		"bbQueryDiagnostics"       : (ct.c_int, [ct.c_int] + [ct.POINTER(ct.c_float)] * 5),
+		"bbGetDeviceDiagnostics"   : (ct.c_int, [ct.c_int] + [ct.POINTER(ct.c_float)] * 3),
+
+		"bbAbort"                  : (ct.c_int, [ct.c_int]),
+		"bbPreset"                 : (ct.c_int, [ct.c_int]),
+		"bbSelfCal"                : (ct.c_int, [ct.c_int]),
+		"bbSyncCPUtoGPS"           : (ct.c_int, [ct.c_int, ct.c_int]),
+
+		"bbGetDeviceType"          : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_int)]),
+		"bbGetSerialNumber"        : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_uint)]),
+		"bbGetFirmwareVersion"     : (ct.c_int, [ct.c_int, ct.POINTER(ct.c_int)]),
+
+		"bbGetAPIVersion"          : (ct.c_char_p, []),
+		"bbGetErrorString"         : (ct.c_char_p, [ct.c_int]),
 	}
 
 	#: C Array size for raw sweep requests
@@ -86,62 +231,201 @@ class SignalHound(object):
 	#: Raw sweep trigger C array size
 	_rawSweepTriggerArraySize = 68
 
+	#: Number of blocks in the IQ ring used by ``fetchRaw()``
+	iqRingBlocks = 32
+
+	#: Number of sweeps in the ring used by ``startRawSweepCapture()``
+	sweepRingSlots = 64
+
 	__devType = None
 
-	def __init__(self):
+	def __init__(self, dll=None, serial=None):
+		'''
+		Args:
+			dll: Optional object to use in place of the SignalHound DLL. It must expose the ``bb*`` API calls with
+				the same arguments and return codes. Mostly useful for ``bb_sim.SimulatedBBApi``, which is also
+				used by default if the ``SIGNALHOUND_SIMULATE`` environment variable is set.
+			serial (int): Serial number of the device to open. Defaults to the first device found.
+		'''
 
 		self.log = logging.getLogger("Main.DeviceInt")
 		self.devOpen = False
+		self.dllHandle = None
+		self.cRawSweepCallbackFunc = None
 
-		if sys.platform == "win32":
+		if dll is None and os.environ.get("SIGNALHOUND_SIMULATE"):
+			from .bb_sim import SimulatedBBApi
+			dll = SimulatedBBApi()
 
-			self.log.info("Opening DLL")
-			libPath = ctu.find_library("bb_api.dll")
-
-			if not libPath:
-				if os.path.exists("bb_api.dll"):  # This is a messy hack, but it makes imports work with my scripts. I should
-													# Really put the signal hound DLL on my $PATH, but whatever
-					libPath = "bb_api.dll"
-				elif os.path.exists("../bb_api.dll"):
-					libPath = "../bb_api.dll"
-
-				# So, apparently despite the fact that the setup.py script drops the signal hound
-				# dll in the python/DLLs directory, and the fact that that directory is in sys.path,
-				# find_library somehow doesn't find it anyways.
-				# As such, manually check the DLLs directory for the signalHound dll
-				elif os.path.exists(os.path.join(sys.exec_prefix, "DLLs", "bb_api.dll")):
-					libPath = os.path.join(sys.exec_prefix, "DLLs", "bb_api.dll")
-				else:
-					self.log.error("Could not locate signal hound DLL.")
-					raise EnvironmentError("Required DLL not available on system PATH")
+		if dll is not None:
+			self.log.info("Using API object %s", dll)
+			self.libPath = None
+			self.dll = dll
 
+		else:
+			self.log.info("Opening DLL")
+			libPath = self.findLibrary()
 
 			self.log.info("Found dll located at %s", libPath)
+			self.libPath = libPath
 			self.dll = ct.CDLL (libPath)
+			self.loadPrototypes()
 
-			# This is horrible ctypes DLL hackery
-			# You need to access the internal DLL handle to properly force windows to close the dll handle, which
-			# is the only way to COMPLETELY close the device interface.
+			if sys.platform == "win32":
+				# This is horrible ctypes DLL hackery
+				# You need to access the internal DLL handle to properly force windows to close the dll handle, which
+				# is the only way to COMPLETELY close the device interface.
 
-			# It's needed if you ever want to completely close the device, to re-initialize the device interface.
-			# ctypes doesn't make manually deallocating a dll easy.
-			self.dllHandle = wt.HMODULE(self.dll._handle)
+				# It's needed if you ever want to completely close the device, to re-initialize the device interface.
+				# ctypes doesn't make manually deallocating a dll easy.
+				self.dllHandle = wt.HMODULE(self.dll._handle)
 
 
+		# Persistent output buffers for fetchTrace(). (Re)allocated when the trace size changes.
+		self._traceBuf = None
 
-		elif sys.platform == "linux" or sys.platform == "linux2":
-			self.log.error("Linux Not supported for API Verson 2.x!")
-			raise NotImplementedError("Linux Not supported for API Verson 2.x!")
+		# Bumped every time the device is (re)configured, so we know when the cached trace info is stale.
+		self.configGeneration = 0
+		self._traceInfo = None
+		self._traceInfoGeneration = -1
+		self._streamInfo = None
+		self._streamInfoGeneration = -1
 
+		# IQ streaming state, for fetchRaw()
+		self.iqRing = None
+		self._iqSampleIndex = 0
+		self._iqGeneration = -1
+		self._tsSeconds = ct.c_uint(0)
+		self._tsNanoseconds = ct.c_uint(0)
 
-		self.cRawSweepCallbackFunc = None
+		# Raw sweep loop capture, for startRawSweepCapture()
+		self.sweepRing = None
+
+		# Trace fetch thread, for startBackgroundAcquisition()
+		self.backgroundAcq = None
+
+		# Arguments of the last successful call of each configure*() function, so repeats can be skipped, and of
+		# the last initiate(), for retune() and recalibrate().
+		self._appliedConfig = {}
+		self._initiated = None
+		self.retuneLatency = LatencyHistogram()
+		self.recalLatency = LatencyHistogram()
 
-		self.openDevice()
+		self.openDevice(serial)
 
 		self.acq_conf = {}
 
 		self.sequentialADCErrors = 0
 
+	def findLibrary(self):
+		'''
+		Locate the SignalHound API library (``bb_api.dll`` on windows, ``libbb_api.so`` elsewhere).
+
+		Search order:
+			1. The path in the ``SIGNALHOUND_LIB_PATH`` environment variable, if set.
+			2. The system library search (``ctypes.util.find_library``).
+			3. The current directory, its parent, the package's ``data`` directory, and
+			   ``{sys.exec_prefix}/DLLs`` (where ``setup.py`` installs the DLL) or the usual
+			   library directories, depending on platform.
+
+		Returns:
+			Path (or, from ``find_library``, a name the loader can resolve) for ``ct.CDLL``.
+
+		Raises ``EnvironmentError`` if the library can't be found.
+		'''
+
+		envPath = os.environ.get(LIB_PATH_ENV)
+		if envPath:
+			if not os.path.exists(envPath):
+				raise EnvironmentError("%s is set, but %s does not exist!" % (LIB_PATH_ENV, envPath))
+			return envPath
+
+		# Windows' find_library wants the file name, everything else wants the bare library name.
+		libPath = ctu.find_library(LIB_NAME if sys.platform == "win32" else "bb_api")
+		if libPath:
+			return libPath
+
+		# So, apparently despite the fact that the setup.py script drops the signal hound
+		# dll in the python/DLLs directory, and the fact that that directory is in sys.path,
+		# find_library somehow doesn't find it anyways.
+		# As such, manually check a few likely places.
+		searchDirs = [".", "..", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")]
+		if sys.platform == "win32":
+			searchDirs.append(os.path.join(sys.exec_prefix, "DLLs"))
+		else:
+			searchDirs.extend([os.path.join(sys.exec_prefix, "lib"), "/usr/local/lib", "/usr/lib"])
+
+		for searchDir in searchDirs:
+			libPath = os.path.join(searchDir, LIB_NAME)
+			if os.path.exists(libPath):
+				return libPath
+
+		self.log.error("Could not locate signal hound library %s.", LIB_NAME)
+		raise EnvironmentError("Required library %s not available on the system library path, or in %s. Set %s to specify its location." % (LIB_NAME, searchDirs, LIB_PATH_ENV))
+
+	def loadPrototypes(self):
+		'''
+		Apply the ``bbPrototypes`` table to the loaded DLL. Functions the DLL doesn't export (the header
+		covers several API revisions) are logged and skipped.
+		'''
+
+		for funcName, (restype, argtypes) in self.bbPrototypes.items():
+			try:
+				func = getattr(self.dll, funcName)
+			except AttributeError:
+				self.log.info("DLL does not export %s. Skipping prototype.", funcName)
+				continue
+
+			func.restype = restype
+			func.argtypes = argtypes
+
+	def checkStatus(self, err, callName, messages=None, strict=False):
+		'''
+		Decode a ``bbStatus`` return code from the call ``callName``.
+
+		Args:
+			err (int): Value returned by the API call.
+			callName (str): Name of the calling method, for the error message.
+			messages (dict): Optional ``{code : message}`` overrides, for calls where the API
+				docs give a more specific meaning for a code.
+			strict (bool): If ``True``, warnings are raised as their exception class rather than logged.
+
+		Returns:
+			``err``, for warnings that didn't raise.
+
+		Raises the matching ``SignalHoundError`` subclass for errors.
+		'''
+
+		if err == hf.bbNoError:
+			return err
+
+		try:
+			severity, excClass, message = self.bbStatusTable[err]
+		except KeyError:
+			raise SignalHoundError("Unknown error in %s! Error = %s" % (callName, err), err, callName)
+
+		if messages and err in messages:
+			message = messages[err]
+
+		if severity == "warning" and not strict:
+			self.log.warning("%s: %s", callName, message)
+			return err
+
+		# After an error, we can't be sure what state the device is in. Make sure the next configure calls go through.
+		self._appliedConfig.clear()
+
+		raise excClass("%s: %s" % (callName, message), err, callName)
+
+	def _configUnchanged(self, callName, args):
+		'''
+		True if the last successful ``callName`` was made with the same (converted) arguments, in which case
+		the call doesn't need to be repeated.
+		'''
+		if self._appliedConfig.get(callName) == args:
+			self.log.info("%s unchanged. Skipping.", callName)
+			return True
+		return False
+
 	def __del__(self):
 		self.log.info("Deleting SignalHound Interface Class")
 		self.forceClose()
@@ -162,7 +446,7 @@ class SignalHound(object):
 		# rely on it happening automatically
 		self.log.info("Forcing DLL handle closed")
 
-		if sys.platform == "win32":
+		if self.dllHandle is not None:
 			try:
 				ct.windll.kernel32.FreeLibrary(self.dllHandle)
 			except ct.ArgumentError as e:
@@ -172,22 +456,44 @@ class SignalHound(object):
 
 
 
-	def openDevice(self):
+	def openDevice(self, serial=None):
+		'''
+		Args:
+			serial (int): Serial number of the device to open. Defaults to the first device found.
 
+		The API can only open "the next unopened device", so opening a specific device means opening devices until
+		the serial number matches, and closing the others again. Raises ``DeviceNotOpenError`` if there's no
+		unopened device with that serial number.
+
+		Raw Call: ``BB_API bbStatus bbOpenDevice(int *device);``
+		'''
 
 		self.log.info("Opening Device")
 
-		self.deviceHandle = ct.c_int(0)
-		deviceHandlePnt = ct.pointer(self.deviceHandle)
-		ret = self.dll.bbOpenDevice(deviceHandlePnt)
+		self._appliedConfig.clear()
+		self._initiated = None
+		self.configGeneration += 1
 
-		if ret != hf.bbNoError:
-			if ret == hf.bbNullPtrErr:
-				raise ValueError("Could not open device due to null-pointer error!")
-			elif ret == hf.bbDeviceNotOpenErr:
-				raise ValueError("Could not open device!")
-			else:
-				raise ValueError("Could not open device due to unknown reason!")
+		wrongDevices = []
+		try:
+			while True:
+				self.deviceHandle = ct.c_int(0)
+				err = self.dll.bbOpenDevice(ct.byref(self.deviceHandle))
+				if err and serial is not None and wrongDevices:
+					raise DeviceNotOpenError("No unopened device with serial number %s. Found %s" % (serial, [sn for sn, handle in wrongDevices]), err, "openDevice")
+
+				self.checkStatus(err, "openDevice", {hf.bbDeviceNotOpenErr : "Could not open device!"})
+
+				if serial is None:
+					break
+				openedSerial = self.getSerialNumber()
+				if openedSerial == serial:
+					break
+				wrongDevices.append((openedSerial, self.deviceHandle))
+
+		finally:
+			for dummy_sn, handle in wrongDevices:
+				self.dll.bbCloseDevice(handle)
 
 		self.devOpen = True
 
@@ -197,17 +503,22 @@ class SignalHound(object):
 
 	def closeDevice(self):
 		self.log.info("Closing Device with handle num: %s", self.deviceHandle.value)
+		self.stopBackgroundAcquisition()
 		try:
 			self.dll.bbAbort(self.deviceHandle)
 			self.log.info("Running acquistion aborted.")
+			if self.sweepRing:
+				self.sweepRing.close()
 		except Exception as e:
 			self.log.info("Could not abort acquisition: %s", e)
 
 
-		ret = self.dll.bbCloseDevice(self.deviceHandle)
+		self._appliedConfig.clear()
+		self._initiated = None
+		self.configGeneration += 1
+		err = self.dll.bbCloseDevice(self.deviceHandle)
 
-		if ret != hf.bbNoError:
-			raise ValueError("Error closing device!")
+		self.checkStatus(err, "closeDevice")
 		self.log.info("Closed Device with handle num: %s", self.deviceHandle.value)
 		self.devOpen = False
 
@@ -252,20 +563,9 @@ class SignalHound(object):
 		voltageUSB = ct.c_float(0)
 		currentUSB = ct.c_float(0)
 
-		temperaturePnt = ct.pointer(temperature)
-		voltageUSBPnt = ct.pointer(voltageUSB)
-		currentUSBPnt = ct.pointer(currentUSB)
+		err = self.dll.bbGetDeviceDiagnostics(self.deviceHandle, ct.byref(temperature), ct.byref(voltageUSB), ct.byref(currentUSB))
 
-
-
-		err = self.dll.bbGetDeviceDiagnostics(self.deviceHandle, temperaturePnt, voltageUSBPnt, currentUSBPnt)
-
-		if err == self.bbStatus["bbNoError"]:
-			pass
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		else:
-			raise IOError("Unknown error!")
+		self.checkStatus(err, "getDeviceDiagnostics")
 
 
 
@@ -275,8 +575,8 @@ class SignalHound(object):
 			"currentUSB"  :  currentUSB.value
 		}
 
-		if ret["currentUSB"] < 4.4:
-			raise EnvironmentError("USB Supply voltage below specified minimum of 4.4V. Please check hardware. Read supply voltage = %f" % ret["currentUSB"])
+		if ret["voltageUSB"] < hf.BB_MIN_USB_VOLTAGE:
+			raise EnvironmentError("USB Supply voltage below specified minimum of 4.4V. Please check hardware. Read supply voltage = %f" % ret["voltageUSB"])
 
 		if ret["temperature"] > 70 or ret["temperature"] < 0:
 			raise EnvironmentError("Hardware temperature outside of normal operating bounds.")
@@ -284,10 +584,10 @@ class SignalHound(object):
 		# self.log.info("Diagnostics queried. Values = \n%s", "\n".join(["	{key}, {value}".format(key=key, value=value) for key, value in ret.iteritems()]))
 		return ret
 
-	def queryStreamInfo(self):
+	def queryStreamInfo(self, refresh=False):
 		'''
 		Args:
-			No Args
+			refresh (bool): Force a query of the hardware, even if the cached values are current.
 		Returns:
 			dictionary containing status information on the IQ data stream:
 
@@ -298,7 +598,8 @@ class SignalHound(object):
 				| }
 
 
-		Use this function to characterize the IQ data stream.
+		Use this function to characterize the IQ data stream. As with ``queryTraceInfo()``, the result is cached
+		until the device is reconfigured.
 
 		Will raise ``IOError`` If the device is not open, not streaming, or if an unknown error is encountered..
 
@@ -306,34 +607,29 @@ class SignalHound(object):
 
 		'''
 
+		if not refresh and self._streamInfoGeneration == self.configGeneration:
+			return self._streamInfo
+
 		return_len         = ct.c_int(0)
 		bandwidth          = ct.c_double(0)
 		samples_per_sec    = ct.c_int(0)
 
-		return_lenPnt      = ct.pointer(return_len)
-		bandwidthPnt       = ct.pointer(bandwidth)
-		samples_per_secPnt = ct.pointer(samples_per_sec)
+		err = self.dll.bbQueryStreamInfo(self.deviceHandle, ct.byref(return_len), ct.byref(bandwidth), ct.byref(samples_per_sec))
 
-		err = self.dll.bbQueryStreamInfo(self.deviceHandle, return_lenPnt, bandwidthPnt, samples_per_secPnt)
-
-		if err == self.bbStatus["bbNoError"]:
-			pass
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("The device specified is not currently streaming!")
-		else:
-			raise IOError("Unknown error!")
+		self.checkStatus(err, "queryStreamInfo", {hf.bbDeviceNotConfiguredErr : "The device specified is not currently streaming!"})
 
 		# The raw data array returned by fetchRaw when in streaming mode is the value of return_len * 2 (since each value is two floats)
 		self._rawDataArrSize = return_len.value * 2
 
 		values = {
 			"return_len"      : return_len.value,
-			"samples_per_sec" : bandwidth.value,
-			"bandwidth"       : samples_per_sec.value
+			"samples_per_sec" : samples_per_sec.value,
+			"bandwidth"       : bandwidth.value
 		}
 
+		self._streamInfo = values
+		self._streamInfoGeneration = self.configGeneration
+
 		return values
 
 	def configureAcquisition(self, detector, scale):
@@ -380,15 +676,15 @@ class SignalHound(object):
 		self.acq_conf["scale"] = scale
 
 		detectorVals = {
-			"min-max" : ct.c_uint(hf.BB_MIN_AND_MAX),
-			"average" : ct.c_uint(hf.BB_AVERAGE)
+			"min-max" : hf.BB_MIN_AND_MAX,
+			"average" : hf.BB_AVERAGE
 		}
 
 		scaleVals = {
-			"log-scale"      : ct.c_uint(hf.BB_LOG_SCALE),
-			"lin-scale"      : ct.c_uint(hf.BB_LIN_SCALE),
-			"log-full-scale" : ct.c_uint(hf.BB_LOG_FULL_SCALE),
-			"lin-full-scale" : ct.c_uint(hf.BB_LIN_FULL_SCALE)
+			"log-scale"      : hf.BB_LOG_SCALE,
+			"lin-scale"      : hf.BB_LIN_SCALE,
+			"log-full-scale" : hf.BB_LOG_FULL_SCALE,
+			"lin-full-scale" : hf.BB_LIN_FULL_SCALE
 		}
 
 		self.log.info("Setting device acquisition configuration.")
@@ -402,18 +698,15 @@ class SignalHound(object):
 		else:
 			raise ValueError("Invalid Scaling mode! Scaling mode must be one of %s. Specified scale = %s" % (scaleVals.keys(), scale))
 
+		if self._configUnchanged("configureAcquisition", (detector, scale)):
+			return
+
+		self.configGeneration += 1
 		err = self.dll.bbConfigureAcquisition(self.deviceHandle, detector, scale)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureAcquisition succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidDetectorErr"]:
-			raise IOError("Invalid Detector mode!")
-		elif err == self.bbStatus["bbInvalidScaleErr"]:
-			raise IOError("Invalid scale setting error!")
-		else:
-			raise IOError("Unknown error setting configureAcquisition! Error = %s" % err)
+		self.checkStatus(err, "configureAcquisition")
+		self._appliedConfig["configureAcquisition"] = (detector, scale)
+		self.log.info("Call to configureAcquisition succeeded.")
 
 
 	def configureCenterSpan(self, center, span):
@@ -450,21 +743,16 @@ class SignalHound(object):
 
 
 		self.log.info("Setting device frequency center & span settings.")
-		center = ct.c_double(center)
-		span = ct.c_double(span)
 
+		if self._configUnchanged("configureCenterSpan", (center, span)):
+			return
+
+		self.configGeneration += 1
 		err = self.dll.bbConfigureCenterSpan(self.deviceHandle, center, span)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureCenterSpan succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidSpanErr"]:
-			raise IOError("The span provided is less than the minimum acceptable span.")
-		elif err == self.bbStatus["bbFrequencyRangeErr"]:
-			raise IOError("The calculated start or stop frequencies fall outside of the operational frequency range of the specified device.")
-		else:
-			raise IOError("Unknown error setting configureCenterSpan! Error = %s" % err)
+		self.checkStatus(err, "configureCenterSpan")
+		self._appliedConfig["configureCenterSpan"] = (center, span)
+		self.log.info("Call to configureCenterSpan succeeded.")
 
 
 	def configureLevel(self, ref, atten):
@@ -504,21 +792,16 @@ class SignalHound(object):
 			raise ValueError("Attenuator value must be a multiple of 10. Passed value of %s" % atten)
 
 		self.log.info("Setting device reference level and attentuation.")
-		ref = ct.c_double(ref)
-		atten = ct.c_double(atten)
 
+		if self._configUnchanged("configureLevel", (ref, atten)):
+			return
+
+		self.configGeneration += 1
 		err = self.dll.bbConfigureLevel(self.deviceHandle, ref, atten)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureLevel succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbReferenceLevelErr"]:
-			raise IOError("The reference level provided exceeds 20 dBm.")
-		elif err == self.bbStatus["bbAttenuationErr"]:
-			raise IOError("The attenuation value provided exceeds 30 db.")
-		else:
-			raise IOError("Unknown error setting configureLevel! Error = %s" % err)
+		self.checkStatus(err, "configureLevel")
+		self._appliedConfig["configureLevel"] = (ref, atten)
+		self.log.info("Call to configureLevel succeeded.")
 
 		return
 
@@ -554,23 +837,20 @@ class SignalHound(object):
 		if gain == "auto":
 			gain = hf.BB60_MAX_GAIN
 
-		try:
-			gain = ct.c_int(gain)
-		except TypeError:
+		if not isinstance(gain, numbers.Integral):
 			self.log.critical("Gain value must be an integer value, or \"auto\"")
-			raise
+			raise TypeError("Gain value must be an integer value, or \"auto\". Passed value was %s." % gain)
+
 
+		if self._configUnchanged("configureGain", (gain,)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureGain(self.deviceHandle, gain)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureGain succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidGainErr"]:
-			raise IOError("The specified gain value is outside the range of possible gains. Valid values are 0-%d, or \"auto\"" % hf.BB60_MAX_GAIN)
-		else:
-			raise IOError("Unknown error setting configureGain! Error = %s" % err)
+		self.checkStatus(err, "configureGain")
+		self._appliedConfig["configureGain"] = (gain,)
+		self.log.info("Call to configureGain succeeded.")
 
 		return
 
@@ -685,20 +965,15 @@ class SignalHound(object):
 		self.acq_conf["rbwType"]   = rbwType
 		self.acq_conf["rejection"] = rejection
 
-		rbw        = ct.c_double(rbw)
-		vbw        = ct.c_double(vbw)
-		sweepTime  = ct.c_double(sweepTime)
-
-
 		rbwVals = {
-			"native"     : ct.c_uint(hf.BB_NATIVE_RBW),
-			"non-native" : ct.c_uint(hf.BB_NON_NATIVE_RBW)
+			"native"     : hf.BB_NATIVE_RBW,
+			"non-native" : hf.BB_NON_NATIVE_RBW
 		}
 
 		rejectionVals = {
-			"no-spur-reject" : ct.c_uint(hf.BB_NO_SPUR_REJECT),
-			"spur-reject"    : ct.c_uint(hf.BB_SPUR_REJECT),
-			"bypass"         : ct.c_uint(hf.BB_BYPASS_RF)
+			"no-spur-reject" : hf.BB_NO_SPUR_REJECT,
+			"spur-reject"    : hf.BB_SPUR_REJECT,
+			"bypass"         : hf.BB_BYPASS_RF
 		}
 
 		if rbwType in rbwVals:
@@ -713,20 +988,15 @@ class SignalHound(object):
 
 
 
+		if self._configUnchanged("configureSweepCoupling", (rbw, vbw, sweepTime, rbwType, rejection)):
+			return
+
+		self.configGeneration += 1
 		err = self.dll.bbConfigureSweepCoupling(self.deviceHandle, rbw, vbw, sweepTime, rbwType, rejection)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("configureSweepCoupling Succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbBandwidthErr"]:
-			raise IOError("'rbw' falls outside device limits or 'vbw' is greater than resolution bandwidth.")
-		elif err == self.bbStatus["bbInvalidBandwidthTypeErr"]:
-			raise IOError("'rbwType' is not one of the accepted values.")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("'rejection' value is not one of the accepted values.")
-		else:
-			raise IOError("Unknown error setting configureSweepCoupling! Error = %s" % err)
+		self.checkStatus(err, "configureSweepCoupling", {hf.bbInvalidParameterErr : "'rejection' value is not one of the accepted values."})
+		self._appliedConfig["configureSweepCoupling"] = (rbw, vbw, sweepTime, rbwType, rejection)
+		self.log.info("configureSweepCoupling Succeeded.")
 
 
 
@@ -767,23 +1037,15 @@ class SignalHound(object):
 			raise ValueError("Decimation ratio must be one of values: %s. Specified value: %s" % (validDecimationFactors, downsample))
 
 
-		bandwidth  = ct.c_double(bandwidth)
-		downsample = ct.c_int(downsample)
+		if self._configUnchanged("configureIQ", (downsample, bandwidth)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureIQ(self.deviceHandle, downsample, bandwidth)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("configureSweepCoupling Succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("The downsample rate is outside the acceptable input range or the downsample rate is not a power of two.")
-		elif err == self.bbStatus["bbClampedToLowerLimit"]:
-			raise IOError("The bandpass filter width specified is lower than  BB_MIN_IQ_BW")
-		elif err == self.bbStatus["bbClampedToUpperLimit"]:
-			raise IOError("Warning that the bandpass filter width was clamped to the maximum value allowed by the downsampleFaction.")
-		else:
-			raise IOError("Unknown error setting bbConfigureIQ! Error = %s" % err)
+		self.checkStatus(err, "configureIQ", {hf.bbInvalidParameterErr : "The downsample rate is outside the acceptable input range or the downsample rate is not a power of two."})
+		self._appliedConfig["configureIQ"] = (downsample, bandwidth)
+		self.log.info("configureIQ Succeeded.")
 
 
 
@@ -821,20 +1083,17 @@ class SignalHound(object):
 		else:
 			raise ValueError("Window function name must be either \"nutall\", \"blackman\", \"hamming\" or \"flat-top\". Passed value was %s." % window)
 
-		window = ct.c_uint(window)
 
 
+		if self._configUnchanged("configureWindow", (window,)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureWindow(self.deviceHandle, window)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureWindow succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidWindowErr"]:
-			raise IOError("The specified windowing function is unknown.")
-		else:
-			raise IOError("Unknown error setting configureWindow! Error = %s" % err)
+		self.checkStatus(err, "configureWindow")
+		self._appliedConfig["configureWindow"] = (window,)
+		self.log.info("Call to configureWindow succeeded.")
 
 
 
@@ -876,18 +1135,15 @@ class SignalHound(object):
 		else:
 			raise ValueError("Video processing unit name must be either \"log\", \"voltage\", \"power\" or \"bypass\". Passed value was %s." % units)
 
-		units = ct.c_uint(units)
+		if self._configUnchanged("configureProcUnits", (units,)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureProcUnits(self.deviceHandle, units)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureProcUnits succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidVideoUnitsErr"]:
-			raise IOError("The video-processing units did not match any available setting.")
-		else:
-			raise IOError("Unknown error setting configureProcUnits! Error = %s" % err)
+		self.checkStatus(err, "configureProcUnits")
+		self._appliedConfig["configureProcUnits"] = (units,)
+		self.log.info("Call to configureProcUnits succeeded.")
 
 
 
@@ -960,21 +1216,15 @@ class SignalHound(object):
 			edge =  hf.BB_TRIGGER_FALLING
 
 
-		trigType = ct.c_uint(trigType)
-		edge = ct.c_uint(edge)
-		level = ct.c_double(level)
-		timeout = ct.c_double(timeout)
+		if self._configUnchanged("configureTrigger", (trigType, edge, level, timeout)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureTrigger(self.deviceHandle, trigType, edge, level, timeout)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureTrigger succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("A parameter specified is not valid.")
-		else:
-			raise IOError("Unknown error setting configureTrigger! Error = %s" % err)
+		self.checkStatus(err, "configureTrigger")
+		self._appliedConfig["configureTrigger"] = (trigType, edge, level, timeout)
+		self.log.info("Call to configureTrigger succeeded.")
 
 
 	def configureTimeGate(self, delay, length, timeout):
@@ -997,20 +1247,15 @@ class SignalHound(object):
 		self.log.warning("configureTimeGate is only valid for external trigger sources.")
 		self.log.warning("Please ensure you are set up to use an external trigger")
 
-		delay = ct.c_double(delay)
-		length = ct.c_double(length)
-		timeout = ct.c_double(timeout)
+		if self._configUnchanged("configureTimeGate", (delay, length, timeout)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureTimeGate(self.deviceHandle, delay, length, timeout)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureTimeGate succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("A parameter specified is not valid.")
-		else:
-			raise IOError("Unknown error setting configureTimeGate! Error = %s" % err)
+		self.checkStatus(err, "configureTimeGate")
+		self._appliedConfig["configureTimeGate"] = (delay, length, timeout)
+		self.log.info("Call to configureTimeGate succeeded.")
 
 	def configureRawSweep(self, start, ppf, steps):
 		'''
@@ -1045,21 +1290,17 @@ class SignalHound(object):
 		self.acq_conf["ppf"] = ppf
 		self.acq_conf["steps"] = steps
 
-		start = ct.c_int(start)
-		ppf = ct.c_int(ppf)
-		steps = ct.c_int(steps)
-		stepSize = ct.c_int(hf.BB_TWENTY_MHZ)
+		stepSize = hf.BB_TWENTY_MHZ
+
+		if self._configUnchanged("configureRawSweep", (start, ppf, steps, stepSize)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureRawSweep(self.deviceHandle, start, ppf, steps, stepSize)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureRawSweep succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("A parameter specified is not valid.")
-		else:
-			raise IOError("Unknown error setting configureRawSweep! Error = %s" % err)
+		self.checkStatus(err, "configureRawSweep")
+		self._appliedConfig["configureRawSweep"] = (start, ppf, steps, stepSize)
+		self.log.info("Call to configureRawSweep succeeded.")
 
 	def configureIO(self, port1Coupling, port1mode, port2mode):
 		'''
@@ -1147,21 +1388,15 @@ class SignalHound(object):
 			raise ValueError("port2mode must be either \"int-ref-out\", \"ext-ref-in\", \"out-logic-low\" or \"out-logic-high\". Passed value was %s." % port1mode)
 
 
-		port1 = ct.c_uint(port1)
-		port2 = ct.c_uint(port2)
+		if self._configUnchanged("configureIO", (port1, port2)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureIO(self.deviceHandle, port1, port2)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureIO succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotIdleErr"]:
-			raise IOError("The device is currently operating in a mode. The device must be idle to configure ports.")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
-			raise IOError("A parameter supplied is unknown.")
-		else:
-			raise IOError("Unknown error setting configureIO! Error = %s" % err)
+		self.checkStatus(err, "configureIO")
+		self._appliedConfig["configureIO"] = (port1, port2)
+		self.log.info("Call to configureIO succeeded.")
 
 
 	def configureDemod(self, modulationType, freq, ifBw, audioLowPassFreq, audioHighPassFreq, fmDeemphasis):
@@ -1212,22 +1447,15 @@ class SignalHound(object):
 			raise ValueError("FM De-emphasis should be between 1 and 100 microseconds.")
 
 
-		modulationType     = ct.c_int(modulationType)
-		freq               = ct.c_double(freq)
-		ifBw               = ct.c_float(ifBw)
-		audioLowPassFreq   = ct.c_float(audioLowPassFreq)
-		audioHighPassFreq  = ct.c_float(audioHighPassFreq)
-		fmDeemphasis       = ct.c_float(fmDeemphasis)
-
+		if self._configUnchanged("configureDemod", (modulationType, freq, ifBw, audioLowPassFreq, audioHighPassFreq, fmDeemphasis)):
+			return
 
+		self.configGeneration += 1
 		err = self.dll.bbConfigureDemod(self.deviceHandle, modulationType, freq, ifBw, audioLowPassFreq, audioHighPassFreq, fmDeemphasis)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to configureDemod succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		else:
-			raise IOError("Unknown error setting configureDemod! Error = %s" % err)
+		self.checkStatus(err, "configureDemod")
+		self._appliedConfig["configureDemod"] = (modulationType, freq, ifBw, audioLowPassFreq, audioHighPassFreq, fmDeemphasis)
+		self.log.info("Call to configureDemod succeeded.")
 
 	def initiate(self, mode, flag, gps_timestamp=False):
 		'''
@@ -1255,6 +1483,8 @@ class SignalHound(object):
 		Raw Call: ``BB_API bbStatus bbInitiate(int device, unsigned int mode, unsigned int flag);``
 		'''
 
+		initiateArgs = (mode, flag, gps_timestamp)
+
 		self.acq_conf["acq_mode"] = mode
 		self.acq_conf["acq_flag"] = flag
 
@@ -1326,37 +1556,71 @@ class SignalHound(object):
 			self.log.info("Timestamping returned data with GPS time")
 			flag |= hf.BB_TIME_STAMP
 
-		mode = ct.c_uint(mode)
-		flag = ct.c_uint(flag)
+		self.stopBackgroundAcquisition()
 
+		self.configGeneration += 1
 		err = self.dll.bbInitiate(self.deviceHandle, mode, flag)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to initiate succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbInvalidParameterErr"]:
+		if err == hf.bbInvalidParameterErr:
 			self.log.error("bbInvalidParameterErr!")
 			self.log.error('''In real-time mode, this value may be returned if the span limits defined in the API header are broken. Also in real-time mode, this error will be
 				returned if the resolution bandwidth is outside the limits defined in the API header.''')
 			self.log.error('''In time-gate analysis mode this error will be returned if span limits defined in the API header are broken. Also in time gate analysis, this
 				error is returned if the bandwidth provided require more samples for processing than is allowed in the gate length. To fix this, increase rbw/vbw.''')
-			raise IOError("The value for mode did not match any known value.")
-		elif err == self.bbStatus["bbAllocationLimitError"]:
+		elif err == hf.bbAllocationLimitErr:
 			self.log.error('''This value is returned in extreme circumstances. The API currently limits the amount of RAM usage to 1GB. When exceptional parameters are
 				provided, such as very low bandwidths, or long sweep times, this error may be returned. At this point you have reached the boundaries of the
 				device. The processing algorithms are optimized for speed at the expense of space, which is the reason this can occur.''')
-			raise IOError("Could not allocate sufficent RAM!")
 
-		elif err == self.bbStatus["bbBandwidthErr"]:
-			raise IOError("RBW is larger than your span. (Sweep Mode)!")
-		else:
-			raise IOError("Unknown error setting initiate! Error = %s" % err)
+		self.checkStatus(err, "initiate", {
+				hf.bbInvalidParameterErr : "The value for mode did not match any known value.",
+				hf.bbBandwidthErr        : "RBW is larger than your span. (Sweep Mode)!"
+			})
+		self._initiated = initiateArgs
+		self.log.info("Call to initiate succeeded.")
+
+	def retune(self, center, span=None):
+		'''
+		Args:
+			center (float): New center frequency in hertz.
+			span (float): New span in hertz. Defaults to the current span.
+
+		Fast path for moving a running acquisition to a new frequency: only ``configureCenterSpan()`` is
+		(re)issued, followed by ``initiate()`` with the same arguments as last time. Every other configure call
+		is left as it is, and the device isn't aborted first (``bbInitiate`` stops the running mode itself).
+		If the frequency hasn't changed, nothing is sent to the device at all.
+
+		The time each retune takes is recorded in ``retuneLatency`` (a ``metrics.LatencyHistogram``).
+
+		The device must have been initiated, and not aborted since. If the frequency changes, a background
+		acquisition is stopped, as for ``initiate()``. Otherwise it's left running.
+		'''
+
+		if self._initiated is None:
+			raise DeviceNotConfiguredError("retune() requires a running acquisition. Call initiate() first!", hf.bbDeviceNotConfiguredErr, "retune")
+
+		if span is None:
+			span = self.acq_conf["span_freq"]
+
+		# Checked before anything else, so a background acquisition isn't stopped for nothing.
+		if self._configUnchanged("configureCenterSpan", (center, span)):
+			return
+
+		start = time.time()
 
-	def fetchTrace(self):
+		# The fetch thread can't be calling into the device while it's reconfigured.
+		self.stopBackgroundAcquisition()
+
+		self.configureCenterSpan(center, span)
+		self.initiate(*self._initiated)
+
+		self.retuneLatency.add(time.time() - start)
+
+	def fetchTrace(self, copy=False):
 		'''
 		Args:
-			None
+			copy (bool): If ``True``, return freshly allocated arrays that are safe to hold onto
+				across calls. Defaults to ``False``.
 
 		Returns:
 			dictionary containing the ``min`` and ``max`` arrays with eponymous keys.
@@ -1365,37 +1629,83 @@ class SignalHound(object):
 		detectorType provided in bbConfigureAcquisition is BB_AVERAGE, the arrays will contain identical
 		values. Element zero of each array corresponds to the startFreq returned from bbQueryTraceInfo.
 
+		By default, the trace is written directly into a pair of numpy arrays owned by this class, which are
+		only reallocated when the trace size changes. The returned arrays are therefore only valid until the
+		next call to ``fetchTrace()``. If you need to keep the data around, either pass ``copy=True``, or
+		use ``fetchTraceInto()`` with your own buffers.
+
 		Raw Call: ``BB_API bbStatus bbFetchTrace(int device, int arraySize, double *min, double *max);``
 		'''
 
-		try:
-			arraySize = self.traceLen
-		except AttributeError:
-			self.log.error("You must call queryTraceInfo atleast once before fetchTrace")
-			raise
+		arraySize = self.queryTraceInfo()["arr-size"]
 
-		maxArr = (ct.c_double * arraySize)()
-		minArr = (ct.c_double * arraySize)()
+		if copy:
+			minArr = np.empty(arraySize, dtype=np.double)
+			maxArr = np.empty(arraySize, dtype=np.double)
+			self.fetchTraceInto(minArr, maxArr)
+			return {
+				"max" : maxArr,
+				"min" : minArr
+			}
 
-		maxPtr = ct.pointer(maxArr)
-		minPtr = ct.pointer(minArr)
+		if self._traceBuf is None or self._traceBuf["max"].shape[0] != arraySize:
+			self._traceBuf = {
+				"max" : np.empty(arraySize, dtype=np.double),
+				"min" : np.empty(arraySize, dtype=np.double)
+			}
 
-		err = self.dll.bbFetchTrace(self.deviceHandle, arraySize, minPtr, maxPtr)
+		self.fetchTraceInto(self._traceBuf["min"], self._traceBuf["max"])
 
-		if err == self.bbStatus["bbNoError"]:
-			# self.log.info("Call to fetchTrace succeeded.")  # Commented out because it was NOISY
+		return self._traceBuf
 
+	def fetchTraceInto(self, minOut, maxOut):
+		'''
+		Args:
+			minOut (numpy array): Destination for the ``min`` trace.
+			maxOut (numpy array): Destination for the ``max`` trace.
+
+		Returns:
+			The ``bbStatus`` of the fetch: ``bbNoError``, or a warning (e.g. ``bbADCOverflow``) that was logged.
+
+		Fetch a trace directly into caller-supplied memory. Both arrays must be 1-dimensional, C-contiguous,
+		writable ``np.double`` arrays at least ``traceLen`` items long (see ``queryTraceInfo()``). Only the
+		first ``traceLen`` items are written. The arrays may be the same object if you only care about one of
+		the traces (e.g. when using the "average" detector).
+
+		No memory is allocated or copied on the python side, so this is the fastest way to pull traces out of
+		the hardware when you already have somewhere to put them (rows of a preallocated 2D array, for instance).
+
+		Will raise ``ValueError`` if the buffers are unsuitable.
+
+		Raw Call: ``BB_API bbStatus bbFetchTrace(int device, int arraySize, double *min, double *max);``
+		'''
+
+		# Cached unless the device has been reconfigured, in which case the trace size may have changed.
+		arraySize = self.queryTraceInfo()["arr-size"]
+
+		for arr in (minOut, maxOut):
+			if not isinstance(arr, np.ndarray) or arr.dtype != np.double or arr.ndim != 1:
+				raise ValueError("fetchTraceInto requires 1-dimensional numpy arrays of dtype np.double!")
+			if not arr.flags.c_contiguous or not arr.flags.writeable:
+				raise ValueError("fetchTraceInto requires C-contiguous, writable arrays!")
+			if arr.shape[0] < arraySize:
+				raise ValueError("Output array is too small. Array size = %s, trace size = %s" % (arr.shape[0], arraySize))
+
+		err = self.dll.bbFetchTrace(self.deviceHandle, arraySize, minOut.ctypes.data, maxOut.ctypes.data)
+
+		# Hot path. A single truth test for the (overwhelmingly common) success case.
+		if not err:
 			self.sequentialADCErrors = 0  # There was no clipping, so reset the clipping integrator
-			pass
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		elif err == self.bbStatus["bbBufferTooSmallErr"]:
-			raise IOError("The 'arraySize' parameter passed is less than the trace size returned from 'bbQueryTraceInfo'.")
-		elif err == self.bbStatus["bbADCOverflow"]:
+			return err
+
+		return self._fetchTraceStatus(err)
+
+	def _fetchTraceStatus(self, err):
+		'''
+		Handle a non-zero return from ``bbFetchTrace``. Returns ``err`` if it's a warning, raises otherwise.
+		'''
+
+		if err == hf.bbADCOverflow:
 			self.log.warning("Clipping is common on the first acquitition cycle, presumably due to the IF stages settling.")
 			self.log.warning("This error is only a problem if it occurs more then once and not at the immediate start of an acquisition, or immediately following a recalibration.")
 			self.sequentialADCErrors += 1
@@ -1403,33 +1713,112 @@ class SignalHound(object):
 			# Only throw an actual error if we've been clipping for a while.
 			# This way, transients won't break things (as fast, in any event).
 			if self.sequentialADCErrors > 10:
-				raise IOError("The ADC has detected clipping of the input signal for more then 10 sequential samples!")
-
-		elif err == self.bbStatus["bbNoTriggerFound"]:
-			raise IOError('''In time-gated analysis, if the spectrum returned is not representative of
-				the gate specified, this warning is returned.
-				In zero-span analysis, if the device is configured to anticipate a video or
-				external trigger, this warning is returned when the trigger condition has
-				not been met for this trace.''')
-		elif err == self.bbStatus["bbPacketFramingErr"]:
-			raise IOError("Data loss or miscommunication has occurred between the device and the API!")
-		elif err == self.bbStatus["bbDeviceConnectionErr"]:
-			raise IOError("Device connection issues were present in the acquisition of this sweep!")
-		else:
-			raise IOError("Unknown error setting fetchTrace! Error = %s" % err)
+				raise ADCOverflowError("The ADC has detected clipping of the input signal for more then 10 sequential samples!", err, "fetchTrace")
+			return err
 
+		return self.checkStatus(err, "fetchTrace")
 
-		maxData = SignalHound.fastDecodeArray(maxArr, arraySize, np.double)
-		minData = SignalHound.fastDecodeArray(minArr, arraySize, np.double)
+	def fetchTraces(self, n, dtype=np.double, block=None, withMin=False):
+		'''
+		Args:
+			n (int): Number of traces to fetch.
+			dtype: ``np.double`` or ``np.float32``. Storage type for the block. Ignored if ``block`` is passed.
+			block (TraceBlock): Optional block to fetch into, so repeated calls don't allocate. Must have room
+				for ``n`` traces of the current trace length.
+			withMin (bool): Also keep the ``min`` traces. Ignored if ``block`` is passed.
 
-		ret = {
-			"max" : maxData,
-			"min" : minData
-		}
+		Returns:
+			A ``buffers.TraceBlock``, with the traces stacked in ``block.max`` (and ``block.min``), a per-row
+			``timestamps`` array, and the number of ADC-overflow warnings in ``adcOverflows``.
+
+		Fetch ``n`` traces in one go, so things like averaging can be done as a single vectorized reduction
+		(``block.rows.mean(axis=0)``) rather than accumulating in python. Each trace is fetched straight into
+		its row of the block, with no per-trace allocation.
 
+		ADC overflow is handled as in ``fetchTrace()``, so persistent clipping still raises. If anything else
+		raises partway through, ``block.count`` says how many rows were filled.
+		'''
 
+		traceInfo = self.queryTraceInfo()
+		traceLen = traceInfo["arr-size"]
 
-		return ret
+		if block is None:
+			block = TraceBlock(n, traceLen, dtype=dtype, withMin=withMin)
+		elif block.traceLen != traceLen or block.numTraces < n:
+			raise ValueError("TraceBlock is the wrong size. Block = %s x %s, required = %s x %s" % (block.numTraces, block.traceLen, n, traceLen))
+
+		block.reset(traceInfo)
+
+		fetch = self.dll.bbFetchTrace
+		handle = self.deviceHandle
+		for row in range(n):
+			err = fetch(handle, traceLen, block.minAddrs[row], block.maxAddrs[row])
+			block.timestamps[row] = time.time()
+
+			if not err:
+				self.sequentialADCErrors = 0
+			elif self._fetchTraceStatus(err) == hf.bbADCOverflow:
+				block.adcOverflows += 1
+
+			block.store(row)
+			block.count = row + 1
+
+		return block
+
+	def startBackgroundAcquisition(self, numBuffers=2, dropWhenFull=False, withMin=False, metrics=None):
+		'''
+		Args:
+			numBuffers (int): Number of trace buffers the thread alternates between. Defaults to 2.
+			dropWhenFull (bool): If every buffer is still held by the consumer, keep fetching and discard the
+				traces, rather than waiting. Defaults to ``False``.
+			withMin (bool): Keep the ``min`` traces as well as the ``max`` ones. Each trace is then a
+				``(2, traceLen)`` array of the two. Defaults to ``False``.
+			metrics (metrics.AcquisitionMetrics): Optional counters to record the time spent fetching in, as well
+				as the thread's own ``stats()``.
+
+		Returns:
+			The running ``background.BackgroundAcquisition`` (also available as ``self.backgroundAcq``).
+
+		Fetch traces continuously in a separate thread, so the USB transfer of the next trace overlaps with
+		whatever the caller is doing with the last one. The DLL call releases the GIL, so this works with plain
+		python threads. Consume the traces from the calling thread:
+
+			>>> acq = sh.startBackgroundAcquisition()
+			>>> for trace, timestamp in acq.traces(timeout=1):
+			...     process(trace)
+			>>> sh.stopBackgroundAcquisition()["duty-cycle"]
+
+		The device must already be configured and initiated in a trace mode ("sweeping", "real-time", etc).
+		Don't reconfigure the device while the thread is running. ``initiate()``, ``abort()``, ``selfCal()``
+		and ``closeDevice()`` stop it first.
+		'''
+
+		self.stopBackgroundAcquisition()
+
+		self.backgroundAcq = BackgroundAcquisition(self, numBuffers, dropWhenFull, withMin, metrics)
+		self.backgroundAcq.start()
+		self.log.info("Started background acquisition with %s buffers.", numBuffers)
+
+		return self.backgroundAcq
+
+	def stopBackgroundAcquisition(self):
+		'''
+		Returns:
+			The final ``stats()`` of the background acquisition, or ``None`` if it wasn't running.
+
+		Stop the thread started by ``startBackgroundAcquisition()``, after the fetch in progress completes.
+		'''
+
+		acq = self.backgroundAcq
+		if acq is None:
+			return None
+
+		self.backgroundAcq = None
+		acq.stop()
+
+		stats = acq.stats()
+		self.log.info("Stopped background acquisition. %s traces, %s dropped, duty cycle %0.1f%%.", stats["traces"], stats["dropped"], stats["duty-cycle"] * 100)
+		return stats
 
 	def fetchAudio(self):
 		'''
@@ -1447,22 +1836,11 @@ class SignalHound(object):
 
 		arraySize = 4096
 		audioArr = (ct.c_float * arraySize)()
-		audioArrPtr = ct.pointer(audioArr)
-
-		err = self.dll.bbFetchAudio(self.deviceHandle, audioArrPtr)
-
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to fetchAudio succeeded.")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		elif err == self.bbStatus["bbDeviceConnectionErr"]:
-			raise IOError("Device connection issues were present in the acquisition of this sweep!")
-		else:
-			raise IOError("Unknown error setting fetchAudio! Error = %s" % err)
+
+		err = self.dll.bbFetchAudio(self.deviceHandle, audioArr)
+
+		self.checkStatus(err, "fetchAudio")
+		self.log.info("Call to fetchAudio succeeded.")
 
 		arr = np.ctypeslib.as_array(audioArr)  # Map numpy array onto the same memory location as audioArr
 
@@ -1520,26 +1898,14 @@ class SignalHound(object):
 
 		arraySize = 2048
 		corrArr = (ct.c_float * arraySize)()
-		corrArrPtr = ct.pointer(corrArr)
 
 		index = ct.c_int(0)
 		startFreq = ct.c_double(0)
 
-		indexPtr = ct.pointer(index)
-		startFreqPtr = ct.pointer(startFreq)
-
-		err = self.dll.bbFetchRawCorrections(self.deviceHandle, corrArrPtr, indexPtr, startFreqPtr)
+		err = self.dll.bbFetchRawCorrections(self.deviceHandle, corrArr, ct.byref(index), ct.byref(startFreq))
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to fetchRawCorrections succeeded.")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		else:
-			raise IOError("Unknown error setting fetchRawCorrections! Error = %s" % err)
+		self.checkStatus(err, "fetchRawCorrections")
+		self.log.info("Call to fetchRawCorrections succeeded.")
 
 		ret = {
 			"data" : np.ctypeslib.as_array(corrArr),
@@ -1549,6 +1915,75 @@ class SignalHound(object):
 
 		return ret
 
+	def fetchRaw(self, copy=False, timestamp=True):
+		'''
+		Args:
+			copy (bool): If ``True``, return copies of the data, rather than views into the IQ ring.
+			timestamp (bool): Query the timestamp of the block (``bbQueryTimestamp``) after fetching it.
+
+		Returns:
+			| ``dict`` containing:
+			|	"data":          complex64 array of ``return_len`` IQ samples.
+			|	"triggers":      int32 array of trigger positions (indices into "data"). Zero terminated.
+			|	"sample-index":  Index of the first sample in "data", counting the samples delivered since the stream
+			|	                 started. Samples the API drops (if the fetch loop falls behind) aren't counted, but
+			|	                 show up as a jump in "timestamp".
+			|	"timestamp":     ``(seconds, nanoseconds)`` tuple from ``queryTimestamp()``, or ``None``.
+
+		Fetch the next block of samples from a device initiated in "streaming" mode. The API blocks until
+		``return_len`` samples are available (see ``queryStreamInfo()``), so calling this in a loop at least
+		``samples_per_sec / return_len`` times a second is required to keep up with the stream.
+
+		The samples are fetched directly into a preallocated ring of ``iqRingBlocks`` complex64 blocks
+		(``self.iqRing``), so there is no per-block allocation. Unless ``copy`` is set, the returned arrays are
+		views into the ring, and are overwritten ``iqRingBlocks`` calls later. The ring is (re)allocated if the
+		stream block size changes, and the sample index restarts whenever the device is reconfigured.
+
+		Raw Call: ``BB_API bbStatus bbFetchRaw(int device, float *buffer, int *triggers);``
+		'''
+
+		blockLen = self.queryStreamInfo()["return_len"]
+
+		ring = self.iqRing
+		if ring is None or ring.blockLen != blockLen:
+			ring = self.iqRing = IQRing(self.iqRingBlocks, blockLen, self._rawSweepTriggerArraySize)
+
+		if self._iqGeneration != self.configGeneration:
+			self._iqSampleIndex = 0
+			self._iqGeneration = self.configGeneration
+
+		slot = ring.claim()
+
+		err = self.dll.bbFetchRaw(self.deviceHandle, ring.dataAddrs[slot], ring.triggerAddrs[slot])
+		if err:
+			self.checkStatus(err, "fetchRaw")
+
+		ring.sampleIndex[slot] = self._iqSampleIndex
+		self._iqSampleIndex += blockLen
+
+		ts = None
+		if timestamp:
+			# Called directly rather than through queryTimestamp(), which logs every call.
+			err = self.dll.bbQueryTimestamp(self.deviceHandle, ct.byref(self._tsSeconds), ct.byref(self._tsNanoseconds))
+			if err:
+				self.checkStatus(err, "fetchRaw")
+			ts = (self._tsSeconds.value, self._tsNanoseconds.value)
+			ring.timestampNs[slot] = ts[0] * 1000000000 + ts[1]
+		else:
+			ring.timestampNs[slot] = 0
+
+		ret = {
+			"data"         : ring.data[slot],
+			"triggers"     : ring.triggers[slot],
+			"sample-index" : int(ring.sampleIndex[slot]),
+			"timestamp"    : ts
+		}
+		if copy:
+			ret["data"] = ret["data"].copy()
+			ret["triggers"] = ret["triggers"].copy()
+
+		return ret
+
 
 	@classmethod
 	def getRawSweep_size(cls):
@@ -1589,27 +2024,12 @@ class SignalHound(object):
 
 
 		rawBuf = (ct.c_short * bufLen)()
-		rawBufPtr = ct.pointer(rawBuf)
-
-		err = self.dll.bbFetchRawSweep(self.deviceHandle, rawBufPtr)
-
-		if err == self.bbStatus["bbNoError"]:
-			pass  # No print statements here. Too noisy
-
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		elif err == self.bbStatus["bbADCOverflow"]:
-			raise IOError("The ADC has detected clipping of the input signal!")
-		elif err == self.bbStatus["bbPacketFramingErr"]:
-			raise IOError("Data loss or miscommunication has occurred between the device and the API!")
-		elif err == self.bbStatus["bbDeviceConnectionErr"]:
-			raise IOError("Device connection issues were present in the acquisition of this sweep!")
-		else:
-			raise IOError("Unknown error setting fetchRawSweep! Error = %s" % err)
+
+		err = self.dll.bbFetchRawSweep(self.deviceHandle, rawBuf)
+
+		# No log statements on success here. Too noisy
+		if err:
+			self.checkStatus(err, "fetchRawSweep", strict=True)
 
 
 		data = SignalHound.fastDecodeArray(rawBuf, bufLen, np.short)
@@ -1633,7 +2053,8 @@ class SignalHound(object):
 
 		To properly decode the passed parameters, you should use the ``SignalHound.decodeRawSweep`` staticmethod.
 		This takes the two ctypes arguments in the order they are passed to the callback function, and returns
-		a python numpy array.
+		a python numpy array. ``startRawSweepCapture()`` wraps all of this up, and captures the sweeps into a
+		preallocated ring without any per-sweep allocation.
 
 		The data buffer will not be overwritten when in the function body of sweep_callback. The API will
 		maintain a circular list of buffers to store sweeps in. The API will store up to ¼ to ½ seconds worth of
@@ -1660,25 +2081,55 @@ class SignalHound(object):
 		if not callable(callbackFunc):
 			raise ValueError("You must pass a callable variable for the callback!")
 
-		callBackFactory = ct.WINFUNCTYPE(None, ct.POINTER(ct.c_short), ct.c_int)
+		callBackFactory = CALLBACK_FUNCTYPE(None, ct.POINTER(ct.c_short), ct.c_int)
 		self.cRawSweepCallbackFunc = callBackFactory(callbackFunc)
 
 		err = self.dll.bbStartRawSweepLoop(self.deviceHandle, self.cRawSweepCallbackFunc)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Started raw sweep loop.")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		else:
-			raise IOError("Unknown error in startRawSweepLoop!")
+		self.checkStatus(err, "startRawSweepLoop")
+		self.log.info("Started raw sweep loop.")
+
+	def startRawSweepCapture(self, numSlots=None):
+		'''
+		Args:
+			numSlots (int): Number of sweeps the capture ring holds. Defaults to ``sweepRingSlots``.
+
+		Returns:
+			The ``buffers.SweepRing`` the sweeps are captured into (also available as ``self.sweepRing``).
 
+		Start the raw sweep loop (see ``startRawSweepLoop()``) with a built-in callback that just copies each
+		sweep into a preallocated ring, rather than calling into user code from the API's callback thread.
+		Consume the sweeps from another thread:
 
-	def queryTraceInfo(self):
+			>>> ring = sh.startRawSweepCapture()
+			>>> for sweep, timestamp in ring.sweeps(timeout=1):
+			...     process(sweep)
+
+		Sweeps arriving while the ring is full are dropped and counted in ``ring.dropped``. ``abort()``
+		closes the ring, which ends the iteration once the remaining sweeps are consumed.
+
+		The device must be configured with ``configureRawSweep()`` and initiated in "raw-sweep-loop" mode first.
+		'''
+
+		try:
+			sweepLen = 18688 * self.acq_conf["ppf"] * self.acq_conf["steps"]
+		except KeyError:
+			raise ValueError("You must call configureRawSweep before startRawSweepCapture")
+
+		if self.sweepRing:
+			self.sweepRing.close()
+
+		self.sweepRing = SweepRing(numSlots or self.sweepRingSlots, sweepLen)
+		self.startRawSweepLoop(self.sweepRing.push)
+
+		return self.sweepRing
+
+
+	def queryTraceInfo(self, refresh=False):
 		'''
+		Args:
+			refresh (bool): Force a query of the hardware, even if the cached values are current.
+
 		Returns:
 			| ``dict`` containing:
 			|	"arr-size": The size of arrays returned by bbFetchTrace.
@@ -1695,38 +2146,33 @@ class SignalHound(object):
 
 		Note: Calling while in BB_RAW_PIPE mode will produce a bbDeviceNotConfiguredErr
 
+		The trace characteristics can only change when the device is reconfigured, so the result is cached,
+		and only re-queried from the hardware after a ``configure*()``, ``initiate()``, ``abort()``, etc call (each of
+		which bumps ``configGeneration``). The same dictionary is returned until then, so don't modify it.
+
 		Raw Call: ``BB_API bbStatus bbQueryTraceInfo(int device, unsigned int *traceLen, double *binSize, double *start);``
 		'''
 
+		if not refresh and self._traceInfoGeneration == self.configGeneration:
+			return self._traceInfo
+
 		# self.log.info("Querying device for trace information.")
 
 		traceLen = ct.c_uint(0)
-		traceLenPnt = ct.pointer(traceLen)
-
 		binSize = ct.c_double(0)
-		binSizePnt = ct.pointer(binSize)
-
 		start = ct.c_double(0)
-		startPnt = ct.pointer(start)
 
+		err = self.dll.bbQueryTraceInfo(self.deviceHandle, ct.byref(traceLen), ct.byref(binSize), ct.byref(start))
 
-		err = self.dll.bbQueryTraceInfo(self.deviceHandle, traceLenPnt, binSizePnt, startPnt)
-
-		if err == self.bbStatus["bbNoError"]:
-			# self.log.info("returned queryTraceInfo: %d, %f, %f" % (traceLen.value, binSize.value, start.value))
-			pass
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured, or in \"raw-pipe\" mode!")
-		else:
-			raise IOError("Unknown error in queryTraceInfo!")
+		self.checkStatus(err, "queryTraceInfo", {hf.bbDeviceNotConfiguredErr : "Device not Configured, or in \"raw-pipe\" mode!"})
+		# self.log.info("returned queryTraceInfo: %d, %f, %f" % (traceLen.value, binSize.value, start.value))
 
 		self.traceLen = traceLen.value
 
-		return {"arr-size" : traceLen.value, "arr-bin-size" : binSize.value, "ret-start-freq" : start.value}
+		self._traceInfo = {"arr-size" : traceLen.value, "arr-bin-size" : binSize.value, "ret-start-freq" : start.value}
+		self._traceInfoGeneration = self.configGeneration
+
+		return self._traceInfo
 
 	def queryStreamingCenter(self):
 		'''
@@ -1744,21 +2190,11 @@ class SignalHound(object):
 		self.log.info("Querying device for streaming center-freqency.")
 
 		center = ct.c_double(0)
-		centerPnt = ct.pointer(center)
-
 
-		err = self.dll.bbQueryStreamingCenter(self.deviceHandle, centerPnt)
+		err = self.dll.bbQueryStreamingCenter(self.deviceHandle, ct.byref(center))
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("returned streaming center-frequency: %f" % (center.value))
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		else:
-			raise IOError("Unknown error in queryStreamingCenter!")
+		self.checkStatus(err, "queryStreamingCenter")
+		self.log.info("returned streaming center-frequency: %f" % (center.value))
 
 		return center.value
 
@@ -1785,21 +2221,10 @@ class SignalHound(object):
 		seconds = ct.c_uint(0)
 		nanoseconds = ct.c_uint(0)
 
-		secondsPnt = ct.pointer(seconds)
-		nanosecondsPnt = ct.pointer(nanoseconds)
+		err = self.dll.bbQueryTimestamp(self.deviceHandle, ct.byref(seconds), ct.byref(nanoseconds))
 
-		err = self.dll.bbQueryTimestamp(self.deviceHandle, secondsPnt, nanosecondsPnt)
-
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("returned timestamp values: Seconds - %d, nanoseconds - %d" % (seconds.value, nanoseconds.value))
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device not Configured!")
-		else:
-			raise IOError("Unknown error in queryTimestamp!")
+		self.checkStatus(err, "queryTimestamp")
+		self.log.info("returned timestamp values: Seconds - %d, nanoseconds - %d" % (seconds.value, nanoseconds.value))
 
 		return (seconds.value, nanoseconds.value)
 
@@ -1817,16 +2242,18 @@ class SignalHound(object):
 
 		self.log.info("Stopping acquisition")
 
+		self.stopBackgroundAcquisition()
+
+		self._initiated = None
+		self.configGeneration += 1
 		err = self.dll.bbAbort(self.deviceHandle)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to abort succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbDeviceNotConfiguredErr"]:
-			raise IOError("Device was already idle! Did you call abort without ever calling initiate()?")
-		else:
-			raise IOError("Unknown error setting abort! Error = %s" % err)
+		# The raw sweep loop has stopped, so let any capture consumer finish up.
+		if self.sweepRing:
+			self.sweepRing.close()
+
+		self.checkStatus(err, "abort", {hf.bbDeviceNotConfiguredErr : "Device was already idle! Did you call abort without ever calling initiate()?"})
+		self.log.info("Call to abort succeeded.")
 
 
 	def preset(self):
@@ -1850,14 +2277,13 @@ class SignalHound(object):
 		self.log.warning("Performing hardware-reset of device!")
 		self.log.warning("Please ensure you close the device handle within two seconds of this call!")
 
+		self._appliedConfig.clear()
+		self._initiated = None
+		self.configGeneration += 1
 		err = self.dll.bbPreset(self.deviceHandle)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to preset succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		else:
-			raise IOError("Unknown error calling preset! Error = %s" % err)
+		self.checkStatus(err, "preset")
+		self.log.info("Call to preset succeeded.")
 
 	def selfCal(self):
 		'''
@@ -1887,14 +2313,115 @@ class SignalHound(object):
 
 		self.log.info("Performing self-calibration of device.")
 
+		self.stopBackgroundAcquisition()
+
+		# The device comes back from a self-cal in its default state.
+		self._appliedConfig.clear()
+		self._initiated = None
+		self.configGeneration += 1
 		err = self.dll.bbSelfCal(self.deviceHandle)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to selfCal succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		else:
-			raise IOError("Unknown error calling selfCal! Error = %s" % err)
+		self.checkStatus(err, "selfCal")
+		self.log.info("Call to selfCal succeeded.")
+
+	#: The configure calls recalibrate() restores, in the order it restores them in. The arguments each was last
+	#: applied with (in ``_appliedConfig``) are already converted, and in the order of the raw call's.
+	_recalConfigCalls = (
+		"configureAcquisition",
+		"configureCenterSpan",
+		"configureLevel",
+		"configureGain",
+		"configureSweepCoupling",
+		"configureIQ",
+		"configureWindow",
+		"configureProcUnits",
+		"configureTrigger",
+		"configureTimeGate",
+		"configureRawSweep",
+		"configureIO",
+		"configureDemod"
+	)
+
+	def recalibrate(self, center=None, span=None):
+		'''
+		Args:
+			center (float): Center frequency in hertz to restart the acquisition at, as ``retune()`` would.
+				Defaults to the current one.
+			span (float): New span in hertz. Defaults to the current span. Only used with ``center``.
+
+		Returns:
+			``(stopped, restarted)``, the times (as ``time.time()``) the acquisition was stopped for the
+			calibration, and was running again. The device acquired nothing in between.
+
+		Fast path for a temperature recalibration of a running acquisition: ``selfCal()``, then only the
+		configure calls that were in effect before it are reissued, straight to the API with the values they
+		were last applied with, followed by ``initiate()`` with the same arguments as last time. Nothing is
+		converted or validated again, and nothing else is sent to the device.
+
+		The gap each recalibration leaves in the acquisition is recorded in ``recalLatency`` (a
+		``metrics.LatencyHistogram``).
+
+		The device must have been initiated, and not aborted since. A background acquisition is paused for the
+		calibration rather than stopped, and resumed with the same ring, as long as the trace size and bins come
+		out unchanged. The traces already in its ring were acquired before the calibration; drain them first
+		(after a ``pause()``) if that matters. With ``center``, or if the traces did change, it is stopped, as
+		for ``selfCal()``, and isn't restarted.
+		'''
+
+		if self._initiated is None:
+			raise DeviceNotConfiguredError("recalibrate() requires a running acquisition. Call initiate() first!", hf.bbDeviceNotConfiguredErr, "recalibrate")
+
+		initiated = self._initiated
+		applied = [(callName, self._appliedConfig[callName]) for callName in self._recalConfigCalls if callName in self._appliedConfig]
+
+		# Hidden from selfCal() and initiate() meanwhile, so they don't stop it.
+		fetcher = self.backgroundAcq if center is None else None
+		if fetcher:
+			fetcher.pause()
+			self.backgroundAcq = None
+
+		try:
+			stopped, restarted = self._recalibrate(initiated, applied, center, span)
+			if fetcher and self.queryTraceInfo() != fetcher.traceInfo:
+				self.log.warning("Trace layout changed by the calibration. Stopping the background acquisition.")
+				self.backgroundAcq = fetcher
+				self.stopBackgroundAcquisition()
+				fetcher = None
+		except Exception:
+			if fetcher:
+				self.backgroundAcq = fetcher
+				self.stopBackgroundAcquisition()
+			raise
+
+		if fetcher:
+			self.backgroundAcq = fetcher
+			fetcher.resume()
+
+		self.recalLatency.add(restarted - stopped)
+		self.log.info("Recalibrated. Acquisition was stopped for %0.3f seconds.", restarted - stopped)
+		return stopped, restarted
+
+	def _recalibrate(self, initiated, applied, center, span):
+		'''
+		The device side of ``recalibrate()``: ``selfCal()``, the optional retune, the ``applied`` configure calls
+		and ``initiate()``. Returns the same ``(stopped, restarted)`` pair.
+		'''
+		stopped = time.time()
+		self.selfCal()
+
+		if center is not None:
+			self.configureCenterSpan(center, self.acq_conf["span_freq"] if span is None else span)
+
+		for callName, args in applied:
+			# Already reissued, with new arguments.
+			if callName in self._appliedConfig:
+				continue
+			err = getattr(self.dll, "bb" + callName[0].upper() + callName[1:])(self.deviceHandle, *args)
+			self.checkStatus(err, callName)
+			self._appliedConfig[callName] = args
+
+		self.initiate(*initiated)
+		return stopped, time.time()
 
 	def syncCPUtoGPS(self, comPort, baudRate):
 		'''
@@ -1921,19 +2448,10 @@ class SignalHound(object):
 
 		self.log.info("Attempting to synchronize CPU with GPS timebase.")
 
-		comPort = ct.c_int(comPort)
-		baudRate = ct.c_int(baudRate)
-
 		err = self.dll.bbSyncCPUtoGPS(comPort, baudRate)
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to syncCPUtoGPS succeeded.")
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbGPSErr"]:
-			raise IOError("Could not connect to GPS!")
-		else:
-			raise IOError("Unknown error synchronizing with GPS! Error = %s" % err)
+		self.checkStatus(err, "syncCPUtoGPS")
+		self.log.info("Call to syncCPUtoGPS succeeded.")
 
 	def getDeviceType(self):
 		'''
@@ -1953,19 +2471,11 @@ class SignalHound(object):
 
 		self.log.info("Querying device for model information")
 
-		devType = ct.c_uint(0)
-		devTypePnt = ct.pointer(devType)
+		devType = ct.c_int(0)
 
-		err = self.dll.bbGetDeviceType(self.deviceHandle, devTypePnt)
+		err = self.dll.bbGetDeviceType(self.deviceHandle, ct.byref(devType))
 
-		if err == self.bbStatus["bbNoError"]:
-			pass
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		else:
-			raise IOError("Unknown error setting getDeviceType! Error = %s" % err)
+		self.checkStatus(err, "getDeviceType")
 
 		if devType.value == hf.BB_DEVICE_NONE:
 			dev = "No device"
@@ -1998,22 +2508,43 @@ class SignalHound(object):
 		self.log.info("Querying device for serial number.")
 
 		serialNo = ct.c_uint(0)
-		serialNoPnt = ct.pointer(serialNo)
-
 
-		err = self.dll.bbGetSerialNumber(self.deviceHandle, serialNoPnt)
+		err = self.dll.bbGetSerialNumber(self.deviceHandle, ct.byref(serialNo))
 
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to getSerialNumber succeeded. Value = %s" % serialNo.value)
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		else:
-			raise IOError("Unknown error setting getSerialNumber! Error = %s" % err)
+		self.checkStatus(err, "getSerialNumber")
+		self.log.info("Call to getSerialNumber succeeded. Value = %s" % serialNo.value)
 
 		return serialNo.value
 
+	def listSerialNumbers(self):
+		'''
+		Returns: List of the serial numbers of this device and every other unopened device, this device first.
+
+		The API has no way to enumerate devices without opening them, so this opens every device it can, reads
+		its serial number, and closes it again. Devices open in other processes aren't listed.
+		'''
+
+		serials = [self.getSerialNumber()]
+
+		handle = ct.c_int(0)
+		handles = []
+		try:
+			while self.dll.bbOpenDevice(ct.byref(handle)) == hf.bbNoError:
+				handles.append(handle.value)
+
+				serialNo = ct.c_uint(0)
+				err = self.dll.bbGetSerialNumber(handle, ct.byref(serialNo))
+				self.checkStatus(err, "getSerialNumber")
+				serials.append(serialNo.value)
+
+				handle = ct.c_int(0)
+		finally:
+			for openHandle in handles:
+				self.dll.bbCloseDevice(openHandle)
+
+		self.log.info("Found devices with serial numbers %s", serials)
+		return serials
+
 	def getFirmwareVersion(self):
 		'''
 		Returns: Device firmware rev as a integer.
@@ -2025,20 +2556,12 @@ class SignalHound(object):
 
 		self.log.info("Querying device for firmware version.")
 
-		firmwareRev = ct.c_uint(0)
-		firmwareRevPnt = ct.pointer(firmwareRev)
+		firmwareRev = ct.c_int(0)
 
+		err = self.dll.bbGetFirmwareVersion(self.deviceHandle, ct.byref(firmwareRev))
 
-		err = self.dll.bbGetFirmwareVersion(self.deviceHandle, firmwareRevPnt)
-
-		if err == self.bbStatus["bbNoError"]:
-			self.log.info("Call to getFirmwareVersion succeeded. Value = %s" % firmwareRev.value)
-		elif err == self.bbStatus["bbDeviceNotOpenErr"]:
-			raise IOError("Device not open!")
-		elif err == self.bbStatus["bbNullPtrErr"]:
-			raise IOError("Null pointer error!")
-		else:
-			raise IOError("Unknown error setting getFirmwareVersion! Error = %s" % err)
+		self.checkStatus(err, "getFirmwareVersion")
+		self.log.info("Call to getFirmwareVersion succeeded. Value = %s" % firmwareRev.value)
 
 		return firmwareRev.value
 
@@ -2063,9 +2586,7 @@ class SignalHound(object):
 
 		self.log.info("Querying API for revision information.")
 
-		self.dll.bbGetAPIVersion.restype = ct.c_char_p  # Tell ctypes this function returns a pointer to a string
-		apiRevStr = self.dll.bbGetAPIVersion(self.deviceHandle)
-		ret = ct.c_char_p(apiRevStr).value 		# Dereference pointer, extract string
+		ret = self.dll.bbGetAPIVersion()  # restype is c_char_p (see bbPrototypes), so this is already a string
 		self.log.info("Device firmware rev = %s" % ret)
 		return ret
 
@@ -2085,12 +2606,7 @@ class SignalHound(object):
 		Raw Call: ``BB_API const char* bbGetErrorString(bbStatus status);``
 		'''
 
-		serialNo = ct.c_int(errCode)
-
-		self.dll.bbGetAPIVersion.restype = ct.c_char_p  # Tell ctypes this function returns a pointer to a string
-		apiRevStr = self.dll.bbGetAPIVersion(self.deviceHandle, serialNo)
-
-		return ct.c_char_p(apiRevStr).value  # Dereference pointer, extract string, return it.
+		return self.dll.bbGetErrorString(errCode)  # restype is c_char_p (see bbPrototypes), so this is already a string
 
 	def getCurrentAcquisitionSettings(self):
 		'''
@@ -2100,7 +2616,7 @@ class SignalHound(object):
 
 		'''
 		try:
-			tmp = self.queryTraceInfo()
+			tmp = dict(self.queryTraceInfo())
 		except IOError:
 			tmp = {}
 
@@ -2132,7 +2648,7 @@ class SignalHound(object):
 		is safe to preserve beyond the scope of a calling function.
 		'''
 		bufAdr = ct.addressof(bufPtr.contents)
-		arr = np.frombuffer(int_asbuffer(bufAdr, bufLen * np.short().nbytes), dtype=np.short)  # Map array memory as a numpy array.
+		arr = np.ctypeslib.as_array((ct.c_short * bufLen).from_address(bufAdr))  # Map array memory as a numpy array.
 		arr = arr.copy()  # Then copy it, so our array won't get modified when the circular buffer overwrites itself.
 		# We have to copy() since the call normally just returns a array that is overlaid onto the pre-existing data
 		return arr
@@ -2158,8 +2674,7 @@ class SignalHound(object):
 		management may reuse or free the underlying buffer. Since the copied array will be managed by the python memory manager, it
 		is safe to preserve beyond the scope of a calling function.
 		'''
-		bufAdr = ct.addressof(ctBuff)
-		arr = np.frombuffer(int_asbuffer(bufAdr, buffLen * dtype().nbytes), dtype=dtype)  # Map array memory as a numpy array.
+		arr = np.frombuffer(ctBuff, dtype=dtype, count=buffLen)  # Map array memory as a numpy array.
 		arr = arr.copy()  # Then copy it, so our array won't get modified when the circular buffer overwrites itself.
 		# We have to copy() since the call normally just returns a array that is overlaid onto the pre-existing data
 		return arr
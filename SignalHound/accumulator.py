@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+
+# Per-bin statistics over a run of traces, computed in a single pass.
+#
+# The acquisition loops integrate a few thousand traces into each logged row. Rather than keeping just a running
+# sum, TraceAccumulator tracks everything the logger might want to persist as the traces arrive, in preallocated
+# buffers updated in place, so no statistic needs the traces kept around or a second pass over them.
+
+import numpy as np
+
+
+class TraceAccumulator(object):
+	'''
+	Running per-bin mean, variance (Welford's algorithm), min-hold and max-hold over a series of traces.
+
+		>>> acc = TraceAccumulator(traceLen, ["mean", "variance", "max-hold"])
+		>>> for trace in traces:
+		...     acc.add(trace["max"], trace["min"])
+		>>> stats = acc.results()
+		>>> acc.reset()
+
+	Only the statistics asked for are tracked. The mean alone is a running sum, which is by far the cheapest;
+	the variance switches it to Welford's update, which costs a few more passes over the trace per ``add()``.
+
+	Every bin sees every trace, so the sample count is the same for all of them, and is kept as the scalar
+	``count``.
+
+	Attributes:
+		size: Trace length the buffers are allocated for.
+		count: Number of traces added since the last ``reset()``.
+	'''
+
+	#: Statistics that can be tracked
+	statistics = ("mean", "variance", "min-hold", "max-hold")
+
+	def __init__(self, size=0, statistics=("mean", )):
+		'''
+		Args:
+			size (int): Trace length. Can also be set later, with ``reset()``.
+			statistics: Names of the statistics to track, from ``TraceAccumulator.statistics``.
+		'''
+		for name in statistics:
+			if name not in self.statistics:
+				raise ValueError("Unknown trace statistic '%s'. Valid statistics are %s." % (name, ", ".join(self.statistics)))
+
+		self.tracked = tuple(statistics)
+		self.welford = "variance" in statistics
+		self.size = None
+		self.reset(size)
+
+	def reset(self, size=None):
+		'''
+		Start a new integration. If ``size`` is given and differs from the current one, reallocate the buffers for
+		traces of that length.
+		'''
+		if size is not None and size != self.size:
+			self.size = size
+			# The running sum, or the running mean when doing Welford's update.
+			self.total = np.empty(size)
+			if self.welford:
+				self.m2 = np.empty(size)
+				self.delta = np.empty(size)
+				self.scratch = np.empty(size)
+			if "min-hold" in self.tracked:
+				self.minHold = np.empty(size)
+			if "max-hold" in self.tracked:
+				self.maxHold = np.empty(size)
+
+		self.count = 0
+		self.total.fill(0)
+		if self.welford:
+			self.m2.fill(0)
+		if "min-hold" in self.tracked:
+			self.minHold.fill(np.inf)
+		if "max-hold" in self.tracked:
+			self.maxHold.fill(-np.inf)
+
+	def add(self, trace, minTrace=None):
+		'''
+		Args:
+			trace (numpy.ndarray): Trace to add. The mean, variance and max-hold are of this.
+			minTrace (numpy.ndarray): Trace to take the min-hold of. Defaults to ``trace``. For the "min-max"
+				detector, pass the ``min`` array here and the ``max`` array as ``trace``.
+		'''
+		self.count += 1
+
+		if self.welford:
+			# mean += (x - mean) / n, m2 += (x - mean_old) * (x - mean_new)
+			np.subtract(trace, self.total, out=self.delta)
+			np.divide(self.delta, self.count, out=self.scratch)
+			self.total += self.scratch
+			np.subtract(trace, self.total, out=self.scratch)
+			self.scratch *= self.delta
+			self.m2 += self.scratch
+		else:
+			self.total += trace
+
+		if "min-hold" in self.tracked:
+			np.minimum(self.minHold, trace if minTrace is None else minTrace, out=self.minHold)
+		if "max-hold" in self.tracked:
+			np.maximum(self.maxHold, trace, out=self.maxHold)
+
+	def results(self, statistics=None):
+		'''
+		Args:
+			statistics: Names of the statistics to return. Defaults to all the tracked ones.
+
+		Returns:
+			dictionary mapping each statistic name to a newly allocated array. The variance is ``NaN`` with fewer
+			than two traces.
+		'''
+		ret = {}
+		for name in statistics if statistics is not None else self.tracked:
+			if name not in self.tracked:
+				raise ValueError("Trace statistic '%s' isn't being tracked. Tracked statistics are %s." % (name, ", ".join(self.tracked)))
+
+			if name == "mean":
+				ret[name] = self.total.copy() if self.welford else self.total / self.count
+			elif name == "variance":
+				ret[name] = self.m2 / (self.count - 1) if self.count > 1 else np.full(self.size, np.nan)
+			elif name == "min-hold":
+				ret[name] = self.minHold.copy()
+			elif name == "max-hold":
+				ret[name] = self.maxHold.copy()
+		return ret
@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+
+# asyncio interface to the SignalHound wrapper.
+#
+# Python 3.7+ only, so the package doesn't import it. Use it with:
+#
+#	from SignalHound.aio import AsyncSignalHound
+#
+# Every call into a device runs on a single worker thread owned by that device. The event loop never blocks on
+# the DLL, calls to one device stay serialized (the API isn't re-entrant per device), and separate devices run
+# in parallel.
+
+import asyncio
+import collections
+import concurrent.futures
+import functools
+import time
+
+from . import SignalHound
+
+
+class AsyncSignalHound(object):
+	'''
+	Awaitable facade over a ``SignalHound``.
+
+	The configure calls, ``initiate()``, the fetches, diagnostics and the other device queries are coroutines with
+	the same arguments as the ``SignalHound`` methods (see ``blockingCalls``). ``traces()`` is an async iterator
+	that keeps a bounded number of fetches in flight ahead of the consumer.
+
+		>>> dev = await AsyncSignalHound.open()
+		>>> await dev.configureCenterSpan(center=150e6, span=20e6)
+		>>> ...
+		>>> await dev.initiate(mode="real-time", flag="ignored")
+		>>> async for trace in dev.traces():
+		...     process(trace["max"])
+		>>> await dev.close()
+
+	The wrapped ``SignalHound`` is available as ``sh``, for reading attributes like ``acq_conf``. Don't call its
+	methods directly from the event loop thread while the facade is in use.
+	'''
+
+	#: ``SignalHound`` methods exposed as coroutines, run on the device's worker thread
+	blockingCalls = (
+		"configureAcquisition",
+		"configureCenterSpan",
+		"configureLevel",
+		"configureGain",
+		"configureSweepCoupling",
+		"configureIQ",
+		"configureWindow",
+		"configureProcUnits",
+		"configureTrigger",
+		"configureTimeGate",
+		"configureRawSweep",
+		"configureIO",
+		"configureDemod",
+		"initiate",
+		"abort",
+		"preset",
+		"selfCal",
+		"fetchTraces",
+		"fetchAudio",
+		"fetchRaw",
+		"queryTraceInfo",
+		"queryStreamInfo",
+		"queryStreamingCenter",
+		"queryTimestamp",
+		"getDeviceDiagnostics",
+		"getDeviceType",
+		"getSerialNumber",
+		"getFirmwareVersion",
+		"getCurrentAcquisitionSettings",
+		"closeDevice",
+	)
+
+	#: Number of fetches ``traces()`` keeps in flight ahead of the consumer
+	traceBufferDepth = 4
+
+	def __init__(self, sh, executor=None):
+		'''
+		Args:
+			sh (SignalHound): An open device.
+			executor: Single-threaded executor to run the device calls on. One is created if not given. Don't share
+				it between devices.
+		'''
+		self.sh = sh
+		if executor is None:
+			executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="SignalHound")
+		self.executor = executor
+
+	@classmethod
+	async def open(cls, dll=None):
+		'''
+		Open a device (see ``SignalHound()``) on a new worker thread, without blocking the event loop.
+		'''
+		executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="SignalHound")
+		try:
+			sh = await asyncio.get_running_loop().run_in_executor(executor, SignalHound, dll)
+		except BaseException:
+			executor.shutdown(wait=False)
+			raise
+		return cls(sh, executor)
+
+	def _submit(self, func, *args, **kwargs):
+		'''
+		Queue ``func(*args, **kwargs)`` on the worker thread. Returns an asyncio future for the result.
+		'''
+		return asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+	async def fetchTrace(self, copy=True):
+		'''
+		Awaitable ``SignalHound.fetchTrace()``.
+
+		Unlike the blocking version, this copies by default, as the persistent buffers could be overwritten by
+		another queued fetch before the caller gets to look at them.
+		'''
+		return await self._submit(self.sh.fetchTrace, copy)
+
+	def _fetchTraceRecord(self):
+		trace = self.sh.fetchTrace(copy=True)
+		trace["timestamp"] = time.time()
+		trace["info"] = self.sh.queryTraceInfo()
+		return trace
+
+	async def traces(self, maxBuffered=None):
+		'''
+		Args:
+			maxBuffered (int): Number of fetches to keep in flight ahead of the consumer. Defaults to
+				``traceBufferDepth``.
+
+		Async iterator over traces from the initiated device. Yields dictionaries with the ``min`` and ``max``
+		arrays (freshly allocated, so they can be kept), the ``timestamp`` at which the fetch completed, and the
+		trace ``info`` (as ``queryTraceInfo()``).
+
+		The worker thread fetches up to ``maxBuffered`` traces ahead of the consumer, so the device keeps
+		acquiring while the loop does other work, and memory stays bounded if the consumer falls behind (the
+		device is then left idle). Fetches that haven't started yet are cancelled when the iterator is closed,
+		so close it explicitly (e.g. ``contextlib.aclosing()``) if you stop iterating early and intend to use
+		the device again.
+		'''
+		depth = maxBuffered or self.traceBufferDepth
+		pending = collections.deque()
+		try:
+			while True:
+				while len(pending) < depth:
+					pending.append(self._submit(self._fetchTraceRecord))
+				yield await pending.popleft()
+		finally:
+			for fut in pending:
+				fut.cancel()
+
+	async def close(self):
+		'''
+		Close the device, and shut down its worker thread.
+		'''
+		try:
+			if self.sh.devOpen:
+				await self._submit(self.sh.closeDevice)
+		finally:
+			self.executor.shutdown(wait=False)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, excType, excValue, tb):
+		await self.close()
+
+
+def _blockingCall(name):
+	async def call(self, *args, **kwargs):
+		return await self._submit(getattr(self.sh, name), *args, **kwargs)
+
+	call.__name__ = name
+	call.__doc__ = "Awaitable ``SignalHound.%s()``, run on the device's worker thread." % name
+	return call
+
+for _name in AsyncSignalHound.blockingCalls:
+	setattr(AsyncSignalHound, _name, _blockingCall(_name))
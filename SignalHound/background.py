@@ -0,0 +1,250 @@
+# -*- coding: UTF-8 -*-
+
+# Background trace acquisition.
+#
+# Runs bbFetchTrace in its own thread, so the device is already acquiring the next trace while the
+# caller is still processing the last one. ctypes releases the GIL for the duration of the DLL call,
+# so python code in other threads keeps running while the fetch blocks on USB.
+
+import logging
+import threading
+import time
+
+import numpy as np
+
+from . import bb_api_h as hf
+from .buffers import SweepRing
+
+
+class BackgroundAcquisition(threading.Thread):
+	'''
+	Thread that fetches traces from an initiated ``SignalHound`` into a small ring of alternating buffers
+	(two, by default, i.e. double buffering), which a consumer drains with ``get()``/``release()`` or
+	``traces()``. Only the ``max`` trace is kept, unless created ``withMin``, in which case each buffer is a
+	``(2, traceLen)`` array of the ``min`` and ``max`` traces, in that order.
+
+	When every buffer is waiting on the consumer, the thread either waits for one to be released (the default,
+	and that wait is device dead time), or with ``dropWhenFull`` keeps fetching into a scratch buffer and
+	counts the dropped traces, which keeps the device busy at the cost of losing data.
+
+	The time spent inside ``bbFetchTrace`` versus total elapsed time is the acquisition duty cycle, reported
+	by ``stats()``, along with the time each side of the ring spent waiting on the other, and the time the
+	consumer held each buffer (between ``get()`` and ``release()``), i.e. its processing time. The fetch times
+	are also added to ``metrics`` (a ``metrics.AcquisitionMetrics``), if one is passed, which outlives the thread.
+
+	Errors raised by the fetch stop the thread, and are re-raised to the consumer once it has drained the
+	traces acquired before the error.
+
+	Don't call into the ``SignalHound`` object from other threads while this is running, other than
+	``stopBackgroundAcquisition()`` (and ``initiate()``, ``abort()``, ``selfCal()`` or ``closeDevice()``,
+	which stop it first). For a quick call that leaves the acquisition as it is (e.g. ``getDeviceDiagnostics()``),
+	``pause()`` the thread instead, which keeps the ring and the traces in it, and ``resume()`` it after.
+	'''
+
+	def __init__(self, sh, numBuffers=2, dropWhenFull=False, withMin=False, metrics=None):
+		threading.Thread.__init__(self, name="SignalHound-fetch")
+		self.daemon = True
+
+		self.log = logging.getLogger("Main.DeviceInt.Background")
+
+		self.sh = sh
+		self.dropWhenFull = dropWhenFull
+
+		# Fixed for the life of the thread. Reconfiguring the device means stopping it and starting a new one.
+		self.traceInfo = sh.queryTraceInfo()
+		self.traceLen = self.traceInfo["arr-size"]
+
+		self.withMin = withMin
+		self.metrics = metrics
+		self.ring = SweepRing(numBuffers, self.traceLen * 2 if withMin else self.traceLen, dtype=np.double)
+
+		# The min trace goes here unless it's being kept, as do the traces that are dropped.
+		self.scratch = np.empty((2, self.traceLen), dtype=np.double)
+		self.scratchMin = self.scratch.ctypes.data
+		self.scratchMax = self.scratch.ctypes.data + self.scratch.strides[0]
+
+		self.stopping = False
+		self.error = None
+
+		# Held by the thread for each fetch, and by pause() until resume().
+		self.deviceLock = threading.Lock()
+		self.paused = False
+
+		self.adcOverflows = 0
+		self.fetchTime = 0.0
+		self.waitTime = 0.0
+		self.idleTime = 0.0
+		self.processTime = 0.0
+		self.heldSince = None
+		self.startTime = None
+		self.stopTime = None
+
+	def run(self):
+		ring = self.ring
+		fetch = self.sh.dll.bbFetchTrace
+		handle = self.sh.deviceHandle
+		traceLen = self.traceLen
+		# Within a withMin buffer, the max trace follows the min trace.
+		maxOffset = traceLen * ring.itemSize if self.withMin else 0
+
+		self.startTime = time.time()
+		try:
+			while not self.stopping:
+				slot = ring.nextSlot()
+				if slot is None:
+					if self.dropWhenFull:
+						ring.dropped += 1
+					else:
+						waitStart = time.time()
+						ring.waitForSlot(0.1)
+						self.waitTime += time.time() - waitStart
+						continue
+
+				if slot is None:
+					minAddr, maxAddr = self.scratchMin, self.scratchMax
+				elif self.withMin:
+					minAddr, maxAddr = ring.slotAddrs[slot], ring.slotAddrs[slot] + maxOffset
+				else:
+					minAddr, maxAddr = self.scratchMin, ring.slotAddrs[slot]
+
+				with self.deviceLock:
+					# Stopped while paused. The device may not be in a state to fetch from any more.
+					if self.stopping:
+						break
+					fetchStart = time.time()
+					err = fetch(handle, traceLen, minAddr, maxAddr)
+					fetchEnd = time.time()
+					self.fetchTime += fetchEnd - fetchStart
+					if self.metrics is not None:
+						self.metrics.add("fetch", fetchEnd - fetchStart)
+
+					if not err:
+						self.sh.sequentialADCErrors = 0
+					elif self.sh._fetchTraceStatus(err) == hf.bbADCOverflow:
+						self.adcOverflows += 1
+
+					# Still under the lock, so once pause() returns, every trace fetched before it is in the ring.
+					if slot is not None:
+						ring.commit(fetchEnd)
+
+		except Exception as e:
+			self.log.error("Background acquisition stopped by error: %s", e)
+			self.error = e
+
+		finally:
+			self.stopTime = time.time()
+			ring.close()
+
+	def stop(self, timeout=None):
+		'''
+		Stop fetching and wait up to ``timeout`` seconds for the fetch in progress to finish. Traces already in
+		the ring can still be consumed.
+		'''
+		self.stopping = True
+		self.ring.close()
+		self.resume()
+		if self.is_alive() and threading.current_thread() is not self:
+			self.join(timeout)
+
+	def pause(self):
+		'''
+		Wait for the fetch in progress to finish, and hold off the next one until ``resume()``, so the caller can
+		use the device. The ring, and the traces in it, are kept.
+		'''
+		if not self.paused:
+			self.deviceLock.acquire()
+			self.paused = True
+
+	def resume(self):
+		'''
+		Let the thread fetch again after a ``pause()``.
+		'''
+		if self.paused:
+			self.paused = False
+			self.deviceLock.release()
+
+	def get(self, timeout=None):
+		'''
+		Wait up to ``timeout`` seconds for the oldest unconsumed trace.
+
+		Returns:
+			``(trace, timestamp)``, where ``trace`` is a view into the ring that stays valid until ``release()``
+			is called, or ``None`` on timeout or once the thread has stopped and the ring is drained. If the
+			thread stopped because of an error, that error is raised instead. With ``withMin``, ``trace`` is the
+			``(2, traceLen)`` min and max pair.
+		'''
+		waitStart = time.time()
+		item = self.ring.get(timeout)
+		self.heldSince = time.time()
+		self.idleTime += self.heldSince - waitStart
+		if item is None:
+			self.heldSince = None
+			if self.error is not None:
+				raise self.error
+			return None
+
+		trace, timestamp = item
+		if self.withMin:
+			trace = trace.reshape(2, self.traceLen)
+		return trace, timestamp
+
+	def release(self):
+		'''
+		Hand the buffer returned by the last ``get()`` back to the acquisition thread.
+		'''
+		if self.heldSince is not None:
+			self.processTime += time.time() - self.heldSince
+			self.heldSince = None
+		self.ring.release()
+
+	def traces(self, timeout=None):
+		'''
+		Iterate over acquired traces, oldest first. Yields ``(trace, timestamp)`` tuples, releasing each
+		buffer when the iterator is advanced.
+		'''
+		while True:
+			item = self.get(timeout)
+			if item is None:
+				return
+			try:
+				yield item
+			finally:
+				self.release()
+
+	__iter__ = traces
+
+	def stats(self):
+		'''
+		Returns:
+			dictionary of acquisition counters:
+				"traces"         : Traces delivered to the ring.
+				"dropped"        : Traces fetched while every buffer was in use (``dropWhenFull`` only).
+				"adc-overflows"  : Fetches that reported ADC clipping.
+				"elapsed"        : Seconds since the thread started.
+				"fetch-time"     : Seconds spent inside ``bbFetchTrace``.
+				"wait-time"      : Seconds spent waiting for the consumer to release a buffer.
+				"process-time"   : Seconds the consumer held buffers, between ``get()`` and ``release()``.
+				"idle-time"      : Seconds the consumer spent in ``get()``, waiting for a trace.
+				"duty-cycle"     : ``fetch-time / elapsed``.
+				"trace-rate"     : Traces fetched per second, including dropped ones.
+				"process-rate"   : Traces the consumer could process per second, at its average processing time.
+		'''
+		if self.startTime is None:
+			elapsed = 0.0
+		else:
+			elapsed = (self.stopTime or time.time()) - self.startTime
+
+		fetched = self.ring.written + self.ring.dropped
+		return {
+			"traces"        : self.ring.written,
+			"dropped"       : self.ring.dropped,
+			"adc-overflows" : self.adcOverflows,
+			"elapsed"       : elapsed,
+			"fetch-time"    : self.fetchTime,
+			"wait-time"     : self.waitTime,
+			"process-time"  : self.processTime,
+			"idle-time"     : self.idleTime,
+			"duty-cycle"    : self.fetchTime / elapsed if elapsed else 0.0,
+			"trace-rate"    : fetched / elapsed if elapsed else 0.0,
+			"process-rate"  : self.ring.read / self.processTime if self.processTime else 0.0
+		}
@@ -0,0 +1,802 @@
+# -*- coding: UTF-8 -*-
+
+# Simulated stand-in for the SignalHound ``bb_api`` shared library.
+#
+# Exposes the same ``bb*`` calls as the real DLL (same arguments, same ``bbStatus`` return codes), so
+# ``SignalHound(dll=SimulatedBBApi())`` exercises everything above the ctypes boundary without any
+# hardware. Setting the ``SIGNALHOUND_SIMULATE`` environment variable does the same for code that
+# just calls ``SignalHound()``.
+#
+# The point of this is benchmarking and profiling the rest of the stack, so the hot calls
+# (``bbFetchTrace``, ``bbFetchRaw``) are kept cheap: the noise is pre-generated when the device is
+# initiated, and each fetch just copies a row of it into the caller's buffer.
+
+import cmath
+import ctypes as ct
+import math
+import numbers
+import threading
+import time
+
+import numpy as np
+
+from . import bb_api_h as hf
+
+
+class _SimDevice(object):
+	'''
+	State for one simulated device handle.
+	'''
+	def __init__(self, serial):
+		self.serial = serial
+		self.open = False
+		self.mode = hf.BB_IDLE
+
+		# Pending configuration. Copied into ``active`` on bbInitiate(), like the real API.
+		self.conf = {
+			"detector"   : hf.BB_AVERAGE,
+			"scale"      : hf.BB_LOG_SCALE,
+			"center"     : 1.0e9,
+			"span"       : 20.0e6,
+			"ref"        : -20.0,
+			"atten"      : hf.BB_AUTO_ATTEN,
+			"gain"       : hf.BB_AUTO_GAIN,
+			"rbw"        : 10.0e3,
+			"vbw"        : 10.0e3,
+			"sweepTime"  : 0.001,
+			"downsample" : 1,
+			"iqBw"       : 20.0e6,
+			"ppf"        : 1,
+			"steps"      : 16,
+		}
+		self.active = None
+		# Settings that haven't been configured since a self-cal reset them, and so can't be initiated with.
+		self.unset = set()
+
+		self.traceLen = 0
+		self.binSize = 0.0
+		self.start = 0.0
+
+		self.noiseBank = None
+		self.bankIndex = 0
+		self.overflow = False
+
+		self.sampleIndex = 0
+		self.streamStart = 0.0
+		self.lastTimestamp = 0.0
+		self.nextDue = 0.0
+
+		self.loopThread = None
+		self.loopStop = None
+
+
+class SimulatedBBApi(object):
+	'''
+	Args:
+		sweepRate (float): Sweeps per second returned by ``bbFetchTrace``/``bbFetchRawSweep``. ``None``
+			returns sweeps as fast as they can be generated.
+		tones (list): ``(frequency Hz, power dBm)`` tuples present in the simulated input.
+		noiseFloor (float): Noise floor, in dBm per bin.
+		noiseStd (float): Standard deviation of the noise around ``noiseFloor``, in dB.
+		traceSizes (dict): Optional ``{rbw : traceLen}`` overrides. Otherwise the trace length is
+			``span / (rbw / binsPerRbw)``.
+		binsPerRbw (float): Bins per RBW, for the default trace size calculation.
+		numDevices (int): Number of devices that can be opened.
+		serialBase (int): Serial number of the first device. Subsequent devices count up from it.
+		temperature (float): Initial device temperature, °C.
+		temperatureDrift (float): Temperature drift, in °C per second since the device was opened.
+		selfCalTime (float): Time ``bbSelfCal`` blocks for, in seconds.
+		streamPacing (bool): If ``True``, ``bbFetchRaw`` and ``bbFetchAudio`` block for as long as the real
+			device would take to produce the samples.
+		seed: Seed for the noise generator.
+
+	Errors can be injected with ``injectError()``.
+
+	Behaviour is modelled on the API documentation, not on the hardware. Trace contents are
+	plausible, not accurate.
+	'''
+
+	#: Marker, so callers can tell they're not talking to hardware.
+	simulated = True
+
+	apiVersion = b"2.0.5-sim"
+	firmwareVersion = 6
+
+	#: IQ pairs returned per bbFetchRaw() call.
+	streamReturnLen = 16384
+
+	#: Settings each mode needs configured before bbInitiate(), after a self-cal reset them.
+	requiredSettings = {
+		hf.BB_SWEEPING       : set(("detector", "scale", "center", "span", "ref", "atten", "gain", "rbw", "vbw", "sweepTime")),
+		hf.BB_REAL_TIME      : set(("detector", "scale", "center", "span", "ref", "atten", "gain", "rbw", "vbw", "sweepTime")),
+		hf.BB_STREAMING      : set(("center", "ref", "atten", "gain", "downsample", "iqBw")),
+		hf.BB_RAW_SWEEP      : set(("ppf", "steps")),
+		hf.BB_RAW_SWEEP_LOOP : set(("ppf", "steps"))
+	}
+
+	#: Seconds of IQ data the API buffers. If the caller falls further behind than this, samples are dropped.
+	streamBufferTime = 0.25
+
+	#: Pre-generated noise rows. Fetches cycle through these.
+	noiseBankSize = 16
+
+	#: Length of the raw sweep loop's circular buffer list.
+	rawSweepBuffers = 4
+
+	def __init__(self, sweepRate=100.0, tones=None, noiseFloor=-100.0, noiseStd=1.0,
+				traceSizes=None, binsPerRbw=2.0, numDevices=1, serialBase=12340000,
+				temperature=35.0, temperatureDrift=0.0, selfCalTime=0.5, streamPacing=True, seed=None):
+
+		self.sweepRate = sweepRate
+		self.tones = list(tones) if tones is not None else [(1.0e9, -40.0)]
+		self.noiseFloor = noiseFloor
+		self.noiseStd = noiseStd
+		self.traceSizes = traceSizes or {}
+		self.binsPerRbw = binsPerRbw
+		self.temperature = temperature
+		self.temperatureDrift = temperatureDrift
+		self.selfCalTime = selfCalTime
+		self.streamPacing = streamPacing
+
+		self.rng = np.random.RandomState(seed)
+
+		self.devices = [_SimDevice(serialBase + x) for x in range(numDevices)]
+		self.openTime = time.time()
+
+		# funcName -> list of status codes to return from the next calls
+		self.injectedErrors = {}
+		self.callCounts = {}
+
+	def __repr__(self):
+		return "<SimulatedBBApi: %d device(s), %s sweeps/sec>" % (len(self.devices), self.sweepRate)
+
+	##############################################################################################
+	# Test hooks
+	##############################################################################################
+
+	def injectError(self, funcName, status, count=1):
+		'''
+		Make the next ``count`` calls to ``funcName`` (e.g. ``"bbFetchTrace"``) return ``status`` instead of
+		doing anything.
+		'''
+		self.injectedErrors.setdefault(funcName, []).extend([status] * count)
+
+	def setTones(self, tones):
+		'''
+		Replace the simulated input signals. Takes effect at the next bbInitiate().
+		'''
+		self.tones = list(tones)
+
+	##############################################################################################
+	# Helpers
+	##############################################################################################
+
+	@staticmethod
+	def _val(arg):
+		# Arguments may arrive as python values or ctypes instances (e.g. ``self.deviceHandle``).
+		return arg.value if hasattr(arg, "value") else arg
+
+	@staticmethod
+	def _set(ptr, value):
+		# Out-params arrive as ``byref()`` objects or ``POINTER`` instances.
+		target = ptr._obj if hasattr(ptr, "_obj") else ptr.contents
+		target.value = value
+
+	@staticmethod
+	def _asArray(buf, ctype, count):
+		'''
+		Map a buffer argument (integer address, ctypes array/pointer or numpy array) as a
+		numpy array of ``count`` items, without copying.
+		'''
+		if isinstance(buf, np.ndarray):
+			return buf[:count]
+		if isinstance(buf, numbers.Integral):
+			return np.ctypeslib.as_array((ctype * count).from_address(buf))
+		if isinstance(buf, ct.Array):
+			return np.ctypeslib.as_array(buf)[:count]
+		if hasattr(buf, "_obj"):
+			return SimulatedBBApi._asArray(buf._obj, ctype, count)
+		return np.ctypeslib.as_array(ct.cast(buf, ct.POINTER(ctype)), shape=(count, ))
+
+	def _enter(self, funcName, device=None, needOpen=True):
+		'''
+		Common preamble. Returns ``(status, dev)``; ``status`` is non-zero if the call should
+		return immediately.
+		'''
+		self.callCounts[funcName] = self.callCounts.get(funcName, 0) + 1
+
+		pending = self.injectedErrors.get(funcName)
+		if pending:
+			return pending.pop(0), None
+
+		if device is None:
+			return hf.bbNoError, None
+
+		device = self._val(device)
+		if not 0 <= device < len(self.devices):
+			return hf.bbDeviceNotOpenErr, None
+		dev = self.devices[device]
+		if needOpen and not dev.open:
+			return hf.bbDeviceNotOpenErr, None
+		return hf.bbNoError, dev
+
+	def _configure(self, dev, **settings):
+		dev.conf.update(settings)
+		dev.unset.difference_update(settings)
+
+	def _pace(self, dev, interval):
+		# Block until the next sweep/block is "ready", so callers see the configured rate.
+		if not interval:
+			return
+		now = time.time()
+		if dev.nextDue > now:
+			time.sleep(dev.nextDue - now)
+			dev.nextDue += interval
+		else:
+			# Caller fell behind. The device doesn't wait for it, so don't accumulate a backlog.
+			dev.nextDue = now + interval
+
+	def _stopLoop(self, dev):
+		if dev.loopThread:
+			dev.loopStop.set()
+			if dev.loopThread is not threading.current_thread():
+				dev.loopThread.join()
+			dev.loopThread = None
+
+	def _traceLength(self, conf):
+		rbw = conf["rbw"]
+		if rbw in self.traceSizes:
+			return self.traceSizes[rbw], conf["span"] / max(self.traceSizes[rbw] - 1, 1)
+		binSize = rbw / self.binsPerRbw
+		return int(math.ceil(conf["span"] / binSize)) + 1, binSize
+
+	def _spectrum(self, dev):
+		'''
+		Noise floor plus tones, in dBm, for the active configuration.
+		'''
+		freqs = dev.start + np.arange(dev.traceLen) * dev.binSize
+		powerMw = np.full(dev.traceLen, 10 ** (self.noiseFloor / 10.0))
+
+		# Tones show up with the shape of the RBW filter (approximated as a gaussian)
+		sigma = max(dev.active["rbw"], dev.binSize) / 2.355
+		dev.overflow = False
+		for freq, power in self.tones:
+			if abs(freq - dev.active["center"]) > dev.active["span"] / 2 + 4 * sigma:
+				continue
+			powerMw += 10 ** (power / 10.0) * np.exp(-0.5 * ((freqs - freq) / sigma) ** 2)
+			if power > dev.active["ref"]:
+				dev.overflow = True
+
+		return 10 * np.log10(powerMw)
+
+	def _buildTraces(self, dev):
+		spectrum = self._spectrum(dev)
+		bank = spectrum + self.rng.normal(0, self.noiseStd, (self.noiseBankSize, dev.traceLen))
+
+		if dev.active["scale"] in (hf.BB_LIN_SCALE, hf.BB_LIN_FULL_SCALE):
+			# dBm -> mV into 50 ohms
+			bank = np.sqrt(10 ** (bank / 10.0) / 1000.0 * 50) * 1000
+
+		dev.noiseBank = bank
+		dev.bankIndex = 0
+
+	def _buildStream(self, dev):
+		noise = 10 ** (self.noiseFloor / 20.0)
+		shape = (self.noiseBankSize, self.streamReturnLen)
+		dev.noiseBank = ((self.rng.normal(0, noise, shape) + 1j * self.rng.normal(0, noise, shape)) / math.sqrt(2)).astype(np.complex64)
+		dev.bankIndex = 0
+		dev.sampleIndex = 0
+		dev.streamStart = time.time()
+
+		# Each in-band tone is pre-generated for one block starting at phase 0. Later blocks are the same
+		# samples rotated by the tone's phase at the block's first sample, so the phase stays continuous.
+		returnLen, bandwidth, sampleRate = self._streamInfo(dev)
+		n = np.arange(returnLen, dtype=np.float64)
+		dev.toneBlocks = []
+		for freq, power in self.tones:
+			offset = freq - dev.active["center"]
+			if abs(offset) > bandwidth / 2:
+				continue
+			step = 2 * np.pi * offset / sampleRate
+			dev.toneBlocks.append(((10 ** (power / 20.0) * np.exp(1j * step * n)).astype(np.complex64), step))
+		dev.toneScratch = np.empty(returnLen, dtype=np.complex64)
+		dev.blockScratch = np.empty(returnLen, dtype=np.complex64)
+
+	def _streamInfo(self, dev):
+		sampleRate = 40.0e6 / dev.active["downsample"]
+		bandwidth = min(dev.active["iqBw"], sampleRate * 0.8)
+		return self.streamReturnLen, bandwidth, sampleRate
+
+	def _iqBlock(self, dev, out):
+		'''
+		Write the next block of IQ samples into the complex64 array ``out``.
+		'''
+		returnLen, bandwidth, sampleRate = self._streamInfo(dev)
+
+		if self.streamPacing:
+			now = time.time()
+			behind = (now - dev.streamStart) * sampleRate - dev.sampleIndex
+			if behind > self.streamBufferTime * sampleRate:
+				# The API's buffer overflowed. The oldest samples are gone.
+				dev.sampleIndex += int(behind - self.streamBufferTime * sampleRate)
+
+			due = dev.streamStart + (dev.sampleIndex + returnLen) / sampleRate
+			if due > now:
+				time.sleep(due - now)
+
+		np.copyto(out, dev.noiseBank[dev.bankIndex])
+		dev.bankIndex = (dev.bankIndex + 1) % self.noiseBankSize
+
+		for block, step in dev.toneBlocks:
+			rotation = np.complex64(cmath.exp(1j * math.fmod(step * dev.sampleIndex, 2 * np.pi)))
+			np.multiply(block, rotation, out=dev.toneScratch)
+			out += dev.toneScratch
+
+		dev.lastTimestamp = dev.streamStart + dev.sampleIndex / sampleRate
+		dev.sampleIndex += returnLen
+
+	def _rawSweepLen(self, dev):
+		return 18688 * dev.active["ppf"] * dev.active["steps"]
+
+	def _rawSweepData(self, dev, count):
+		return self.rng.randint(-512, 512, count).astype(np.short)
+
+	##############################################################################################
+	# Device open/close
+	##############################################################################################
+
+	def bbOpenDevice(self, device):
+		err, dummy_dev = self._enter("bbOpenDevice")
+		if err:
+			return err
+		for handle, dev in enumerate(self.devices):
+			if not dev.open:
+				dev.open = True
+				dev.mode = hf.BB_IDLE
+				self._set(device, handle)
+				return hf.bbNoError
+
+		return hf.bbDeviceNotOpenErr
+
+	def bbCloseDevice(self, device):
+		err, dev = self._enter("bbCloseDevice", device)
+		if err:
+			return err
+		self._stopLoop(dev)
+		dev.open = False
+		dev.mode = hf.BB_IDLE
+		return hf.bbNoError
+
+	##############################################################################################
+	# Configuration
+	##############################################################################################
+
+	def bbConfigureAcquisition(self, device, detector, scale):
+		err, dev = self._enter("bbConfigureAcquisition", device)
+		if err:
+			return err
+		if detector not in (hf.BB_MIN_AND_MAX, hf.BB_AVERAGE):
+			return hf.bbInvalidDetectorErr
+		if scale not in (hf.BB_LOG_SCALE, hf.BB_LIN_SCALE, hf.BB_LOG_FULL_SCALE, hf.BB_LIN_FULL_SCALE):
+			return hf.bbInvalidScaleErr
+		self._configure(dev, detector = detector, scale = scale)
+		return hf.bbNoError
+
+	def bbConfigureCenterSpan(self, device, center, span):
+		err, dev = self._enter("bbConfigureCenterSpan", device)
+		if err:
+			return err
+		if span < hf.BB_MIN_SPAN:
+			return hf.bbInvalidSpanErr
+		if center - span / 2 < hf.BB60_MIN_FREQ or center + span / 2 > hf.BB60_MAX_FREQ:
+			return hf.bbFrequencyRangeErr
+		self._configure(dev, center = center, span = span)
+		return hf.bbNoError
+
+	def bbConfigureLevel(self, device, ref, atten):
+		err, dev = self._enter("bbConfigureLevel", device)
+		if err:
+			return err
+		if ref > hf.BB_MAX_REFERENCE:
+			return hf.bbReferenceLevelErr
+		if atten > hf.BB_MAX_ATTENUATION:
+			return hf.bbAttenuationErr
+		self._configure(dev, ref = ref, atten = atten)
+		return hf.bbNoError
+
+	def bbConfigureGain(self, device, gain):
+		err, dev = self._enter("bbConfigureGain", device)
+		if err:
+			return err
+		if gain < hf.BB_AUTO_GAIN or gain > hf.BB60_MAX_GAIN:
+			return hf.bbInvalidGainErr
+		self._configure(dev, gain = gain)
+		return hf.bbNoError
+
+	def bbConfigureSweepCoupling(self, device, rbw, vbw, sweepTime, rbwType, rejection):
+		err, dev = self._enter("bbConfigureSweepCoupling", device)
+		if err:
+			return err
+		if rbw < hf.BB_MIN_BW or rbw > hf.BB_MAX_BW or vbw > rbw:
+			return hf.bbBandwidthErr
+		if rbwType not in (hf.BB_NATIVE_RBW, hf.BB_NON_NATIVE_RBW):
+			return hf.bbInvalidBandwidthTypeErr
+		if rejection not in (hf.BB_NO_SPUR_REJECT, hf.BB_SPUR_REJECT, hf.BB_BYPASS_RF):
+			return hf.bbInvalidParameterErr
+		self._configure(dev, rbw = rbw, vbw = vbw, sweepTime = sweepTime)
+		return hf.bbNoError
+
+	def bbConfigureWindow(self, device, window):
+		err, dev = self._enter("bbConfigureWindow", device)
+		if err:
+			return err
+		if window not in (hf.BB_NUTALL, hf.BB_BLACKMAN, hf.BB_HAMMING, hf.BB_FLAT_TOP, hf.BB_FLAT_TOP_EMC_9KHZ, hf.BB_FLAT_TOP_EMC_120KHZ):
+			return hf.bbInvalidWindowErr
+		return hf.bbNoError
+
+	def bbConfigureProcUnits(self, device, units):
+		err, dev = self._enter("bbConfigureProcUnits", device)
+		if err:
+			return err
+		if units not in (hf.BB_LOG, hf.BB_VOLTAGE, hf.BB_POWER, hf.BB_SAMPLE):
+			return hf.bbInvalidVideoUnitsErr
+		return hf.bbNoError
+
+	def bbConfigureTrigger(self, device, trigType, edge, level, timeout):
+		err, dev = self._enter("bbConfigureTrigger", device)
+		if err:
+			return err
+		if trigType not in (hf.BB_NO_TRIGGER, hf.BB_VIDEO_TRIGGER, hf.BB_EXTERNAL_TRIGGER):
+			return hf.bbInvalidParameterErr
+		return hf.bbNoError
+
+	def bbConfigureTimeGate(self, device, delay, length, timeout):
+		err, dev = self._enter("bbConfigureTimeGate", device)
+		return err
+
+	def bbConfigureRawSweep(self, device, start, ppf, steps, stepsize):
+		err, dev = self._enter("bbConfigureRawSweep", device)
+		if err:
+			return err
+		if ppf < 1 or steps < 1:
+			return hf.bbInvalidParameterErr
+		self._configure(dev, ppf = ppf, steps = steps)
+		return hf.bbNoError
+
+	def bbConfigureIO(self, device, port1, port2):
+		err, dev = self._enter("bbConfigureIO", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_IDLE:
+			return hf.bbDeviceNotIdleErr
+		return hf.bbNoError
+
+	def bbConfigureDemod(self, device, modulationType, freq, IFBW, audioLowPassFreq, audioHighPassFreq, FMDeemphasis):
+		err, dev = self._enter("bbConfigureDemod", device)
+		return err
+
+	def bbConfigureIQ(self, device, downsample, bandwidth):
+		err, dev = self._enter("bbConfigureIQ", device)
+		if err:
+			return err
+		if downsample < 1 or downsample > hf.BB_MAX_DECIMATION or downsample & (downsample - 1):
+			return hf.bbInvalidParameterErr
+		self._configure(dev, downsample = downsample)
+
+		maxBw = 40.0e6 / downsample * 0.8
+		if bandwidth < hf.BB_MIN_IQ_BW:
+			self._configure(dev, iqBw = hf.BB_MIN_IQ_BW)
+			return hf.bbClampedToLowerLimit
+		if bandwidth > maxBw:
+			self._configure(dev, iqBw = maxBw)
+			return hf.bbClampedToUpperLimit
+		self._configure(dev, iqBw = bandwidth)
+		return hf.bbNoError
+
+	def bbInitiate(self, device, mode, flag):
+		err, dev = self._enter("bbInitiate", device)
+		if err:
+			return err
+
+		# Until they're configured again, the settings a self-cal reset can't be initiated with.
+		if dev.unset & self.requiredSettings.get(mode, set()):
+			return hf.bbDeviceNotConfiguredErr
+
+		self._stopLoop(dev)
+		dev.active = dict(dev.conf)
+
+		if mode in (hf.BB_SWEEPING, hf.BB_REAL_TIME, hf.BB_ZERO_SPAN, hf.BB_TIME_GATE):
+			if mode == hf.BB_SWEEPING and dev.active["rbw"] > dev.active["span"]:
+				return hf.bbBandwidthErr
+			if mode == hf.BB_REAL_TIME and dev.active["span"] > hf.BB60C_MAX_RT_SPAN:
+				return hf.bbInvalidParameterErr
+			dev.traceLen, dev.binSize = self._traceLength(dev.active)
+			dev.start = dev.active["center"] - dev.active["span"] / 2
+			self._buildTraces(dev)
+		elif mode == hf.BB_STREAMING:
+			self._buildStream(dev)
+		elif mode not in (hf.BB_RAW_SWEEP, hf.BB_RAW_SWEEP_LOOP, hf.BB_AUDIO_DEMOD):
+			return hf.bbInvalidModeErr
+
+		dev.mode = mode
+		dev.nextDue = 0.0
+		return hf.bbNoError
+
+	##############################################################################################
+	# Data acquisition
+	##############################################################################################
+
+	def bbFetchTrace(self, device, arraySize, minArr, maxArr):
+		err, dev = self._enter("bbFetchTrace", device)
+		if err:
+			return err
+		if dev.mode not in (hf.BB_SWEEPING, hf.BB_REAL_TIME, hf.BB_ZERO_SPAN, hf.BB_TIME_GATE):
+			return hf.bbDeviceNotConfiguredErr
+		if arraySize < dev.traceLen:
+			return hf.bbBufferTooSmallErr
+
+		self._pace(dev, 1.0 / self.sweepRate if self.sweepRate else 0)
+
+		row = dev.noiseBank[dev.bankIndex]
+		dev.bankIndex = (dev.bankIndex + 1) % self.noiseBankSize
+
+		maxOut = self._asArray(maxArr, ct.c_double, dev.traceLen)
+		minOut = self._asArray(minArr, ct.c_double, dev.traceLen)
+		maxOut[:] = row
+		minOut[:] = row
+		dev.lastTimestamp = time.time()
+
+		if dev.overflow:
+			return hf.bbADCOverflow
+		return hf.bbNoError
+
+	def bbFetchAudio(self, device, audio):
+		err, dev = self._enter("bbFetchAudio", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_AUDIO_DEMOD:
+			return hf.bbDeviceNotConfiguredErr
+
+		count = 4096
+		if self.streamPacing:
+			self._pace(dev, count / 32000.0)
+		out = self._asArray(audio, ct.c_float, count)
+		t = (dev.sampleIndex + np.arange(count)) / 32000.0
+		out[:] = 0.5 * np.sin(2 * np.pi * 1000.0 * t) + self.rng.normal(0, 0.01, count)
+		dev.sampleIndex += count
+		return hf.bbNoError
+
+	def bbFetchRawCorrections(self, device, corrections, index, startFreq):
+		err, dev = self._enter("bbFetchRawCorrections", device)
+		if err:
+			return err
+		if dev.mode not in (hf.BB_STREAMING, hf.BB_RAW_SWEEP, hf.BB_RAW_SWEEP_LOOP):
+			return hf.bbDeviceNotConfiguredErr
+
+		out = self._asArray(corrections, ct.c_float, 2048)
+		out[:] = 0
+		out[512:1536] = 0.1
+		self._set(index, 512)
+		self._set(startFreq, dev.active["center"] - 20.0e6)
+		return hf.bbNoError
+
+	def bbFetchRaw(self, device, buffer, triggers):
+		err, dev = self._enter("bbFetchRaw", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_STREAMING:
+			return hf.bbDeviceNotConfiguredErr
+
+		self._iqBlock(dev, self._asArray(buffer, ct.c_float, self.streamReturnLen * 2).view(np.complex64))
+
+		if triggers:
+			# No triggers. The trigger list is zero-terminated.
+			self._asArray(triggers, ct.c_int, 1)[0] = 0
+		return hf.bbNoError
+
+	def bbFetchRaw_s(self, device, buffer, triggers):
+		err, dev = self._enter("bbFetchRaw_s", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_STREAMING:
+			return hf.bbDeviceNotConfiguredErr
+
+		block = dev.blockScratch
+		self._iqBlock(dev, block)
+
+		out = self._asArray(buffer, ct.c_short, len(block) * 2)
+		out[0::2] = np.clip(block.real * 32767, -32768, 32767)
+		out[1::2] = np.clip(block.imag * 32767, -32768, 32767)
+
+		if triggers:
+			self._asArray(triggers, ct.c_int, 1)[0] = 0
+		return hf.bbNoError
+
+	def bbFetchRawSweep(self, device, buffer):
+		err, dev = self._enter("bbFetchRawSweep", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_RAW_SWEEP:
+			return hf.bbDeviceNotConfiguredErr
+
+		self._pace(dev, 1.0 / self.sweepRate if self.sweepRate else 0)
+		count = self._rawSweepLen(dev)
+		self._asArray(buffer, ct.c_short, count)[:] = self._rawSweepData(dev, count)
+		return hf.bbNoError
+
+	def bbStartRawSweepLoop(self, device, sweep_callback):
+		err, dev = self._enter("bbStartRawSweepLoop", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_RAW_SWEEP_LOOP:
+			return hf.bbDeviceNotConfiguredErr
+		if not sweep_callback:
+			return hf.bbNullPtrErr
+
+		self._stopLoop(dev)
+
+		count = self._rawSweepLen(dev)
+		buffers = [(ct.c_short * count)() for dummy_x in range(self.rawSweepBuffers)]
+		stop = threading.Event()
+
+		def loop():
+			bufIndex = 0
+			while not stop.is_set():
+				self._pace(dev, 1.0 / self.sweepRate if self.sweepRate else 0)
+				buf = buffers[bufIndex]
+				bufIndex = (bufIndex + 1) % len(buffers)
+				self._asArray(buf, ct.c_short, count)[:] = self._rawSweepData(dev, count)
+				sweep_callback(ct.cast(buf, ct.POINTER(ct.c_short)), count)
+
+		dev.loopStop = stop
+		dev.loopThread = threading.Thread(target=loop, name="SimRawSweepLoop")
+		dev.loopThread.daemon = True
+		dev.loopThread.start()
+		return hf.bbNoError
+
+	##############################################################################################
+	# Queries
+	##############################################################################################
+
+	def bbQueryTraceInfo(self, device, traceLen, binSize, start):
+		err, dev = self._enter("bbQueryTraceInfo", device)
+		if err:
+			return err
+		if dev.mode not in (hf.BB_SWEEPING, hf.BB_REAL_TIME, hf.BB_ZERO_SPAN, hf.BB_TIME_GATE):
+			return hf.bbDeviceNotConfiguredErr
+		self._set(traceLen, dev.traceLen)
+		self._set(binSize, dev.binSize)
+		self._set(start, dev.start)
+		return hf.bbNoError
+
+	def bbQueryStreamInfo(self, device, return_len, bandwidth, samples_per_sec):
+		err, dev = self._enter("bbQueryStreamInfo", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_STREAMING:
+			return hf.bbDeviceNotConfiguredErr
+		returnLen, bw, sampleRate = self._streamInfo(dev)
+		self._set(return_len, returnLen)
+		self._set(bandwidth, bw)
+		self._set(samples_per_sec, int(sampleRate))
+		return hf.bbNoError
+
+	def bbQueryStreamingCenter(self, device, center):
+		err, dev = self._enter("bbQueryStreamingCenter", device)
+		if err:
+			return err
+		if dev.mode != hf.BB_STREAMING:
+			return hf.bbDeviceNotConfiguredErr
+		self._set(center, dev.active["center"])
+		return hf.bbNoError
+
+	def bbQueryTimestamp(self, device, seconds, nanoseconds):
+		err, dev = self._enter("bbQueryTimestamp", device)
+		if err:
+			return err
+		if dev.mode == hf.BB_IDLE:
+			return hf.bbDeviceNotConfiguredErr
+		self._set(seconds, int(dev.lastTimestamp))
+		self._set(nanoseconds, int((dev.lastTimestamp % 1) * 1e9))
+		return hf.bbNoError
+
+	def _temperature(self):
+		return self.temperature + self.temperatureDrift * (time.time() - self.openTime)
+
+	def bbGetDeviceDiagnostics(self, device, temperature, voltageUSB, currentUSB):
+		err, dev = self._enter("bbGetDeviceDiagnostics", device)
+		if err:
+			return err
+		self._set(temperature, self._temperature())
+		self._set(voltageUSB, 5.0)
+		self._set(currentUSB, 500.0)  # mA
+		return hf.bbNoError
+
+	def bbQueryDiagnostics(self, device, temperature, voltage1_8, voltage1_2, voltageUSB, currentUSB):
+		err, dev = self._enter("bbQueryDiagnostics", device)
+		if err:
+			return err
+		self._set(temperature, self._temperature())
+		self._set(voltage1_8, 1.8)
+		self._set(voltage1_2, 1.2)
+		self._set(voltageUSB, 5.0)
+		self._set(currentUSB, 500.0)  # mA
+		return hf.bbNoError
+
+	##############################################################################################
+	# Device control
+	##############################################################################################
+
+	def bbAbort(self, device):
+		err, dev = self._enter("bbAbort", device)
+		if err:
+			return err
+		if dev.mode == hf.BB_IDLE:
+			return hf.bbDeviceNotConfiguredErr
+		self._stopLoop(dev)
+		dev.mode = hf.BB_IDLE
+		return hf.bbNoError
+
+	def bbPreset(self, device):
+		err, dev = self._enter("bbPreset", device)
+		if err:
+			return err
+		self._stopLoop(dev)
+		dev.mode = hf.BB_IDLE
+		dev.conf = _SimDevice(dev.serial).conf
+		return hf.bbNoError
+
+	def bbSelfCal(self, device):
+		err, dev = self._enter("bbSelfCal", device)
+		if err:
+			return err
+
+		# Calibration aborts whatever the device was doing, and leaves it in its default state, as if just opened.
+		# Unlike a device that was just opened, it has to be fully reconfigured before the next bbInitiate().
+		self._stopLoop(dev)
+		dev.mode = hf.BB_IDLE
+		dev.conf = _SimDevice(dev.serial).conf
+		dev.unset = set(dev.conf)
+		time.sleep(self.selfCalTime)
+
+		# The calibration is done at the current temperature, so drift starts over.
+		self.temperature = self._temperature()
+		self.openTime = time.time()
+		return hf.bbNoError
+
+	def bbSyncCPUtoGPS(self, comPort, baudRate):
+		err, dummy_dev = self._enter("bbSyncCPUtoGPS")
+		if err:
+			return err
+		# No simulated GPS.
+		return hf.bbGPSErr
+
+	def bbGetDeviceType(self, device, devType):
+		err, dev = self._enter("bbGetDeviceType", device)
+		if err:
+			return err
+		self._set(devType, hf.BB_DEVICE_BB60C)
+		return hf.bbNoError
+
+	def bbGetSerialNumber(self, device, serialNo):
+		err, dev = self._enter("bbGetSerialNumber", device)
+		if err:
+			return err
+		self._set(serialNo, dev.serial)
+		return hf.bbNoError
+
+	def bbGetFirmwareVersion(self, device, firmwareRev):
+		err, dev = self._enter("bbGetFirmwareVersion", device)
+		if err:
+			return err
+		self._set(firmwareRev, self.firmwareVersion)
+		return hf.bbNoError
+
+	def bbGetAPIVersion(self):
+		return self.apiVersion
+
+	def bbGetErrorString(self, status):
+		for name, value in vars(hf).items():
+			if name.startswith("bb") and value == status:
+				return name.encode("ascii")
+		return b"Unknown error"
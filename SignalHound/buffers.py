@@ -0,0 +1,585 @@
+# -*- coding: UTF-8 -*-
+
+# Preallocated buffers for the streaming acquisition modes.
+#
+# The API calls that return bulk data write into caller-supplied memory, so these classes
+# allocate their storage once and hand out the addresses of fixed slots. Nothing in
+# the per-block path allocates sample memory.
+
+import binascii
+import ctypes as ct
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+
+class IQRing(object):
+	'''
+	Ring of ``numBlocks`` complex64 blocks of ``blockLen`` IQ samples each, plus per-block metadata.
+
+	``data[slot]`` is laid out exactly as ``bbFetchRaw`` writes it (interleaved I/Q 32 bit floats), so the
+	API writes straight into the ring.
+
+	Attributes:
+		data: ``(numBlocks, blockLen)`` complex64 sample array.
+		triggers: ``(numBlocks, numTriggers)`` int32 trigger index array. Zero terminated.
+		sampleIndex: Stream sample index of the first sample in each block.
+		timestampNs: ``bbQueryTimestamp`` time of each block, in integer nanoseconds since the epoch (0 if not queried).
+		written: Total number of blocks claimed since the ring was created.
+	'''
+
+	def __init__(self, numBlocks, blockLen, numTriggers):
+		self.numBlocks = numBlocks
+		self.blockLen = blockLen
+
+		self.data = np.zeros((numBlocks, blockLen), dtype=np.complex64)
+		self.triggers = np.zeros((numBlocks, numTriggers), dtype=np.int32)
+		self.sampleIndex = np.zeros(numBlocks, dtype=np.int64)
+		self.timestampNs = np.zeros(numBlocks, dtype=np.int64)
+
+		# Raw addresses of each slot, so handing one to the API doesn't create any objects.
+		self.dataAddrs = [self.data.ctypes.data + slot * self.data.strides[0] for slot in range(numBlocks)]
+		self.triggerAddrs = [self.triggers.ctypes.data + slot * self.triggers.strides[0] for slot in range(numBlocks)]
+
+		self.written = 0
+
+	def claim(self):
+		'''
+		Return the next slot to write, overwriting the oldest block.
+		'''
+		slot = self.written % self.numBlocks
+		self.written += 1
+		return slot
+
+	def lastSlots(self, count=None):
+		'''
+		Slot indices of the most recent ``count`` blocks (default: every valid block), oldest first.
+		'''
+		valid = min(self.written, self.numBlocks)
+		if count is None or count > valid:
+			count = valid
+		return [(self.written - count + x) % self.numBlocks for x in range(count)]
+
+
+class SweepRing(object):
+	'''
+	Fixed-size ring of ``numSlots`` raw sweeps of ``sweepLen`` samples, filled from the raw sweep loop
+	callback and drained by a consumer thread.
+
+	It's a single-producer/single-consumer queue: the callback (producer) only ever advances ``written``,
+	and the consumer only ever advances ``read``, so neither side takes a lock. The callback does
+	nothing but a ``memmove`` of the sweep into the next free slot (ctypes releases the GIL for the
+	copy), which keeps it well inside the time the API allows before it reuses its buffer.
+
+	If the consumer falls ``numSlots`` sweeps behind, new sweeps are dropped (rather than overwriting
+	sweeps the consumer may be looking at) and counted in ``dropped``.
+
+	Producers that can write straight into the ring (e.g. a ``bbFetchTrace`` call) can use ``nextSlot()`` and
+	``commit()`` instead of ``push()``, and ``waitForSlot()`` to wait for the consumer rather than dropping.
+
+	Attributes:
+		data: ``(numSlots, sweepLen)`` sample array.
+		timestamps: ``time.time()`` at which each slot was filled.
+		written: Sweeps captured since the ring was created.
+		read: Sweeps released by the consumer.
+		dropped: Sweeps discarded because the ring was full.
+	'''
+
+	def __init__(self, numSlots, sweepLen, dtype=np.short):
+		self.numSlots = numSlots
+		self.sweepLen = sweepLen
+
+		self.data = np.zeros((numSlots, sweepLen), dtype=dtype)
+		self.timestamps = np.zeros(numSlots, dtype=np.float64)
+		self.slotAddrs = [self.data.ctypes.data + slot * self.data.strides[0] for slot in range(numSlots)]
+		self.itemSize = self.data.itemsize
+
+		self.written = 0
+		self.read = 0
+		self.dropped = 0
+
+		self.ready = threading.Event()
+		self.freed = threading.Event()
+		self.closed = False
+
+	def push(self, bufPtr, bufLen):
+		'''
+		Raw sweep loop callback. Copies ``bufLen`` samples from ``bufPtr`` into the next free slot.
+		'''
+		slot = self.nextSlot()
+		if slot is None:
+			self.dropped += 1
+			return
+
+		ct.memmove(self.slotAddrs[slot], bufPtr, min(bufLen, self.sweepLen) * self.itemSize)
+		self.commit(time.time())
+
+	def nextSlot(self):
+		'''
+		The slot the producer should fill next, or ``None`` if the ring is full.
+		'''
+		if self.written - self.read >= self.numSlots:
+			return None
+		return self.written % self.numSlots
+
+	def commit(self, timestamp):
+		'''
+		Publish the slot returned by ``nextSlot()`` to the consumer.
+		'''
+		self.timestamps[self.written % self.numSlots] = timestamp
+		self.written += 1
+		self.ready.set()
+
+	def waitForSlot(self, timeout=None):
+		'''
+		Wait up to ``timeout`` seconds for the consumer to free a slot.
+
+		Returns:
+			The free slot, as ``nextSlot()``, or ``None`` on timeout or if the ring has been closed.
+		'''
+		while self.written - self.read >= self.numSlots:
+			if self.closed:
+				return None
+			self.freed.clear()
+			if self.written - self.read < self.numSlots:
+				break
+			if not self.freed.wait(timeout) and self.written - self.read >= self.numSlots:
+				return None
+
+		if self.closed:
+			return None
+		return self.written % self.numSlots
+
+	def available(self):
+		'''
+		Number of captured sweeps the consumer hasn't released yet.
+		'''
+		return self.written - self.read
+
+	def get(self, timeout=None):
+		'''
+		Wait up to ``timeout`` seconds (forever if ``None``) for the oldest unreleased sweep.
+
+		Returns:
+			``(sweep, timestamp)``, where ``sweep`` is a view into the ring that stays valid until ``release()``
+			is called, or ``None`` on timeout or if the ring has been closed.
+		'''
+		while self.written == self.read:
+			if self.closed:
+				return None
+			# Clear before re-checking, so a push between the check and the wait isn't missed.
+			self.ready.clear()
+			if self.written != self.read:
+				break
+			if not self.ready.wait(timeout) and self.written == self.read:
+				return None
+
+		slot = self.read % self.numSlots
+		return self.data[slot], self.timestamps[slot]
+
+	def release(self):
+		'''
+		Hand the slot returned by the last ``get()`` back to the producer.
+		'''
+		self.read += 1
+		self.freed.set()
+
+	def close(self):
+		'''
+		Stop any consumer waiting in ``get()``/``sweeps()`` once the remaining sweeps are drained.
+		'''
+		self.closed = True
+		self.ready.set()
+		self.freed.set()
+
+	def sweeps(self, timeout=None):
+		'''
+		Iterate over captured sweeps, oldest first. Yields ``(sweep, timestamp)`` tuples.
+
+		Each yielded sweep is a view into the ring, and is released when the iterator is advanced, so
+		copy it if you need it afterwards. Stops when the ring is closed and drained, or if no sweep
+		arrives within ``timeout`` seconds.
+		'''
+		while True:
+			item = self.get(timeout)
+			if item is None:
+				return
+			try:
+				yield item
+			finally:
+				self.release()
+
+	__iter__ = sweeps
+
+
+class TraceBlock(object):
+	'''
+	A stack of ``numTraces`` sweeps of ``traceLen`` bins, filled by ``SignalHound.fetchTraces()``.
+
+	Rows are stored as ``dtype`` (``np.double`` or ``np.float32``). The API only produces doubles, so
+	float32 blocks are fetched through a one-row double scratch buffer and converted as they're stored.
+
+	Attributes:
+		max: ``(numTraces, traceLen)`` array of max-hold traces.
+		min: ``(numTraces, traceLen)`` array of min-hold traces, or ``None`` unless created with ``withMin``.
+		timestamps: ``time.time()`` at which each row was fetched.
+		count: Number of rows filled by the last fetch.
+		adcOverflows: Number of rows in the last fetch for which the API reported ADC clipping.
+		startFreq: Frequency of the first bin (from ``queryTraceInfo()``).
+		binSize: Frequency step between bins.
+	'''
+
+	def __init__(self, numTraces, traceLen, dtype=np.double, withMin=False):
+		self.numTraces = numTraces
+		self.traceLen = traceLen
+
+		self.max = np.empty((numTraces, traceLen), dtype=dtype)
+		self.min = np.empty((numTraces, traceLen), dtype=dtype) if withMin else None
+		self.timestamps = np.zeros(numTraces, dtype=np.float64)
+
+		self.count = 0
+		self.adcOverflows = 0
+		self.startFreq = 0.0
+		self.binSize = 0.0
+
+		# Fetch straight into the rows if they're doubles, otherwise into the scratch row.
+		self.converting = self.max.dtype != np.double
+		self.scratch = np.empty((2, traceLen), dtype=np.double)
+		scratchMin, scratchMax = self.scratch.ctypes.data, self.scratch.ctypes.data + self.scratch.strides[0]
+
+		if self.converting:
+			self.maxAddrs = [scratchMax] * numTraces
+		else:
+			self.maxAddrs = [self.max.ctypes.data + row * self.max.strides[0] for row in range(numTraces)]
+
+		if withMin and not self.converting:
+			self.minAddrs = [self.min.ctypes.data + row * self.min.strides[0] for row in range(numTraces)]
+		else:
+			self.minAddrs = [scratchMin] * numTraces
+
+	def reset(self, traceInfo):
+		self.count = 0
+		self.adcOverflows = 0
+		self.startFreq = traceInfo["ret-start-freq"]
+		self.binSize = traceInfo["arr-bin-size"]
+
+	def store(self, row):
+		'''
+		Move a fetched row out of the scratch buffer, if it went through it.
+		'''
+		if self.converting:
+			self.max[row] = self.scratch[1]
+			if self.min is not None:
+				self.min[row] = self.scratch[0]
+
+	@property
+	def rows(self):
+		'''
+		The filled part of ``max``, for reductions like ``block.rows.mean(axis=0)``.
+		'''
+		return self.max[:self.count]
+
+	@property
+	def freqs(self):
+		'''
+		Frequency of each bin.
+		'''
+		return self.startFreq + np.arange(self.traceLen) * self.binSize
+
+
+class SpectrumRing(object):
+	'''
+	Ring of ``numSlots`` spectrum rows in shared memory, passed from one producer process to ``numConsumers``
+	consumer processes without pickling.
+
+	Each slot holds ``numArrays`` arrays of up to ``rowLen`` float64 bins (e.g. a mean and some other statistics of
+	the same integration), plus a small header: the sequence number, number of valid bins, timestamp, start
+	frequency, bin size and sweep count. The producer copies each row in once, and consumers get views straight
+	into the shared memory.
+
+		>>> ring = SpectrumRing.create(32, traceLen)        # producer
+		>>> ring.put(time.time(), startFreq, binSize, sweeps, mean)
+		>>> ...
+		>>> ring = SpectrumRing.attach(name)                # consumer, with the producer's ``ring.name``
+		>>> row = ring.get(consumer=0, timeout=1)
+		>>> if row:
+		...     timestamp, startFreq, binSize, sweeps, arrays = row
+		...     process(arrays[0])
+		...     ring.release(consumer=0)
+
+	Every consumer has its own read cursor, and the producer doesn't overwrite a slot until every consumer has
+	released it. If the slowest consumer is ``numSlots`` rows behind, ``put()`` drops the new row and counts it in
+	``dropped``, as ``SweepRing`` does, so a stalled consumer can't stall the producer. Each cursor is only ever
+	advanced by its own consumer, and ``written`` only by the producer, so there are no locks.
+
+	A ring created with ``dropOldest`` (for a live display, where only the latest rows matter) never refuses a row.
+	It overwrites the oldest one instead, and counts that in ``dropped`` if a consumer hadn't released it yet. A
+	consumer that has fallen behind skips ahead to the oldest row still in the ring. A row can then be overwritten
+	while a consumer is looking at it, so copy what you need out of it before ``release()``, which returns ``False``
+	if that happened, and discard the copy if it does.
+
+	Consumers in other processes can't block on the ring itself, so the producer usually tells them about new rows
+	through a queue. ``notify()`` and ``clearNotice()`` keep that to one outstanding notice per consumer, however
+	far behind it is:
+
+		>>> if ring.put(time.time(), startFreq, binSize, sweeps, mean) and ring.notify():
+		...     queue.put(ROW_READY)                       # producer
+		>>> ...
+		>>> ring.clearNotice()                             # consumer, on getting the notice, before draining
+		>>> while ring.available():
+		...     ...
+
+	The memory is an ``mmap`` of a file in ``/dev/shm`` where that exists (a temporary file otherwise), and
+	``name`` is its path, so it can be attached from any process, including ones started before the ring was
+	created. Attach it, rather than passing the object to another process. On Windows, where a file can't be
+	resized with ``os.ftruncate()`` or deleted while it's mapped, it's a named mapping backed by the page file
+	instead, and ``name`` is its tag. Windows frees it with the last mapping of it, so there's no file to clean up.
+
+	Attributes:
+		name: Path to pass to ``attach()``.
+		dropOldest: Whether a full ring overwrites its oldest row rather than dropping the new one.
+		written: Rows published since the ring was created.
+		dropped: Rows discarded because a consumer was ``numSlots`` rows behind.
+		closed: Set by ``close()``. Consumers stop once it's set and they've drained the ring.
+	'''
+
+	# Control block fields, as int64 at the start of the mapping.
+	_NUM_SLOTS, _ROW_LEN, _NUM_ARRAYS, _NUM_CONSUMERS, _WRITTEN, _DROPPED, _CLOSED, _DROP_OLDEST = range(8)
+	_CONTROL_LEN = 8
+
+	# Per-slot header fields, as float64.
+	_TIMESTAMP, _START_FREQ, _BIN_SIZE, _COUNT = range(4)
+
+	def __init__(self, name, mapping, owner=False):
+		self.name = name
+		self.mapping = mapping
+		self.owner = owner
+
+		control = np.frombuffer(mapping, dtype=np.int64, count=self._CONTROL_LEN)
+		self.numSlots, self.rowLen, self.numArrays, self.numConsumers = [int(x) for x in control[:4]]
+		self.dropOldest = bool(control[self._DROP_OLDEST])
+
+		offset = control.nbytes
+		self.control = control
+		self.cursors = np.frombuffer(mapping, dtype=np.int64, count=self.numConsumers, offset=offset)
+		offset += self.cursors.nbytes
+		self.notices = np.frombuffer(mapping, dtype=np.int64, count=self.numConsumers, offset=offset)
+		offset += self.notices.nbytes
+		self.sequence = np.frombuffer(mapping, dtype=np.int64, count=self.numSlots, offset=offset)
+		offset += self.sequence.nbytes
+		self.lengths = np.frombuffer(mapping, dtype=np.int64, count=self.numSlots, offset=offset)
+		offset += self.lengths.nbytes
+		self.header = np.frombuffer(mapping, dtype=np.float64, count=self.numSlots * 4, offset=offset).reshape(self.numSlots, 4)
+		offset += self.header.nbytes
+		self.data = np.frombuffer(mapping, dtype=np.float64, count=self.numSlots * self.numArrays * self.rowLen, offset=offset)
+		self.data = self.data.reshape(self.numSlots, self.numArrays, self.rowLen)
+
+	@staticmethod
+	def _size(numSlots, rowLen, numArrays, numConsumers):
+		return 8 * (SpectrumRing._CONTROL_LEN + 2 * numConsumers + numSlots * (2 + 4 + numArrays * rowLen))
+
+	@classmethod
+	def create(cls, numSlots, rowLen, numArrays=1, numConsumers=1, dropOldest=False):
+		'''
+		Allocate a new ring. The creating process is the producer, and should ``unlink()`` it when done.
+		'''
+		size = cls._size(numSlots, rowLen, numArrays, numConsumers)
+		if sys.platform == "win32":
+			name = "SignalHound-ring-%s-%s" % (os.getpid(), binascii.hexlify(os.urandom(8)).decode("ascii"))
+			mapping = mmap.mmap(-1, size, tagname=name)
+		else:
+			shmDir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+			fd, name = tempfile.mkstemp(prefix="SignalHound-ring-", dir=shmDir)
+			try:
+				os.ftruncate(fd, size)
+				mapping = mmap.mmap(fd, size)
+			finally:
+				os.close(fd)
+
+		control = np.frombuffer(mapping, dtype=np.int64, count=cls._CONTROL_LEN)
+		control[:4] = (numSlots, rowLen, numArrays, numConsumers)
+		control[cls._DROP_OLDEST] = dropOldest
+		del control
+		return cls(name, mapping, owner=True)
+
+	@classmethod
+	def attach(cls, name):
+		'''
+		Map the ring created (in any process) as ``name``.
+		'''
+		if sys.platform == "win32":
+			# A named mapping has to be mapped with its size, which is in the control block at its start.
+			probe = mmap.mmap(-1, 8 * cls._CONTROL_LEN, tagname=name)
+			try:
+				numSlots, rowLen, numArrays, numConsumers = struct.unpack_from("4q", probe)
+			finally:
+				probe.close()
+			# Mapping a tag nobody holds any more creates a new, zeroed, mapping.
+			if not numSlots:
+				raise IOError("No ring named %s. Has every process that mapped it exited?" % name)
+			mapping = mmap.mmap(-1, cls._size(numSlots, rowLen, numArrays, numConsumers), tagname=name)
+			return cls(name, mapping)
+
+		with open(name, "r+b") as fp:
+			mapping = mmap.mmap(fp.fileno(), 0)
+		return cls(name, mapping)
+
+	@property
+	def written(self):
+		return int(self.control[self._WRITTEN])
+
+	@property
+	def dropped(self):
+		return int(self.control[self._DROPPED])
+
+	@property
+	def closed(self):
+		return bool(self.control[self._CLOSED])
+
+	def put(self, timestamp, startFreq, binSize, count, *arrays):
+		'''
+		Copy a row of up to ``numArrays`` arrays, all the same length, into the next free slot and publish it.
+
+		Returns:
+			``True``, or ``False`` if the row was dropped because a consumer is ``numSlots`` rows behind. Always
+			``True`` for a ``dropOldest`` ring.
+		'''
+		written = self.control[self._WRITTEN]
+		if written - self.cursors.min() >= self.numSlots:
+			self.control[self._DROPPED] += 1
+			if not self.dropOldest:
+				return False
+
+		length = arrays[0].shape[0]
+		if length > self.rowLen or len(arrays) > self.numArrays:
+			raise ValueError("Row of %s x %s bins doesn't fit in the ring's %s x %s bin slots!" % (len(arrays), length, self.numArrays, self.rowLen))
+
+		slot = written % self.numSlots
+		# Mark the slot as being rewritten, so a consumer still holding the old row can tell.
+		self.sequence[slot] = -1
+		for index, arr in enumerate(arrays):
+			self.data[slot, index, :length] = arr
+		self.header[slot] = (timestamp, startFreq, binSize, count)
+		self.lengths[slot] = length
+		self.sequence[slot] = written
+
+		# Publish last, so consumers never see a half-written slot.
+		self.control[self._WRITTEN] = written + 1
+		return True
+
+	def available(self, consumer=0):
+		'''
+		Number of rows ``consumer`` hasn't released yet (and that are still in the ring).
+		'''
+		return int(min(self.control[self._WRITTEN] - self.cursors[consumer], self.numSlots))
+
+	def get(self, consumer=0, timeout=None):
+		'''
+		Wait up to ``timeout`` seconds (forever if ``None``) for the oldest row ``consumer`` hasn't released.
+
+		Returns:
+			``(timestamp, startFreq, binSize, count, arrays)``, where ``arrays`` is a ``(numArrays, length)`` view
+			into the ring that stays valid until ``release()``, or ``None`` on timeout or if the ring has been
+			closed and drained.
+		'''
+		deadline = None if timeout is None else time.time() + timeout
+		delay = 0.0001
+		while True:
+			read = self.cursors[consumer]
+			written = self.control[self._WRITTEN]
+			if written - read > self.numSlots:
+				# Our oldest rows have been overwritten (only in a dropOldest ring). Skip to the oldest one left.
+				self.cursors[consumer] = written - self.numSlots
+				continue
+			if written != read:
+				slot = read % self.numSlots
+				if self.sequence[slot] == read:
+					break
+				# It's being overwritten as we speak.
+				self.cursors[consumer] = read + 1
+				continue
+
+			if self.control[self._CLOSED]:
+				return None
+			if deadline is not None and time.time() >= deadline:
+				return None
+			# There's nothing to block on across processes, so back off up to a millisecond between checks.
+			time.sleep(delay)
+			delay = min(delay * 2, 0.001)
+
+		timestamp, startFreq, binSize, count = self.header[slot]
+		return timestamp, startFreq, binSize, int(count), self.data[slot, :, :self.lengths[slot]]
+
+	def release(self, consumer=0):
+		'''
+		Hand the row returned by ``consumer``'s last ``get()`` back to the producer.
+
+		Returns:
+			``True``, or ``False`` if the producer overwrote the row while ``consumer`` had it (only possible in a
+			``dropOldest`` ring), in which case whatever was read from it may be a mix of the old and new rows.
+		'''
+		read = self.cursors[consumer]
+		intact = self.sequence[read % self.numSlots] == read
+		self.cursors[consumer] = read + 1
+		return bool(intact)
+
+	def notify(self, consumer=0):
+		'''
+		Producer side of the new-row notices. Call after ``put()``.
+
+		Returns:
+			``True`` if ``consumer`` should be sent a notice, i.e. it has cleared the last one. ``False`` if a
+			notice is still outstanding, in which case it'll find the new row when it drains the ring.
+		'''
+		if self.notices[consumer]:
+			return False
+		self.notices[consumer] = 1
+		return True
+
+	def clearNotice(self, consumer=0):
+		'''
+		Consumer side of the new-row notices. Call on getting a notice, before draining the ring, so a row put
+		during the drain gets a new notice.
+		'''
+		self.notices[consumer] = 0
+
+	def rows(self, consumer=0, timeout=None):
+		'''
+		Iterate over ``consumer``'s rows, as ``get()``, releasing each when the iterator is advanced. Stops when the
+		ring is closed and drained, or if no row arrives within ``timeout`` seconds.
+		'''
+		while True:
+			row = self.get(consumer, timeout)
+			if row is None:
+				return
+			try:
+				yield row
+			finally:
+				self.release(consumer)
+
+	def close(self):
+		'''
+		Tell the consumers no more rows are coming.
+		'''
+		self.control[self._CLOSED] = 1
+
+	def unlink(self):
+		'''
+		Remove the ring's name, so it's freed once every process has dropped its mapping. Processes that have
+		already attached keep working.
+
+		A no-op on Windows, where the named mapping has no file behind it, and is freed with the last mapping of it
+		anyway.
+		'''
+		if sys.platform == "win32":
+			return
+		try:
+			os.unlink(self.name)
+		except OSError:
+			pass
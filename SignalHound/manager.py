@@ -0,0 +1,274 @@
+# -*- coding: UTF-8 -*-
+
+# Parallel acquisition across several devices.
+#
+# Each device gets its own worker process, so the fetches (and whatever python work goes with them) don't contend
+# for one GIL, and the aggregate sweep rate scales with the number of devices. The workers send their sweeps to the
+# parent over one queue, and the parent merges them back into timestamp order.
+
+import collections
+import logging
+import multiprocessing as mp
+import time
+import traceback
+
+try:
+	import queue
+except ImportError:
+	import Queue as queue
+
+from . import SignalHound, AcquisitionError
+
+
+def enumerateDevices(dllFactory=None):
+	'''
+	Args:
+		dllFactory: Optional callable returning the ``dll`` object to pass to ``SignalHound()`` (e.g. a
+			``bb_sim.SimulatedBBApi`` with several devices).
+
+	Returns:
+		The serial numbers of every device not currently open in another process.
+	'''
+	sh = SignalHound(dll=dllFactory() if dllFactory else None)
+	try:
+		return sh.listSerialNumbers()
+	finally:
+		sh.closeDevice()
+
+
+def _deviceWorker(serial, configure, dllFactory, outQueue, stopEvent, openLock, counters):
+	'''
+	Worker process body. Opens the device with serial number ``serial``, hands it to ``configure``, then fetches
+	sweeps onto ``outQueue`` until ``stopEvent`` is set.
+	'''
+
+	log = logging.getLogger("Main.DeviceManager.%s" % serial)
+	sweeps, dropped, errors = counters
+
+	def openDevice():
+		# Opening by serial number briefly opens the other devices, so only one worker can be doing it at a time.
+		with openLock:
+			sh = SignalHound(dll=dllFactory() if dllFactory else None, serial=serial)
+		configure(sh, serial)
+		return sh
+
+	sh = openDevice()
+	log.info("Worker for device %s running", serial)
+
+	while not stopEvent.is_set():
+		try:
+			# The queue pickles the trace from a feeder thread, after put() returns, so it has to be a copy.
+			trace = sh.fetchTrace(copy=True)["max"]
+			timestamp = time.time()
+			traceInfo = sh.queryTraceInfo()
+
+			try:
+				outQueue.put_nowait((serial, timestamp, traceInfo["ret-start-freq"], traceInfo["arr-bin-size"], trace))
+				sweeps.value += 1
+			except queue.Full:
+				dropped.value += 1
+
+		except AcquisitionError as e:
+			log.warning("Device %s dropped sweep: %s", serial, e)
+			errors.value += 1
+
+		except Exception:
+			log.error("Error in worker for device %s!", serial)
+			log.error(traceback.format_exc())
+			errors.value += 1
+
+			sh.forceClose()
+			del sh
+			time.sleep(1)
+			log.error("Re-opening device %s", serial)
+			sh = openDevice()
+
+	sh.abort()
+	sh.closeDevice()
+
+	# Don't hang on exit if the parent stopped draining the queue.
+	outQueue.cancel_join_thread()
+	log.info("Worker for device %s exiting", serial)
+
+
+class DeviceManager(object):
+	'''
+	Runs a set of devices in parallel, one worker process per device, and merges their sweeps into one
+	timestamp-ordered stream.
+
+		>>> mgr = DeviceManager(configure=configureBand)
+		>>> mgr.start()
+		>>> for serial, timestamp, startFreq, binSize, trace in mgr.sweeps(timeout=5):
+		...     process(serial, trace)
+		>>> mgr.stop()
+
+	``configure(sh, serial)`` is called in each worker with the opened ``SignalHound``, and must configure and
+	``initiate()`` it in a trace mode. That's where per-device settings (e.g. which band each device covers) go.
+	It, and ``dllFactory``, must be picklable (module-level functions, or ``functools.partial`` of them), as the
+	workers may be started with "spawn".
+
+	If a worker can't put a sweep on the output queue because the consumer has fallen ``queueDepth`` sweeps
+	behind, the sweep is dropped and counted, rather than stalling the device.
+
+	Args:
+		configure: Callable that configures and initiates each device.
+		serials: Serial numbers of the devices to run. Defaults to every device found by ``enumerateDevices()``.
+		dllFactory: Optional callable returning the ``dll`` object each worker passes to ``SignalHound()``.
+		queueDepth (int): Maximum number of sweeps waiting in the output queue.
+		alignWindow (float): How long, in seconds, ``sweeps()`` holds back the merged stream waiting for a device
+			that hasn't delivered a sweep, before assuming it's stalled and moving on without it.
+	'''
+
+	def __init__(self, configure, serials=None, dllFactory=None, queueDepth=256, alignWindow=0.5):
+		self.log = logging.getLogger("Main.DeviceManager")
+
+		self.configure = configure
+		self.serials = list(serials) if serials is not None else None
+		self.dllFactory = dllFactory
+		self.queueDepth = queueDepth
+		self.alignWindow = alignWindow
+
+		self.workers = {}
+		self.counters = {}
+		self.outQueue = None
+		self.stopEvent = None
+		self.startTime = None
+		self.stopTime = None
+
+	def start(self):
+		'''
+		Enumerate the devices (unless ``serials`` was given), and start a worker process for each.
+		'''
+
+		if self.serials is None:
+			self.serials = enumerateDevices(self.dllFactory)
+		if not self.serials:
+			raise ValueError("No devices to run!")
+
+		self.log.info("Starting workers for devices %s", self.serials)
+
+		self.outQueue = mp.Queue(self.queueDepth)
+		self.stopEvent = mp.Event()
+		openLock = mp.Lock()
+
+		for serial in self.serials:
+			counters = (mp.RawValue("L", 0), mp.RawValue("L", 0), mp.RawValue("L", 0))
+			worker = mp.Process(target=_deviceWorker, name="SignalHound-%s" % serial,
+								args=(serial, self.configure, self.dllFactory, self.outQueue, self.stopEvent, openLock, counters))
+			worker.daemon = True
+			worker.start()
+
+			self.workers[serial] = worker
+			self.counters[serial] = counters
+
+		self.startTime = time.time()
+		self.stopTime = None
+
+	def stop(self, timeout=5):
+		'''
+		Stop the workers, waiting up to ``timeout`` seconds for each to close its device.
+
+		Returns:
+			The final ``stats()``.
+		'''
+
+		if self.stopEvent is None:
+			return None
+
+		self.stopEvent.set()
+		for serial, worker in self.workers.items():
+			deadline = time.time() + timeout
+			while worker.is_alive() and time.time() < deadline:
+				# Keep draining, so a worker blocked on the queue's feeder thread can exit.
+				self._drain()
+				worker.join(0.05)
+			if worker.is_alive():
+				self.log.error("Worker for device %s didn't stop. Terminating it.", serial)
+				worker.terminate()
+
+		self.stopTime = time.time()
+		stats = self.stats()
+		self.log.info("Stopped %s workers. Aggregate sweep rate %0.1f sweeps/sec.", len(self.workers), stats["sweep-rate"])
+		return stats
+
+	def _drain(self):
+		try:
+			while True:
+				self.outQueue.get_nowait()
+		except queue.Empty:
+			pass
+
+	def sweeps(self, timeout=None):
+		'''
+		Args:
+			timeout (float): Stop if no sweep arrives from any device for this many seconds. Defaults to waiting
+				forever (or until ``stop()``).
+
+		Iterate over the sweeps from every device, merged in timestamp order. Yields
+		``(serial, timestamp, startFreq, binSize, trace)`` tuples.
+
+		A sweep is only released once every device has delivered a later one (or the ``alignWindow`` has passed),
+		so the stream is in order across devices, at the cost of roughly one sweep period of latency.
+		'''
+
+		buffered = dict((serial, collections.deque()) for serial in self.serials)
+		lastArrival = time.time()
+
+		while True:
+			try:
+				item = self.outQueue.get(timeout=self.alignWindow)
+				buffered[item[0]].append(item)
+				lastArrival = time.time()
+			except queue.Empty:
+				if self.stopEvent.is_set():
+					return
+				if timeout is not None and time.time() - lastArrival > timeout:
+					return
+
+			now = time.time()
+			while True:
+				heads = [pending[0] for pending in buffered.values() if pending]
+				if not heads:
+					break
+				oldest = min(heads, key=lambda head: head[1])
+				if len(heads) < len(buffered) and now - oldest[1] < self.alignWindow:
+					break
+				buffered[oldest[0]].popleft()
+				yield oldest
+
+	def stats(self):
+		'''
+		Returns:
+			dictionary with the aggregate counters, and the per-device counters under ``"devices"``:
+				"sweeps"      : Sweeps delivered to the output queue.
+				"dropped"     : Sweeps dropped because the output queue was full.
+				"errors"      : Acquisition errors (each costs a sweep, or a device restart).
+				"sweep-rate"  : Delivered sweeps per second.
+				"elapsed"     : Seconds since ``start()``.
+			Per-device entries also have ``"alive"``, whether the worker process is running.
+		'''
+
+		if self.startTime is None:
+			elapsed = 0.0
+		else:
+			elapsed = (self.stopTime or time.time()) - self.startTime
+
+		devices = {}
+		for serial, (sweeps, dropped, errors) in self.counters.items():
+			devices[serial] = {
+				"sweeps"     : sweeps.value,
+				"dropped"    : dropped.value,
+				"errors"     : errors.value,
+				"sweep-rate" : sweeps.value / elapsed if elapsed else 0.0,
+				"alive"      : self.workers[serial].is_alive()
+			}
+
+		total = sum(dev["sweeps"] for dev in devices.values())
+		return {
+			"devices"    : devices,
+			"sweeps"     : total,
+			"dropped"    : sum(dev["dropped"] for dev in devices.values()),
+			"errors"     : sum(dev["errors"] for dev in devices.values()),
+			"sweep-rate" : total / elapsed if elapsed else 0.0,
+			"elapsed"    : elapsed
+		}
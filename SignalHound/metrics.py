@@ -0,0 +1,158 @@
+# -*- coding: UTF-8 -*-
+
+# Lightweight performance counters for the acquisition paths.
+#
+# Everything here is updated from the hot paths, so recording a value is a couple of arithmetic operations
+# and a list index, with no allocation.
+
+import bisect
+import contextlib
+import math
+import time
+
+
+class LatencyHistogram(object):
+	'''
+	Histogram of durations in seconds, in logarithmically spaced bins (``binsPerDecade`` per decade, from
+	``minValue`` to ``maxValue``). Values outside the range land in the first or last bin.
+
+	Attributes:
+		edges: Upper edge of each bin.
+		counts: Number of values recorded in each bin.
+		count: Total number of values recorded.
+		total: Sum of the recorded values.
+		min: Smallest recorded value.
+		max: Largest recorded value.
+	'''
+
+	def __init__(self, minValue=1e-4, maxValue=10.0, binsPerDecade=10):
+		decades = math.log10(maxValue / minValue)
+		numBins = int(math.ceil(decades * binsPerDecade))
+		self.edges = [minValue * 10 ** ((x + 1) / float(binsPerDecade)) for x in range(numBins)]
+
+		self.reset()
+
+	def reset(self):
+		self.counts = [0] * len(self.edges)
+		self.count = 0
+		self.total = 0.0
+		self.min = None
+		self.max = None
+
+	def add(self, value):
+		index = bisect.bisect_left(self.edges, value)
+		self.counts[min(index, len(self.counts) - 1)] += 1
+
+		self.count += 1
+		self.total += value
+		if self.min is None or value < self.min:
+			self.min = value
+		if self.max is None or value > self.max:
+			self.max = value
+
+	def percentile(self, pct):
+		'''
+		Approximate ``pct`` percentile (0-100), as the upper edge of the bin it falls in. ``None`` if empty.
+		'''
+		if not self.count:
+			return None
+
+		target = self.count * pct / 100.0
+		seen = 0
+		for edge, binCount in zip(self.edges, self.counts):
+			seen += binCount
+			if seen >= target:
+				return min(edge, self.max)
+		return self.max
+
+	def summary(self):
+		'''
+		Returns:
+			dictionary with the ``count``, ``mean``, ``min``, ``max``, and the approximate ``p50``, ``p90`` and
+			``p99`` of the recorded values, in seconds.
+		'''
+		return {
+			"count" : self.count,
+			"mean"  : self.total / self.count if self.count else None,
+			"min"   : self.min,
+			"max"   : self.max,
+			"p50"   : self.percentile(50),
+			"p90"   : self.percentile(90),
+			"p99"   : self.percentile(99)
+		}
+
+
+class AcquisitionMetrics(object):
+	'''
+	Where an acquisition loop's wall-clock time goes: fetching sweeps, processing them, and the dead time lost to
+	retunes, recalibrations, diagnostics readouts and device resets. Everything accumulates from construction (or the last ``reset()``).
+
+		>>> metrics = AcquisitionMetrics()
+		>>> fetchStart = time.time()
+		>>> trace = sh.fetchTrace()
+		>>> metrics.add("fetch", time.time() - fetchStart)
+		>>> ...
+		>>> with metrics.timing("recal"):
+		...     sh.selfCal()
+		>>> metrics.summary()["duty-cycle"]
+
+	With the fetch in another thread (``startBackgroundAcquisition(metrics=...)``), the fetch and processing times
+	overlap, so they can add up to more than the elapsed time.
+
+	Attributes:
+		sweeps: Number of sweeps processed. Incremented by the caller.
+		time: Seconds spent on each of ``categories``.
+		count: Number of times each of ``categories`` was recorded.
+	'''
+
+	#: What the time can be spent on
+	categories = ("fetch", "process", "retune", "recal", "diagnostics", "reset")
+
+	def __init__(self):
+		self.reset()
+
+	def reset(self):
+		self.startTime = time.time()
+		self.sweeps = 0
+		self.time = dict((name, 0.0) for name in self.categories)
+		self.count = dict((name, 0) for name in self.categories)
+
+	def add(self, category, seconds):
+		self.time[category] += seconds
+		self.count[category] += 1
+
+	@contextlib.contextmanager
+	def timing(self, category):
+		'''
+		Context manager recording the time spent in its body under ``category``, even if it raises.
+		'''
+		start = time.time()
+		try:
+			yield
+		finally:
+			self.add(category, time.time() - start)
+
+	def summary(self):
+		'''
+		Returns:
+			dictionary of:
+				"elapsed"      : Seconds since the last ``reset()``.
+				"sweeps"       : Sweeps processed.
+				"sweep-rate"   : Sweeps per second.
+				"<x>-time"     : Seconds spent on each of ``categories`` (``fetch-time``, ``retune-time``, etc).
+				"<x>-count"    : Number of times each of ``categories`` was recorded.
+				"dead-time"    : Seconds lost to retunes, recalibrations, diagnostics and resets.
+				"duty-cycle"   : ``fetch-time / elapsed``, the fraction of the time the device was delivering sweeps.
+		'''
+		elapsed = time.time() - self.startTime
+		ret = {
+			"elapsed"    : elapsed,
+			"sweeps"     : self.sweeps,
+			"sweep-rate" : self.sweeps / elapsed if elapsed else 0.0,
+			"dead-time"  : self.time["retune"] + self.time["recal"] + self.time["diagnostics"] + self.time["reset"],
+			"duty-cycle" : self.time["fetch"] / elapsed if elapsed else 0.0
+		}
+		for name in self.categories:
+			ret[name + "-time"] = self.time[name]
+			ret[name + "-count"] = self.count[name]
+		return ret
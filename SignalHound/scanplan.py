@@ -0,0 +1,370 @@
+# -*- coding: UTF-8 -*-
+
+# Scan plans for covering several frequency ranges with real-time acquisitions.
+#
+# A real-time acquisition covers one IF-width window. To watch a set of ranges wider than that, the
+# acquisition loop steps a window across them. compilePlan() works out which windows to use, how long to
+# dwell on each, and in what order to visit them; the loop then just executes the resulting ScanPlan.
+# AdaptiveDwell then adjusts the dwells at run time, based on what each window actually sees.
+
+import math
+
+import numpy as np
+
+from . import bb_api_h as hf
+
+
+class ScanWindow(object):
+	'''
+	One real-time acquisition window of a ``ScanPlan``.
+
+	Attributes:
+		center: Center frequency to tune to.
+		span: Span to acquire.
+		dwell: Number of sweeps to acquire before moving on.
+		covers: List of ``(start, stop)`` frequency ranges this window is responsible for. These are within the
+			window's usable band (unless the window was shifted to stay inside the device's frequency range),
+			but the window acquires the full ``span``.
+		weight: Largest dwell weight of the ranges this window covers.
+	'''
+
+	def __init__(self, center, span, dwell, covers, weight):
+		self.center = center
+		self.span = span
+		self.dwell = dwell
+		self.covers = covers
+		self.weight = weight
+
+	def __repr__(self):
+		return "<ScanWindow: %0.6g Hz +- %0.6g Hz, %s sweeps, covers %s>" % (self.center, self.span / 2, self.dwell, self.covers)
+
+
+class ScanPlan(object):
+	'''
+	An ordered list of ``ScanWindow``, executed cyclically.
+
+	Windows are in ascending frequency order. Visiting points on a line in sorted order, and jumping back
+	from the last to the first, is the shortest tour that visits each once per cycle, so it minimizes both the
+	number of retunes and the total retune distance.
+
+	Attributes:
+		windows: The ``ScanWindow`` list.
+	'''
+
+	def __init__(self, windows):
+		self.windows = windows
+
+	def __len__(self):
+		return len(self.windows)
+
+	def __iter__(self):
+		return iter(self.windows)
+
+	def __getitem__(self, index):
+		return self.windows[index]
+
+	def cycle(self):
+		'''
+		Iterate over the windows forever, in plan order.
+		'''
+		while True:
+			for window in self.windows:
+				yield window
+
+	def retuneDistance(self):
+		'''
+		Total frequency distance retuned over one cycle, including the jump back to the first window.
+		'''
+		if len(self.windows) < 2:
+			return 0.0
+		return 2 * (self.windows[-1].center - self.windows[0].center)
+
+	def summary(self, sweepTime=None, retuneTime=0.0):
+		'''
+		Args:
+			sweepTime (float): Seconds per sweep. If given, the revisit time is estimated too.
+			retuneTime (float): Seconds lost per retune, for the revisit time estimate.
+
+		Returns:
+			dictionary with the number of ``windows``, the ``retunes`` and ``sweeps`` per cycle, the
+			``retune-distance`` per cycle in Hz, the total ``covered`` bandwidth in Hz, and, if ``sweepTime`` is
+			given, the estimated ``revisit-time`` (seconds per cycle).
+		'''
+		sweeps = sum(window.dwell for window in self.windows)
+		retunes = len(self.windows) if len(self.windows) > 1 else 0
+		ret = {
+			"windows"         : len(self.windows),
+			"retunes"         : retunes,
+			"sweeps"          : sweeps,
+			"retune-distance" : self.retuneDistance(),
+			"covered"         : sum(stop - start for window in self.windows for start, stop in window.covers)
+		}
+		if sweepTime is not None:
+			ret["revisit-time"] = sweeps * sweepTime + retunes * retuneTime
+		return ret
+
+
+def _subtractExclusions(ranges, exclude):
+	'''
+	Remove the ``exclude`` ranges from ``(start, stop, weight)`` ranges, and merge what's left into sorted,
+	non-overlapping ranges (overlaps take the larger weight).
+	'''
+	pieces = []
+	for start, stop, weight in ranges:
+		remaining = [(start, stop)]
+		for exStart, exStop in exclude:
+			clipped = []
+			for pStart, pStop in remaining:
+				if exStop <= pStart or exStart >= pStop:
+					clipped.append((pStart, pStop))
+					continue
+				if pStart < exStart:
+					clipped.append((pStart, exStart))
+				if exStop < pStop:
+					clipped.append((exStop, pStop))
+			remaining = clipped
+		pieces.extend((pStart, pStop, weight) for pStart, pStop in remaining)
+
+	# Split at every boundary so each elementary piece has a single weight, then merge identical neighbours.
+	edges = sorted(set([piece[0] for piece in pieces] + [piece[1] for piece in pieces]))
+	merged = []
+	for start, stop in zip(edges[:-1], edges[1:]):
+		weights = [weight for pStart, pStop, weight in pieces if pStart <= start and stop <= pStop]
+		if not weights:
+			continue
+		weight = max(weights)
+		if merged and merged[-1][1] == start and merged[-1][2] == weight:
+			merged[-1] = (merged[-1][0], stop, weight)
+		else:
+			merged.append((start, stop, weight))
+	return merged
+
+
+def compilePlan(ranges, exclude=(), windowWidth=hf.BB60C_MAX_RT_SPAN, overlap=0.0, dwell=1, minFreq=hf.BB60_MIN_FREQ, maxFreq=hf.BB60_MAX_FREQ):
+	'''
+	Args:
+		ranges: List of ``(start, stop)`` or ``(start, stop, weight)`` frequency ranges to cover, in Hz. Weights
+			scale the dwell of the windows covering that range (default 1).
+		exclude: List of ``(start, stop)`` ranges that don't need to be covered.
+		windowWidth (float): Span of each real-time acquisition.
+		overlap (float): Fraction (0-1) of each window to leave as margin, so only the middle
+			``windowWidth * (1 - overlap)`` of each acquisition is relied on. Neighbouring windows overlap by
+			this fraction, as the evenly spaced plan does.
+		dwell (int): Sweeps per window at weight 1.
+		minFreq (float): Lowest frequency a window may extend to.
+		maxFreq (float): Highest frequency a window may extend to.
+
+	Returns:
+		A ``ScanPlan``.
+
+	Computes the fewest windows that cover every range of interest with their usable band. Windows are
+	placed greedily from the lowest uncovered frequency, which is optimal for covering intervals on a line
+	with fixed-width windows. Gaps between ranges (including excluded zones) are skipped, rather than stepped
+	across, and each window is centered on the part of the ranges it actually covers, so a narrow range
+	sits in the middle of the IF.
+
+	Raises ``ValueError`` if there is nothing to cover, or the parameters are inconsistent.
+	'''
+
+	if not 0 <= overlap < 1:
+		raise ValueError("Window overlap must be in the range 0-1. Passed value was %s." % overlap)
+
+	usable = windowWidth * (1 - overlap)
+
+	normalized = []
+	for item in ranges:
+		start, stop = item[0], item[1]
+		weight = item[2] if len(item) > 2 else 1.0
+		if stop <= start:
+			raise ValueError("Scan range (%s, %s) is empty!" % (start, stop))
+		if weight <= 0:
+			raise ValueError("Scan range (%s, %s) has non-positive dwell weight %s!" % (start, stop, weight))
+		normalized.append((max(start, minFreq), min(stop, maxFreq), weight))
+
+	pieces = _subtractExclusions([piece for piece in normalized if piece[1] > piece[0]], exclude)
+	if not pieces:
+		raise ValueError("Nothing to scan! Every range is empty or excluded.")
+
+	windows = []
+	index = 0
+	pos = pieces[0][0]
+	while index < len(pieces):
+		# This window is responsible for [pos, pos + usable). Collect the pieces (or parts of them) inside that.
+		limit = pos + usable
+		covers = []
+		weight = 0
+		while index < len(pieces) and pieces[index][0] < limit:
+			start, stop, pieceWeight = pieces[index]
+			start = max(start, pos)
+			covers.append((start, min(stop, limit)))
+			weight = max(weight, pieceWeight)
+			if stop > limit:
+				break
+			index += 1
+
+		lowest, highest = covers[0][0], covers[-1][1]
+		center = (lowest + highest) / 2.0
+
+		# Keep the full acquisition inside the device's range.
+		center = min(max(center, minFreq + windowWidth / 2.0), maxFreq - windowWidth / 2.0)
+
+		windows.append(ScanWindow(center, windowWidth, max(1, int(round(dwell * weight))), covers, weight))
+
+		if index < len(pieces):
+			pos = max(limit, pieces[index][0])
+
+	return ScanPlan(windows)
+
+
+def evenPlan(center, span, windowWidth=hf.BB60C_MAX_RT_SPAN, overlap=0.0, dwell=1):
+	'''
+	The evenly spaced plan ``InternalSweepAcqThread`` originally used: ``round(span / usable width)`` windows
+	stepping by the usable width, centered on ``center``. Kept for comparison with ``compilePlan()``.
+	'''
+	step = windowWidth * (1 - overlap)
+	steps = int(span / step + 0.5)
+	base = center - (step * steps / 2 + step / 2)
+
+	windows = []
+	for x in range(1, steps + 1):
+		windowCenter = base + x * step
+		windows.append(ScanWindow(windowCenter, windowWidth, dwell, [(windowCenter - step / 2, windowCenter + step / 2)], 1.0))
+	return ScanPlan(windows)
+
+
+def _allocate(budget, weights, lo, hi):
+	'''
+	Split ``budget`` sweeps in proportion to ``weights``, with each share clamped to ``lo``-``hi``. Shares that hit
+	a clamp are fixed there, and the rest of the budget is re-split among the others.
+	'''
+	shares = [None] * len(weights)
+	free = list(range(len(weights)))
+	remaining = float(budget)
+
+	while free:
+		total = sum(weights[x] for x in free)
+		proposed = dict((x, remaining * weights[x] / total) for x in free)
+
+		clamped = [x for x in free if proposed[x] < lo or proposed[x] > hi]
+		if not clamped:
+			for x in free:
+				shares[x] = proposed[x]
+			break
+
+		for x in clamped:
+			shares[x] = lo if proposed[x] < lo else hi
+			remaining -= shares[x]
+		free = [x for x in free if x not in clamped]
+
+	return [max(1, int(round(share))) for share in shares]
+
+
+class AdaptiveDwell(object):
+	'''
+	Reallocates the dwell of a ``ScanPlan``'s windows toward the windows where something is happening.
+
+	While a window is being acquired, feed each sweep to ``addSweep()``, which keeps a running sum and a peak-hold
+	(two vector operations per sweep). At the end of the visit, ``endVisit()`` scores the window's activity,
+	and re-splits the plan's total dwell in proportion to ``plan weight * (1 + activity)``, within
+	``minDwell``-``maxDwell`` sweeps per window.
+
+	A window's activity is how far its strongest bin stands out from the window's own noise floor, in robust
+	standard deviations (median absolute deviation), less what the strongest of that many bins of pure noise
+	would reach. It's taken from both the average and the peak-hold, so steady carriers and bursts both count.
+	Being relative to the window's own floor, it doesn't depend on the trace units. Scores are smoothed across
+	visits with an exponential moving average, so one burst doesn't swing the schedule.
+
+	Args:
+		plan (ScanPlan): The plan to adjust. Window dwells are modified in place.
+		minDwell (int): Fewest sweeps any window gets per visit.
+		maxDwell (int): Most sweeps any window gets per visit.
+		maxRevisit (float): Optional upper bound on the time to cycle through the plan, in seconds, which bounds how
+			long any window goes unobserved. Needs ``sweepTime``.
+		sweepTime (float): Seconds per sweep.
+		smoothing (float): Weight (0-1) of the newest visit in the activity average.
+
+	Attributes:
+		activity: Smoothed activity score of each window, in plan order.
+		budget: Total sweeps per cycle being shared out.
+	'''
+
+	def __init__(self, plan, minDwell, maxDwell, maxRevisit=None, sweepTime=None, smoothing=0.3):
+		if minDwell > maxDwell:
+			raise ValueError("Minimum dwell (%s) is larger than the maximum dwell (%s)!" % (minDwell, maxDwell))
+
+		self.plan = plan
+		self.minDwell = minDwell
+		self.maxDwell = maxDwell
+		self.smoothing = smoothing
+
+		self.budget = sum(window.dwell for window in plan)
+		if maxRevisit is not None:
+			if not sweepTime:
+				raise ValueError("A maximum revisit time needs the sweep time!")
+			self.budget = min(self.budget, int(maxRevisit / sweepTime))
+		self.budget = min(max(self.budget, minDwell * len(plan)), maxDwell * len(plan))
+
+		self.activity = [0.0] * len(plan)
+
+		self.visitSum = None
+		self.visitPeak = None
+		self.visitSweeps = 0
+
+		self.reallocate()
+
+	def startVisit(self):
+		'''
+		Discard anything accumulated for the current visit.
+		'''
+		self.visitSweeps = 0
+
+	def addSweep(self, trace):
+		if self.visitSum is None or self.visitSum.shape != trace.shape:
+			self.visitSum = np.zeros(trace.shape, dtype=np.double)
+			self.visitPeak = np.empty(trace.shape, dtype=np.double)
+			self.visitSweeps = 0
+
+		if self.visitSweeps:
+			np.add(self.visitSum, trace, out=self.visitSum)
+			np.maximum(self.visitPeak, trace, out=self.visitPeak)
+		else:
+			self.visitSum[:] = trace
+			self.visitPeak[:] = trace
+		self.visitSweeps += 1
+
+	@staticmethod
+	def _excess(arr):
+		floor = np.median(arr)
+		spread = np.median(np.abs(arr - floor)) * 1.4826
+		if spread <= 0:
+			return 0.0
+		return (arr.max() - floor) / spread
+
+	def endVisit(self, window):
+		'''
+		Score the visit to ``window`` that just finished, and reallocate the dwells.
+
+		Returns:
+			The visit's (unsmoothed) activity score, or ``None`` if no sweeps were added.
+		'''
+		if not self.visitSweeps:
+			return None
+
+		average = self.visitSum / self.visitSweeps
+		excess = max(self._excess(average), self._excess(self.visitPeak))
+
+		# The strongest of N independent gaussian noise bins is about sqrt(2 ln N) standard deviations out.
+		noiseExcess = math.sqrt(2 * math.log(max(average.shape[0], 2)))
+		score = max(0.0, float(excess) - noiseExcess)
+
+		index = self.plan.windows.index(window)
+		self.activity[index] += self.smoothing * (score - self.activity[index])
+		self.visitSweeps = 0
+
+		self.reallocate()
+		return score
+
+	def reallocate(self):
+		weights = [window.weight * (1 + activity) for window, activity in zip(self.plan, self.activity)]
+		for window, dwell in zip(self.plan, _allocate(self.budget, weights, self.minDwell, self.maxDwell)):
+			window.dwell = dwell
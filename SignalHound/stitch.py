@@ -0,0 +1,140 @@
+# -*- coding: UTF-8 -*-
+
+# Stitching of the overlapping real-time windows of a ScanPlan into one wide spectrum.
+#
+# Each window's trace is placed on a fixed frequency grid covering the whole plan, through an index map worked
+# out once per window. Where windows overlap, they're cross-faded, so each bin is dominated by the window that
+# has it nearest its middle, and the roll-off at the IF edges doesn't show up in the result.
+
+import numpy as np
+
+
+class SpectrumStitcher(object):
+	'''
+	Assembles the traces of one pass over a ``ScanPlan`` into a single spectrum on a fixed grid.
+
+		>>> stitcher = SpectrumStitcher(plan, binSize=traceInfo["arr-bin-size"], overlap=0.5)
+		>>> for startFreq, binSize, sweeps, trace in windowAverages:
+		...     finished = stitcher.add(startFreq, binSize, sweeps, trace)
+		...     if finished is not None:
+		...         sweeps, spectrum = finished
+
+	The grid runs from the bottom of the first window's ``covers`` to the top of the last window's, in steps of
+	``binSize``, so the margins of the outermost windows (where the IF rolls off) aren't part of it. Bins no
+	window has delivered data for are ``NaN``, so a plan with gaps between its ranges produces rows with ``NaN``
+	runs in the gaps.
+
+	Each trace is weighted by its number of sweeps, and by a raised-cosine taper that rises from the window edge
+	over its ``overlap`` margin (``span * overlap / 2`` on each side). Bins covered by several windows get the
+	weighted mean.
+
+	Attributes:
+		startFreq: Frequency of the first grid bin.
+		binSize: Grid bin spacing.
+		numBins: Number of grid bins.
+	'''
+
+	def __init__(self, plan, binSize, overlap=0.0):
+		'''
+		Args:
+			plan (ScanPlan): The plan whose passes are to be stitched.
+			binSize (float): Bin size of the traces (``queryTraceInfo()["arr-bin-size"]``). Every window of a
+				plan is acquired with the same RBW, so they share it.
+			overlap (float): The ``overlap`` the plan was compiled with, which sets the cross-fade width.
+		'''
+		if not 0 <= overlap < 1:
+			raise ValueError("Window overlap must be in the range 0-1. Passed value was %s." % overlap)
+
+		self.fadeWidth = plan[0].span * overlap / 2.0
+		self.binSize = float(binSize)
+		self.startFreq = plan[0].covers[0][0]
+		stopFreq = plan[-1].covers[-1][1]
+		self.numBins = int(np.ceil((stopFreq - self.startFreq) / self.binSize))
+
+		self.weighted = np.zeros(self.numBins)
+		self.weights = np.zeros(self.numBins)
+		self.scratch = np.empty(self.numBins)
+
+		# (startFreq, numBins) -> (gridSlice, traceSlice, taper)
+		self.maps = {}
+
+		self.lastStart = None
+		self.sweeps = 0
+
+	def _map(self, startFreq, numBins):
+		'''
+		Index map and taper for a trace of ``numBins`` bins starting at ``startFreq``. Computed on first use, and
+		cached.
+		'''
+		key = (startFreq, numBins)
+		if key not in self.maps:
+			offset = int(np.rint((startFreq - self.startFreq) / self.binSize))
+			gridLo = min(max(offset, 0), self.numBins)
+			gridHi = min(max(offset + numBins, 0), self.numBins)
+			traceSlice = slice(gridLo - offset, gridHi - offset)
+
+			# Distance of each bin's center from the nearest edge of the trace, so even the edge bins get a
+			# (small) non-zero weight.
+			edgeDistance = np.minimum(np.arange(numBins), np.arange(numBins)[::-1]) + 0.5
+			if self.fadeWidth > 0:
+				ramp = np.clip(edgeDistance * self.binSize / self.fadeWidth, 0, 1)
+				taper = np.sin(ramp * np.pi / 2) ** 2
+			else:
+				taper = np.ones(numBins)
+
+			self.maps[key] = (slice(gridLo, gridHi), traceSlice, taper[traceSlice])
+
+		return self.maps[key]
+
+	def add(self, startFreq, binSize, sweeps, trace):
+		'''
+		Args:
+			startFreq (float): Frequency of the first bin of ``trace`` (``"ret-start-freq"``).
+			binSize (float): Bin size of ``trace``.
+			sweeps (int): Number of sweeps averaged into ``trace``.
+			trace (numpy.ndarray): The window's averaged trace.
+
+		Returns:
+			``None``, or, when ``trace`` starts a new pass (its window is lower in frequency than the last one
+			added), the stitched previous pass, as ``(sweeps, spectrum)``. ``sweeps`` is the total number of
+			sweeps that went into it, and ``spectrum`` is a newly allocated array of ``numBins`` values.
+
+		Several traces for the same window in one pass (e.g. a dwell longer than the averaging interval) are
+		combined by their sweep counts.
+		'''
+		if abs(binSize - self.binSize) > self.binSize * 1e-6:
+			raise ValueError("Trace bin size %s doesn't match the stitching grid's %s!" % (binSize, self.binSize))
+
+		finished = None
+		if self.lastStart is not None and startFreq < self.lastStart:
+			finished = self.finish()
+		self.lastStart = startFreq
+
+		gridSlice, traceSlice, taper = self._map(startFreq, trace.shape[0])
+		scratch = self.scratch[gridSlice]
+		np.multiply(trace[traceSlice], taper, out=scratch)
+		scratch *= sweeps
+		self.weighted[gridSlice] += scratch
+		np.multiply(taper, sweeps, out=scratch)
+		self.weights[gridSlice] += scratch
+		self.sweeps += sweeps
+
+		return finished
+
+	def finish(self):
+		'''
+		Stitch whatever has been added since the last pass ended, and start a new pass.
+
+		Returns:
+			``(sweeps, spectrum)``, as ``add()``.
+		'''
+		with np.errstate(invalid="ignore", divide="ignore"):
+			spectrum = self.weighted / self.weights
+		spectrum[self.weights == 0] = np.nan
+		ret = (self.sweeps, spectrum)
+
+		self.weighted.fill(0)
+		self.weights.fill(0)
+		self.sweeps = 0
+		self.lastStart = None
+		return ret
@@ -0,0 +1,69 @@
+# -*- coding: UTF-8 -*-
+
+# Wrapper for Test-Equipment-Plus's "SignalHound" series of USB spectrum analysers.
+#
+# Written By Connor Wolf <wolf@imaginaryindustries.com>
+#
+
+#  * ----------------------------------------------------------------------------
+#  * "THE BEER-WARE LICENSE":
+#  * Connor Wolf <wolf@imaginaryindustries.com> wrote this file. As long as you retain
+#  * this notice you can do whatever you want with this stuff. If we meet some day,
+#  * and you think this stuff is worth it, you can buy me a beer in return.
+#  * (Only I don't drink, so a soda will do). Connor
+#  * Also, support the Signal-Hound devs. Their hardware is pretty damn awesome.
+#  * ----------------------------------------------------------------------------
+#
+
+import ctypes as ct
+import multiprocessing as mp
+
+
+# Queue messages. Rows put in the shared-memory rings are announced with a ROW_READY on the consumer's queue, so
+# consumers can block on the queue alone. SHUTDOWN wakes a consumer to tell it to stop.
+ROW_READY = {"ring-row" : True}
+SHUTDOWN  = {"shutdown" : True}
+
+class ControlBlock(object):
+	'''
+	The run/stop flags shared between the logger's processes.
+
+	Same interface as the ``Manager().Namespace()`` it replaces (``ctrlNs.run = False``, ``if ctrlNs.acqRunning:``),
+	but each flag is a byte of shared memory, so reading or setting one is a memory access rather than a round trip
+	to a manager process. Single bytes are written atomically, and each flag only ever goes from one writer's value
+	to the other, so there's no lock.
+
+	Pass it to the processes when they're created (as a ``Process`` argument), like any other shared ``ctypes``
+	object. Only the flags in ``ControlBlock.flags`` exist; setting anything else raises ``AttributeError``, rather
+	than silently creating an attribute only the setting process can see.
+	'''
+
+	#: The flags, and their initial values
+	flags = {
+		"run"        : True,
+		"acqRunning" : True,
+		"apiRunning" : True,
+		"logRunning" : True,
+		"stopped"    : False
+	}
+
+	def __init__(self):
+		self.__dict__["_values"] = dict((name, mp.RawValue(ct.c_bool, initial)) for name, initial in self.flags.items())
+
+	def __setattr__(self, name, value):
+		if name not in self.flags:
+			raise AttributeError("ControlBlock has no flag '%s'. Valid flags are %s." % (name, ", ".join(sorted(self.flags))))
+		object.__setattr__(self, name, value)
+
+
+def _flag(name):
+	def get(self):
+		return self._values[name].value
+
+	def set(self, value):
+		self._values[name].value = bool(value)
+
+	return property(get, set)
+
+for _name in ControlBlock.flags:
+	setattr(ControlBlock, _name, _flag(_name))
@@ -24,10 +24,15 @@ import traceback
 
 import numpy as np
 
+from controlBlock import ROW_READY, SHUTDOWN
+from metricsServer import startMetricsServer, snapshot
+
 # Pull in the settings crap
 from settings import ACQ_FREQ, ACQ_SPAN, ACQ_REF_LEVEL_DB, ACQ_ATTENUATION_DB, ACQ_GAIN_SETTING, ACQ_RBW, ACQ_VBW, ACQ_OVERLAP, ACQ_BIN_SAMPLES
 from settings import ACQ_SWEEP_TIME_SECONDS, ACQ_WINDOW_TYPE, ACQ_UNITS, ACQ_TYPE, ACQ_MODE, ACQ_Y_SCALE, PRINT_LOOP_CNT, CAL_CHK_LOOP_CNT
-from settings import NUM_AVERAGE
+from settings import NUM_AVERAGE, NUM_PLOT_AVERAGE, ACQ_SCAN_RANGES, ACQ_SCAN_EXCLUDE, LOG_STATISTICS, ROW_RING_SLOTS, PLOT_RING_SLOTS
+from settings import ACQ_ADAPTIVE_DWELL, ACQ_DWELL_MIN, ACQ_DWELL_MAX, ACQ_MAX_REVISIT_SECONDS, ACQ_STITCH_PASSES
+from settings import METRICS_INTERVAL, METRICS_PORT
 
 def sweepSource(dataQueues, ctrlNs, printQueue):
 	acqRunner = InternalSweepAcqThread(printQueue)
@@ -46,36 +51,67 @@ class InternalSweepAcqThread(object):
 			raise ValueError("internalSweep module only supports 'real-time-sweeping' mode! Configured mode = {mode}".format(mode=ACQ_TYPE))
 
 	def calcScanBands(self):
-		if ACQ_SPAN < IF_WIDTH:
-			raise ValueError("Scan width is smaller then the IF bandwidth!")
-		if ACQ_SPAN == IF_WIDTH:
-			raise ValueError("Scan width is exactly the IF bandwith. Maybe use the real-time mode instead?")
-
-		sweepWidth = IF_WIDTH * (1-ACQ_OVERLAP)
-		bins = ACQ_SPAN/sweepWidth
-		sweepSteps = int(bins+0.5)
-
-		effectiveScanWidth = sweepWidth*sweepSteps
-
-		self.binFreqs = []
-		baseFreq = ACQ_FREQ - (effectiveScanWidth/2 + sweepWidth/2)
-
-		for x in xrange(1, sweepSteps+1):
-			self.binFreqs.append(baseFreq+x*sweepWidth)
-
-		self.binFreqIndice = 0
-
-	def retune(self):
-		self.sh.configureCenterSpan(center = self.binFreqs[self.binFreqIndice], span = IF_WIDTH)
-		self.binFreqIndice = (self.binFreqIndice + 1) % len(self.binFreqs)
+		from SignalHound.scanplan import compilePlan, AdaptiveDwell
+
+		if ACQ_SCAN_RANGES:
+			ranges = ACQ_SCAN_RANGES
+		else:
+			if ACQ_SPAN < IF_WIDTH:
+				raise ValueError("Scan width is smaller then the IF bandwidth!")
+			if ACQ_SPAN == IF_WIDTH:
+				raise ValueError("Scan width is exactly the IF bandwith. Maybe use the real-time mode instead?")
+			ranges = [(ACQ_FREQ - ACQ_SPAN / 2, ACQ_FREQ + ACQ_SPAN / 2)]
+
+		self.plan = compilePlan(ranges, exclude = ACQ_SCAN_EXCLUDE, windowWidth = IF_WIDTH, overlap = ACQ_OVERLAP, dwell = ACQ_BIN_SAMPLES)
+		self.schedule = self.plan.cycle()
+		self.window = None
+		self.windowSweeps = 0
+
+		self.adaptive = None
+		if ACQ_ADAPTIVE_DWELL and len(self.plan) > 1:
+			self.adaptive = AdaptiveDwell(self.plan, ACQ_DWELL_MIN, ACQ_DWELL_MAX, maxRevisit = ACQ_MAX_REVISIT_SECONDS, sweepTime = ACQ_SWEEP_TIME_SECONDS)
+
+		summary = self.plan.summary(sweepTime = ACQ_SWEEP_TIME_SECONDS)
+		self.passSweeps = summary["sweeps"]
+		self.log.info("Scan plan: %s windows, %s sweeps per cycle, ~%0.1f seconds revisit time", summary["windows"], summary["sweeps"], summary["revisit-time"])
+		for window in self.plan:
+			self.log.info("	%s", window)
+
+	def nextBand(self):
+		self.window = next(self.schedule)
+		self.windowSweeps = 0
+		if self.adaptive:
+			self.adaptive.startVisit()
+		return self.window.center
+
+	def retune(self, dataQueue, recalibrate=False):
+		if self.adaptive:
+			activity = self.adaptive.endVisit(self.window)
+			self.log.info("Window %0.6g Hz activity %s. Dwells now %s", self.window.center, activity, [window.dwell for window in self.plan])
+
+		# Only the center frequency changes between bands, so skip the full reconfigure. A pending recalibration
+		# is done in the same restart, and its (stopped, restarted) times returned.
+		gap = None
+		if recalibrate:
+			gap = self.sh.recalibrate(center = self.nextBand(), span = IF_WIDTH)
+		else:
+			self.sh.retune(center = self.nextBand(), span = IF_WIDTH)
+		if len(self.plan) == 1:
+			return gap
+
+		# Note the new band in the log, without the diagnostics round-trip of getCurrentAcquisitionSettings()
+		settings = dict(self.sh.queryTraceInfo())
+		settings.update(self.sh.acq_conf)
+		dataQueue.put({"settings" : settings})
+		return gap
 
 
 	def startAcquisition(self, dataQueue, plotQueue):
 
-
+		# Configure calls that don't change anything are skipped by the wrapper, so this is cheap on a restart.
 		self.sh.configureAcquisition(ACQ_MODE, ACQ_Y_SCALE)
 
-		self.retune()
+		self.sh.configureCenterSpan(center = self.nextBand(), span = IF_WIDTH)
 
 		self.sh.configureLevel(ref = ACQ_REF_LEVEL_DB, atten = ACQ_ATTENUATION_DB)
 		self.sh.configureGain(gain = ACQ_GAIN_SETTING)
@@ -88,15 +124,20 @@ class InternalSweepAcqThread(object):
 
 
 
-		dataQueue.put({"settings" : self.sh.getCurrentAcquisitionSettings()})
-		plotQueue.put({"settings" : self.sh.getCurrentAcquisitionSettings()})
+		settings = self.sh.getCurrentAcquisitionSettings()
+		dataQueue.put({"settings" : settings})
+		plotQueue.put({"settings" : settings})
 
 	def sweepSource(self, dataQueues, ctrlNs):
 
 		dataQueue, plotQueue = dataQueues
 
 
-		from SignalHound import SignalHound
+		from SignalHound import SignalHound, AcquisitionError, DeviceNotConfiguredError
+		from SignalHound.stitch import SpectrumStitcher
+		from SignalHound.accumulator import TraceAccumulator
+		from SignalHound.buffers import SpectrumRing
+		from SignalHound.metrics import AcquisitionMetrics
 
 
 		loop_timer = time.time()
@@ -105,18 +146,54 @@ class InternalSweepAcqThread(object):
 		loop_timer = time.time()
 		loops = 0
 
+		# Where the time goes. Written to the log every METRICS_INTERVAL seconds, and served on METRICS_PORT.
+		self.metrics = AcquisitionMetrics()
+		lastMetrics = {"last-interval" : None}
+
 		self.sh = SignalHound()
 		self.startAcquisition(dataQueue, plotQueue)
 
 		# Send the trace size to the acq thread so I can properly set up the data-log file
-		numPoints = self.sh.queryTraceInfo()["arr-size"]
-		dataQueue.put({"arrSize" : numPoints})
+		traceInfo = self.sh.queryTraceInfo()
+		numPoints = traceInfo["arr-size"]
+
+		self.stitcher = None
+		if ACQ_STITCH_PASSES and len(self.plan) > 1:
+			self.stitcher = SpectrumStitcher(self.plan, traceInfo["arr-bin-size"], overlap = ACQ_OVERLAP)
+			numPoints = self.stitcher.numBins
+			self.log.info("Stitching passes into %s bins from %0.6g Hz", numPoints, self.stitcher.startFreq)
+
+		extraStatistics = [name for name in LOG_STATISTICS if name != "mean"]
+		if extraStatistics and self.stitcher:
+			self.log.warning("Only the mean is logged when stitching passes. Not logging %s.", extraStatistics)
+			extraStatistics = []
+		accumulator = TraceAccumulator(statistics = ["mean"] + extraStatistics)
+
+		# The plot gets its own, shorter, integration of the same traces. Stitched passes go to the plot as they are,
+		# since a pass only completes once per scan cycle anyway.
+		plotAccumulator = TraceAccumulator() if plotQueue and not self.stitcher else None
+
+		# Rows go to the log and plot processes through shared-memory rings, so they aren't pickled. The queues carry
+		# the small messages, including the ring names.
+		logRing = SpectrumRing.create(ROW_RING_SLOTS, numPoints, numArrays = 1 + len(extraStatistics))
+		plotRing = SpectrumRing.create(PLOT_RING_SLOTS, numPoints, dropOldest = True) if plotQueue else None
+
+		dataQueue.put({"arrSize" : numPoints, "ring" : logRing.name, "statistics" : ["mean"] + extraStatistics})
+		if plotRing:
+			plotQueue.put({"ring" : plotRing.name})
+
+		metricsEndpoint = None
+		if METRICS_PORT:
+			getMetrics = lambda: dict(lastMetrics, current = snapshot(self.metrics, logRing, plotRing, dataQueue))
+			metricsEndpoint = startMetricsServer(METRICS_PORT, getMetrics)
 
 		temperature = self.sh.getDeviceDiagnostics()["temperature"]
+		# Temperature that called for a recalibration, while it waits for the next window change.
+		recalTemperature = None
+		# The gap a recalibration left, until the first trace after it closes it.
+		recalGap = None
+		lastTrace = time.time()
 
-
-		runningSum = np.array(())
-		runningSumItems = 0
 		startFreq = 0
 
 
@@ -124,17 +201,31 @@ class InternalSweepAcqThread(object):
 			try:
 
 
+				fetchStart = time.time()
 				trace = self.sh.fetchTrace()
 				traceInfo = self.sh.queryTraceInfo()
+				fetchEnd = time.time()
+				self.metrics.add("fetch", fetchEnd - fetchStart)
+				if recalGap:
+					recalGap["first-trace"] = fetchEnd
+					recalGap["gap"] = fetchEnd - recalGap["last-trace"]
+					dataQueue.put({"recal-gap" : recalGap})
+					self.log.warning("Recalibration gap: no traces from %f to %f (%0.3f seconds, %0.3f of them with the device stopped).",
+						recalGap["last-trace"], recalGap["first-trace"], recalGap["gap"], recalGap["restarted"] - recalGap["stopped"])
+					recalGap = None
+				lastTrace = fetchEnd
+				if self.adaptive:
+					self.adaptive.addSweep(trace["max"])
 				dataDict = {
 								"info": traceInfo,
 								"data": trace
 							}
 
 				acqInfo = dataDict["info"]
-				if runningSum.shape != dataDict["data"]["max"].shape:
-					runningSum = np.zeros_like(dataDict["data"]["max"])
-					runningSumItems = 0
+				if accumulator.size != dataDict["data"]["max"].shape[0]:
+					accumulator.reset(dataDict["data"]["max"].shape[0])
+					if plotAccumulator:
+						plotAccumulator.reset(dataDict["data"]["max"].shape[0])
 					startFreq = acqInfo["ret-start-freq"]
 					binSize = acqInfo["arr-bin-size"]
 					self.log.info("Running average array size changed! Either the system just started, or something is seriously wrong!")
@@ -144,37 +235,56 @@ class InternalSweepAcqThread(object):
 					changed = True
 
 				else:
-					runningSum += dataDict["data"]["max"]
-					runningSumItems += 1
+					accumulator.add(dataDict["data"]["max"], dataDict["data"]["min"])
+					if plotAccumulator:
+						plotAccumulator.add(dataDict["data"]["max"])
+
+				if plotAccumulator and (plotAccumulator.count == NUM_PLOT_AVERAGE or (changed and plotAccumulator.count)):
+					if plotRing.put(time.time(), startFreq, binSize, plotAccumulator.count, plotAccumulator.results()["mean"]) and plotRing.notify():
+						plotQueue.put(ROW_READY)
+					plotAccumulator.reset()
 
 
 
 				# if we've reached the number of average items per output array, or the frequency has changed, requiring an early dump of the specra data.
-				if runningSumItems == NUM_AVERAGE or changed:
-					self.log.info("Running sum shape = %s, items = %s", runningSum.shape, runningSumItems)
-					# Divide down to the average
-					arr = runningSum / runningSumItems
+				if accumulator.count == NUM_AVERAGE or changed:
+					self.log.info("Accumulator size = %s, items = %s", accumulator.size, accumulator.count)
 
 					# Build array to write out.
 					saveTime = time.time()
 					# self.log.info("Saving data record with timestamp %f", saveTime)
 
 					# Only write out to the file if we actually have data
-					if runningSumItems != 0:
+					if accumulator.count != 0:
+
+						stats = accumulator.results()
+						row = (saveTime, startFreq, binSize, accumulator.count, stats["mean"])
 
+						# When stitching, rows only go out once a whole pass is in.
+						if self.stitcher:
+							row = None
+							stitched = self.stitcher.add(startFreq, binSize, accumulator.count, stats["mean"])
+							if stitched:
+								sweeps, spectrum = stitched
+								row = (saveTime, self.stitcher.startFreq, self.stitcher.binSize, sweeps, spectrum)
 
-						dataQueue.put({"row" : (saveTime, startFreq, binSize, runningSumItems, arr)})
-						if plotQueue:
-							plotQueue.put({"row" : (saveTime, startFreq, binSize, runningSumItems, arr)})
+						if row:
+							if logRing.put(*(row + tuple(stats[name] for name in extraStatistics))):
+								if logRing.notify():
+									dataQueue.put(ROW_READY)
+							else:
+								self.log.error("Log process isn't keeping up! Dropped a row (%s dropped in total).", logRing.dropped)
+							if self.stitcher and plotRing and plotRing.put(*row) and plotRing.notify():
+								plotQueue.put(ROW_READY)
 
 
 
 
 
-						runningSum = np.zeros_like(runningSum)
-						self.log.info("Estimated items in processing queue %s", dataQueue.qsize())
-						self.log.info("Running sum shape = %s, items = %s", runningSum.shape, runningSumItems)
-						runningSumItems = 0
+						self.log.info("Rows waiting for the log process %s", logRing.available())
+						if plotRing:
+							self.log.info("Plot frames dropped %s", plotRing.dropped)
+						accumulator.reset()
 
 					# now = time.time()
 					# delta = now-loop_timer
@@ -187,21 +297,37 @@ class InternalSweepAcqThread(object):
 					if changed:
 						self.log.info("Retuned! Old freq = %s, new freq = %s", startFreq, acqInfo["ret-start-freq"])
 
-						runningSum += dataDict["data"]["max"]
+						accumulator.reset()
+						accumulator.add(dataDict["data"]["max"], dataDict["data"]["min"])
+						if plotAccumulator:
+							plotAccumulator.add(dataDict["data"]["max"])
 						startFreq = acqInfo["ret-start-freq"]
 						binSize = acqInfo["arr-bin-size"]
-						runningSumItems = 1
 
 
 					del(trace)
 
+				self.metrics.add("process", time.time() - fetchEnd)
+				self.metrics.sweeps += 1
+
 
 
+			# Transient errors only cost us the sweep in flight. Drop it and carry on.
+			except AcquisitionError as e:
+				self.log.warning("Dropped sweep: %s", e)
+
+			# The device lost its configuration, but the interface is fine. Reconfigure without tearing everything down.
+			except DeviceNotConfiguredError as e:
+				self.log.error("Device not configured (%s). Restarting acquisition.", e)
+				dataQueue.put({"status" : "Error: Device not configured. Restarting acquisition"})
+				with self.metrics.timing("reset"):
+					self.startAcquisition(dataQueue, plotQueue)
 
 			except Exception:
 				self.log.error("IOError in Acquisition Thread!")
 				self.log.error(traceback.format_exc())
 
+				resetStart = time.time()
 				dataQueue.put({"status" : "Error: Device interface craself.shed. Reinitializing"})
 				self.log.error("Resetting hardware!")
 				# self.sh.preset()
@@ -233,50 +359,108 @@ class InternalSweepAcqThread(object):
 
 
 				self.startAcquisition(dataQueue, dataQueue)
+				self.metrics.add("reset", time.time() - resetStart)
 
 
 			loops += 1
 
-			if loops % ACQ_BIN_SAMPLES == 0:
-				print("Should retune frontend!")
-				self.sh.abort()
-				self.startAcquisition(dataQueue, dataQueue)
+			self.windowSweeps += 1
+
+			# A recalibration waits for the acquisition to stop anyway, at the next window change (or at the end of
+			# a pass, when stitching), so no row mixes traces from either side of it. A single window plan never
+			# changes windows, so it recalibrates between integrations instead.
+			if len(self.plan) == 1:
+				recalDue = accumulator.count == 0
+			else:
+				recalDue = self.windowSweeps >= self.window.dwell and (not self.stitcher or self.window is self.plan[-1])
+
+			if recalTemperature is not None and recalDue:
+				dataQueue.put({"status" : "Recalibrating IF"})
+				with self.metrics.timing("recal"):
+					if len(self.plan) == 1:
+						stopped, restarted = self.sh.recalibrate()
+						if plotAccumulator:
+							plotAccumulator.reset()
+					else:
+						stopped, restarted = self.retune(dataQueue, recalibrate = True)
+				recalGap = {"last-trace" : lastTrace, "stopped" : stopped, "restarted" : restarted, "temperature-change" : recalTemperature - temperature}
+				temperature = recalTemperature
+				recalTemperature = None
+
+			elif self.windowSweeps >= self.window.dwell:
+				with self.metrics.timing("retune"):
+					self.retune(dataQueue)
 
 				# print("Current acq mode = ", self.sh.queryTraceInfo())
 
 			if loops % PRINT_LOOP_CNT == 0:
-				now = time.time()
-				delta = now-loop_timer
-				freq = 1 / (delta / PRINT_LOOP_CNT)
-				# self.log.info("Elapsed Time = %0.5f, Frequency = %s", delta, freq)
-				loop_timer = now
+				current = self.metrics.summary()
+				self.log.info("%0.1f sweeps/sec, duty cycle %0.1f%%, %0.3f seconds processing, %0.3f seconds lost to retunes, recals, diagnostics and resets, over %0.1f seconds",
+					current["sweep-rate"], current["duty-cycle"] * 100, current["process-time"], current["dead-time"], current["elapsed"])
+
+				latency = self.sh.retuneLatency.summary()
+				if latency["count"]:
+					self.log.info("Retune latency: %s retunes, mean %0.2f ms, p90 %0.2f ms, max %0.2f ms", latency["count"], latency["mean"] * 1000, latency["p90"] * 1000, latency["max"] * 1000)
 
 			if loops % CAL_CHK_LOOP_CNT == 0:
-				diags = self.sh.getDeviceDiagnostics()
+				with self.metrics.timing("diagnostics"):
+					diags = self.sh.getDeviceDiagnostics()
 				dataQueue.put({"status" : diags})
 
 				temptmp = diags["temperature"]
 				if abs(temperature - temptmp) > 2.0:    # Temperature deviations of > 2° cause IF self.shifts. Therefore, we do a re-cal if they're detected
-					dataQueue.put({"status" : "Recalibrating IF"})
-					self.sh.selfCal()
-					self.startAcquisition(dataQueue, dataQueue)
-					self.log.warning("Temperature changed > 2.0 C. Delta is %f. Recalibrated!", abs(temperature - temptmp))
-					temperature = temptmp
+					self.log.warning("Temperature changed > 2.0 C. Delta is %f. Recalibrating at the next window change.", abs(temperature - temptmp))
+					recalTemperature = temptmp
 				else:
 					self.log.info("Temperature deviation = %f. Not doing recal, since drift < 2C", abs(temperature - temptmp))
 
+			if time.time() - self.metrics.startTime >= METRICS_INTERVAL:
+				lastMetrics["last-interval"] = snapshot(self.metrics, logRing, plotRing, dataQueue)
+				dataQueue.put({"metrics" : lastMetrics["last-interval"]})
+				self.metrics.reset()
+
 
 			if ctrlNs.run == False:
 				self.log.info("Stopping Acq-thread!")
 				break
 
+		# The stitched pass in progress is written out if it got at least half a pass's sweeps. Otherwise it's
+		# mostly NaN, so it's dropped.
+		if self.stitcher and self.stitcher.sweeps:
+			sweeps, spectrum = self.stitcher.finish()
+			if sweeps * 2 >= self.passSweeps:
+				row = (time.time(), self.stitcher.startFreq, self.stitcher.binSize, sweeps, spectrum)
+				if logRing.put(*row):
+					if logRing.notify():
+						dataQueue.put(ROW_READY)
+				else:
+					self.log.error("Log process isn't keeping up! Dropped a row (%s dropped in total).", logRing.dropped)
+				self.log.info("Wrote out the partial pass in progress, with %s of %s sweeps.", sweeps, self.passSweeps)
+			else:
+				self.log.info("Dropped the partial pass in progress, with %s of %s sweeps.", sweeps, self.passSweeps)
+
+
+		if metricsEndpoint:
+			metricsEndpoint.shutdown()
+			metricsEndpoint.server_close()
 
 		self.sh.abort()
 		self.sh.closeDevice()
 
 		del(self.sh)
 
+		# The consumers have already attached, so the names can go. They'll drain what's left.
+		for ring in (logRing, plotRing):
+			if ring:
+				ring.close()
+				ring.unlink()
+
+
 
+		# Wake the consumers, rather than leaving them to notice the flag.
+		ctrlNs.acqRunning = False
+		dataQueue.put(SHUTDOWN)
+		plotQueue.put(SHUTDOWN)
 
 		self.log.info("Acq-thread closing dataQueue!")
 		dataQueue.close()
@@ -285,8 +469,6 @@ class InternalSweepAcqThread(object):
 		plotQueue.close()
 		plotQueue.cancel_join_thread()
 
-		ctrlNs.acqRunning = False
-
 		self.log.info("Acq-thread exiting!")
 		self.printQueue.close()
 		self.printQueue.join_thread()
@@ -27,6 +27,7 @@ import spectraLogThread
 
 import spectraPlotApiThread
 import printThread
+from controlBlock import ControlBlock, SHUTDOWN
 
 import settings
 
@@ -36,17 +37,12 @@ def go(logGps=False, gpsTest=False):
 	plotQueue = mp.Queue()
 	dataQueue = mp.Queue()
 	printQueue = mp.Queue()
-	ctrlManager = mp.Manager()
 
 	logSetup.initLogging(printQ = printQueue)
 	log = logging.getLogger("Main.Main")
 
-	ctrlNs = ctrlManager.Namespace()
-	ctrlNs.run = True
-	ctrlNs.acqRunning = True
-	ctrlNs.apiRunning = True
-	ctrlNs.logRunning = True
-	ctrlNs.stopped = False
+	# Run/stop flags, in shared memory. Everything starts out running.
+	ctrlNs = ControlBlock()
 
 	if not settings.GPS_COM_PORT:
 		print("WARNING: No GPS port specified. GPS mode can not work.")
@@ -139,6 +135,7 @@ def go(logGps=False, gpsTest=False):
 		print("Faking halt signals")
 		ctrlNs.apiRunning = False
 
+	printQueue.put(SHUTDOWN)
 	print("Joining on PrintProc")
 	while printProc.is_alive():
 		printProc.join(0.05)
@@ -147,8 +144,6 @@ def go(logGps=False, gpsTest=False):
 
 
 	print("Threads stopped.")
-	print("Stopping Shared Memory Manager.")
-	ctrlManager.shutdown()
 
 	print("Shutdown complete. Exiting.")
 
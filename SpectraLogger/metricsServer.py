@@ -0,0 +1,88 @@
+# -*- coding: UTF-8 -*-
+
+# Wrapper for Test-Equipment-Plus's "SignalHound" series of USB spectrum analysers.
+#
+# Written By Connor Wolf <wolf@imaginaryindustries.com>
+#
+
+#  * ----------------------------------------------------------------------------
+#  * "THE BEER-WARE LICENSE":
+#  * Connor Wolf <wolf@imaginaryindustries.com> wrote this file. As long as you retain
+#  * this notice you can do whatever you want with this stuff. If we meet some day,
+#  * and you think this stuff is worth it, you can buy me a beer in return.
+#  * (Only I don't drink, so a soda will do). Connor
+#  * Also, support the Signal-Hound devs. Their hardware is pretty damn awesome.
+#  * ----------------------------------------------------------------------------
+#
+
+import BaseHTTPServer
+import json
+import logging
+import threading
+import time
+import traceback
+
+
+def startMetricsServer(port, getMetrics):
+	'''
+	Serve the acquisition metrics as JSON over HTTP on ``localhost:port``, from a daemon thread.
+
+		$ curl http://localhost:50008/
+
+	Args:
+		port (int): Port to listen on. Only the loopback interface is bound.
+		getMetrics: Function returning the dictionary to serve. Called from the server thread for each request.
+
+	Returns:
+		The ``HTTPServer``. Call ``shutdown()`` on it to stop it.
+	'''
+
+	log = logging.getLogger("Main.AcqProcess.Metrics")
+
+	class MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+		def do_GET(self):
+			try:
+				body = json.dumps(getMetrics(), indent=4, sort_keys=True)
+			except Exception:
+				log.error("Failed to build metrics!")
+				log.error(traceback.format_exc())
+				self.send_error(500)
+				return
+
+			self.send_response(200)
+			self.send_header("Content-Type", "application/json")
+			self.send_header("Content-Length", str(len(body)))
+			self.end_headers()
+			self.wfile.write(body)
+
+		def log_message(self, format, *args):
+			# Requests aren't worth a line each in the log.
+			pass
+
+	server = BaseHTTPServer.HTTPServer(("127.0.0.1", port), MetricsHandler)
+	thread = threading.Thread(target=server.serve_forever, name="MetricsServer")
+	thread.daemon = True
+	thread.start()
+
+	log.info("Serving acquisition metrics on http://localhost:%s/", port)
+	return server
+
+def snapshot(metrics, logRing, plotRing, dataQueue):
+	'''
+	Returns:
+		``metrics.summary()``, plus the time, and how far behind the log and plot processes are: the rows waiting in
+		(and dropped from) each ring, and the messages waiting in the log process's queue (``None`` where the
+		platform can't tell).
+	'''
+	ret = metrics.summary()
+	ret["time"] = time.time()
+	ret["log-ring-depth"] = logRing.available()
+	ret["log-ring-dropped"] = logRing.dropped
+	if plotRing:
+		ret["plot-ring-depth"] = plotRing.available()
+		ret["plot-ring-dropped"] = plotRing.dropped
+	try:
+		ret["data-queue-depth"] = dataQueue.qsize()
+	except NotImplementedError:
+		ret["data-queue-depth"] = None
+	return ret
@@ -19,7 +19,10 @@
 import logSetup
 import logging
 import time
+import Queue
 
+from controlBlock import SHUTDOWN
+from settings import QUEUE_WAIT_TIMEOUT
 
 
 NUM_AVERAGE = 1
@@ -31,19 +34,20 @@ def printer(printQueue, ctrlNs):
 	logSetup.initLogging()
 
 	while 1:
-		if not printQueue.empty():
-			print printQueue.get()
-
-
-
+		try:
+			line = printQueue.get(timeout = QUEUE_WAIT_TIMEOUT)
+			if line == SHUTDOWN:
+				print("Stopping Printing-thread!")
+				break
+			print line
+		except Queue.Empty:
+			pass
 
 
 		if ctrlNs.acqRunning == False and ctrlNs.apiRunning == False:
 			print("Stopping Printing-thread!")
 			break
 
-		time.sleep(0.001)
-
 
 	print("Print-thread exiting!")
 	printQueue.close()
@@ -80,11 +80,45 @@ ACQ_OVERLAP            = 0.5
 # Number of scans to take at each frequency
 ACQ_BIN_SAMPLES        = 600
 
+# Frequency ranges the real-time-sweeping mode should cover, as (start, stop) or (start, stop, dwell-weight) tuples
+# in Hz. The dwell weight multiplies ACQ_BIN_SAMPLES for the windows covering that range. If None, the mode covers
+# ACQ_FREQ +- ACQ_SPAN/2.
+ACQ_SCAN_RANGES        = None
+# ACQ_SCAN_RANGES        = [(88e6, 108e6), (118e6, 137e6, 2), (1420.0e6, 1420.8e6, 4)]
+
+# Frequency ranges inside ACQ_SCAN_RANGES that don't need to be covered, as (start, stop) tuples in Hz.
+ACQ_SCAN_EXCLUDE       = []
+
+# Adaptive dwell for the real-time-sweeping mode. When enabled, the total number of sweeps per scan cycle stays the
+# same, but it's re-split between the windows according to how much activity each one shows, with every window
+# getting between ACQ_DWELL_MIN and ACQ_DWELL_MAX sweeps per visit. ACQ_MAX_REVISIT_SECONDS optionally caps the
+# length of a scan cycle, and therefore the time any window goes unobserved.
+ACQ_ADAPTIVE_DWELL     = False
+ACQ_DWELL_MIN          = ACQ_BIN_SAMPLES // 4
+ACQ_DWELL_MAX          = ACQ_BIN_SAMPLES * 4
+ACQ_MAX_REVISIT_SECONDS = None
+
+# Stitch each pass of the real-time-sweeping mode into one row covering the whole scan, rather than logging a row
+# per window. Overlapping windows are cross-faded over their ACQ_OVERLAP margins, and frequencies no window covers
+# (gaps between ACQ_SCAN_RANGES) are NaN.
+ACQ_STITCH_PASSES      = False
+
+
+# Fetch traces from a background thread in the SignalHound wrapper, so the device keeps acquiring while the
+# acquisition loop averages and queues the previous trace. Only applies to the "sweeping" and "real-time" modes.
+# The measured acquisition duty cycle, and the time spent fetching and processing, are logged every PRINT_LOOP_CNT
+# sweeps.
+ACQ_BACKGROUND_FETCH   = True
+
+# Number of trace buffers between the fetch thread and the processing loop. Two is enough when processing a trace is
+# always quicker than fetching one. The spare ones absorb the occasional slow iteration (writing a log row, a status
+# query), so the fetch thread doesn't have to wait for it.
+ACQ_FETCH_BUFFERS      = 4
 
 # The acquired data modes. Valid options are "average" and "min-max"
 # "average" returns the average power integrated over the "sweep-time" interval.
-# "min-max" is the minimum and maximum value tracked over the "sweep-time" interval. This mode is not currently supported by the data-logging system.
-# Contact Connor if you need it.
+# "min-max" is the minimum and maximum value tracked over the "sweep-time" interval. The logged spectrum is the average of
+# the max values. Add "min-hold" and "max-hold" to LOG_STATISTICS to log the extremes as well.
 ACQ_MODE               = "average"
 
 # Scquisition Y scaling settings.
@@ -106,15 +140,51 @@ PRINT_LOOP_CNT         = 100
 # The system temperature and diagnostics are read out every CAL_CHK_LOOP_CNT sweeps. If the system temperature has devicated more then 2C,
 # the acquisition loop will automatically recalibrate the IF frontend, and embed the proper information reflecting the fact that the
 # system was recalibrated in the cal-log table in the data-log.
+# The recalibration waits for the end of the integration in progress (or, in "real-time-sweeping" mode, the next window change),
+# and the gap it leaves in the traces is written to the cal-log table as a "recal-gap" entry. With ACQ_BACKGROUND_FETCH, the traces
+# still waiting in the fetch ring at that point were taken before the recalibration, and are discarded (counted in the entry).
 CAL_CHK_LOOP_CNT       = 5000
 
 # Number of acquisition sweeps averaged over for each data-array written to the log files.
 NUM_AVERAGE            = 600 * 6
 
-# Number of acquisition sweeps averaged over for each data-array fet to the plotting system
-# ~60 divided by NUM_AVERAGE yields Hz
+# Per-bin statistics of each NUM_AVERAGE integration to write to the log files. They're computed in one pass as the sweeps
+# come in, so nothing is kept but the running statistics. Each one adds a little work per sweep: all four take about
+# 0.5 ms per 65k-bin sweep, against 0.03 ms for the mean alone.
+# "mean"     : The average spectrum. Always logged, to the "Spectrum_Data" dataset.
+# "variance" : Sample variance of each bin, to "Spectrum_Variance".
+# "min-hold" : Minimum of each bin, to "Spectrum_Min_Hold".
+# "max-hold" : Maximum of each bin, to "Spectrum_Max_Hold".
+# The extra datasets have the same layout as "Spectrum_Data". They're not available when ACQ_STITCH_PASSES is set.
+LOG_STATISTICS         = ["mean"]
+
+# Number of acquisition sweeps averaged over for each data-array fed to the plotting system. This is integrated separately
+# from the NUM_AVERAGE log rows, so the live plot can update quickly while the log keeps long integrations. Divide the
+# sweep rate (1 / ACQ_SWEEP_TIME_SECONDS) by this to get the plot update rate in Hz.
 NUM_PLOT_AVERAGE       = 30
 
+# Number of rows the shared-memory ring between the acquisition and the log process can hold. If the log process falls
+# this many rows behind, new rows are dropped (and the drops logged) rather than stalling the acquisition.
+ROW_RING_SLOTS         = 32
+
+# Number of rows the ring to the plot process holds. The plot only wants the latest rows, so if it falls behind (no
+# client connected, or a slow one), the oldest rows are overwritten and counted as dropped frames instead.
+PLOT_RING_SLOTS        = 4
+
+# The log, plot and print processes block on their queues, and are woken by each message (rows in the rings are
+# announced on the queues too), so they use no CPU while idle. This is how long they block before checking the run flags
+# anyway, and how often the plot process checks for a new client while none is connected.
+QUEUE_WAIT_TIMEOUT     = 0.25
+
+# Interval, in seconds, at which the acquisition's metrics (sweep rate, time spent fetching and processing sweeps, time
+# lost to retunes, recalibrations and resets, and the depths of the rings and queues to the other processes) are written
+# to the log file's Acq_info dataset, and then restarted.
+METRICS_INTERVAL       = 60
+
+# Port the acquisition process serves its metrics on as JSON, at http://localhost:METRICS_PORT/. Both the current and the
+# last complete interval are served. None disables it.
+METRICS_PORT           = 50008
+
 # File rotation interval in seconds:
 FILE_ROTATION_INTERVAL = 60 * 60 # 1 hour
 
@@ -22,13 +22,23 @@ import traceback
 
 import numpy as np
 
+from controlBlock import ROW_READY, SHUTDOWN
+from metricsServer import startMetricsServer, snapshot
+
 # Pull in the settings crap
 from settings import ACQ_FREQ, ACQ_SPAN, ACQ_REF_LEVEL_DB, ACQ_ATTENUATION_DB, ACQ_GAIN_SETTING, ACQ_RBW, ACQ_VBW
 from settings import ACQ_SWEEP_TIME_SECONDS, ACQ_WINDOW_TYPE, ACQ_UNITS, ACQ_TYPE, ACQ_MODE, ACQ_Y_SCALE, PRINT_LOOP_CNT, CAL_CHK_LOOP_CNT
 
-from settings import NUM_AVERAGE
+from settings import NUM_AVERAGE, NUM_PLOT_AVERAGE, ACQ_BACKGROUND_FETCH, ACQ_FETCH_BUFFERS, LOG_STATISTICS, ROW_RING_SLOTS, PLOT_RING_SLOTS
+from settings import METRICS_INTERVAL, METRICS_PORT
+
+def startFetching(sh, metrics):
+	# The min traces are only needed for the min-hold.
+	sh.startBackgroundAcquisition(numBuffers = ACQ_FETCH_BUFFERS, withMin = "min-hold" in LOG_STATISTICS, metrics = metrics)
 
-def startAcquisition(sh, dataQueue, plotQueue):
+def startAcquisition(sh, dataQueue, plotQueue, metrics):
+
+	sh.stopBackgroundAcquisition()
 
 	sh.configureAcquisition(ACQ_MODE, ACQ_Y_SCALE)
 	sh.configureCenterSpan(center = ACQ_FREQ, span = ACQ_SPAN)
@@ -44,16 +54,24 @@ def startAcquisition(sh, dataQueue, plotQueue):
 	# sh.configureRawSweep(100, 8, 2)
 	sh.initiate(mode = ACQ_TYPE, flag = "ignored")
 
-	dataQueue.put({"settings" : sh.getCurrentAcquisitionSettings()})
+	# Read out the settings (which reads the diagnostics too) before the fetch thread starts calling into the device.
+	settings = sh.getCurrentAcquisitionSettings()
+	dataQueue.put({"settings" : settings})
 	if plotQueue:
-		plotQueue.put({"settings" : sh.getCurrentAcquisitionSettings()})
+		plotQueue.put({"settings" : settings})
+
+	if ACQ_BACKGROUND_FETCH:
+		startFetching(sh, metrics)
 
 def sweepSource(dataQueues, ctrlNs, printQueue):
 
 	dataQueue, plotQueue = dataQueues
 
 
-	from SignalHound import SignalHound
+	from SignalHound import SignalHound, AcquisitionError, DeviceNotConfiguredError
+	from SignalHound.accumulator import TraceAccumulator
+	from SignalHound.buffers import SpectrumRing
+	from SignalHound.metrics import AcquisitionMetrics
 
 	logSetup.initLogging(printQ = printQueue)
 	loop_timer = time.time()
@@ -63,34 +81,86 @@ def sweepSource(dataQueues, ctrlNs, printQueue):
 	loop_timer = time.time()
 	loops = 0
 
+	# Where the time goes. Written to the log every METRICS_INTERVAL seconds, and served on METRICS_PORT.
+	metrics = AcquisitionMetrics()
+	lastMetrics = {"last-interval" : None}
+
 	sh = SignalHound()
-	startAcquisition(sh, dataQueue, plotQueue)
+	startAcquisition(sh, dataQueue, plotQueue, metrics)
 
-	# Send the trace size to the acq thread so I can properly set up the data-log file
 	numPoints = sh.queryTraceInfo()["arr-size"]
-	dataQueue.put({"arrSize" : numPoints})
 
-	temperature = sh.getDeviceDiagnostics()["temperature"]
+	extraStatistics = [name for name in LOG_STATISTICS if name != "mean"]
+	accumulator = TraceAccumulator(statistics = ["mean"] + extraStatistics)
 
+	# The plot gets its own, shorter, integration of the same traces.
+	plotAccumulator = TraceAccumulator() if plotQueue else None
+
+	# Rows go to the log and plot processes through shared-memory rings, so they aren't pickled. The queues carry the
+	# small messages, including the ring names.
+	logRing = SpectrumRing.create(ROW_RING_SLOTS, numPoints, numArrays = 1 + len(extraStatistics))
+	plotRing = SpectrumRing.create(PLOT_RING_SLOTS, numPoints, dropOldest = True) if plotQueue else None
+
+	# Send the trace size to the acq thread so I can properly set up the data-log file
+	dataQueue.put({"arrSize" : numPoints, "ring" : logRing.name, "statistics" : ["mean"] + extraStatistics})
+	if plotRing:
+		plotQueue.put({"ring" : plotRing.name})
+
+	metricsEndpoint = None
+	if METRICS_PORT:
+		getMetrics = lambda: dict(lastMetrics, current = snapshot(metrics, logRing, plotRing, dataQueue))
+		metricsEndpoint = startMetricsServer(METRICS_PORT, getMetrics)
+
+	temperature = sh.getDeviceDiagnostics()["temperature"]
+	# Temperature that called for a recalibration, while it waits for the end of the integration in progress.
+	recalTemperature = None
+	# The gap a recalibration left, until the first trace after it closes it.
+	recalGap = None
+	lastTrace = time.time()
 
-	runningSum = np.array(())
-	runningSumItems = 0
 	startFreq = 0
 
 
 	while 1:
 		try:
-			trace = sh.fetchTrace()
-			traceInfo = sh.queryTraceInfo()
+			fetchStart = time.time()
+			if ACQ_BACKGROUND_FETCH:
+				item = sh.backgroundAcq.get(timeout = 5)
+				if item is None:
+					raise IOError("Background acquisition stopped delivering traces!")
+				if item[0].ndim == 2:
+					trace = {"min" : item[0][0], "max" : item[0][1]}
+				else:
+					trace = {"max" : item[0]}
+				traceInfo = sh.backgroundAcq.traceInfo
+			else:
+				trace = sh.fetchTrace()
+				traceInfo = sh.queryTraceInfo()
+			# The fetch thread records its own fetch times.
+			fetchEnd = time.time()
+			if not ACQ_BACKGROUND_FETCH:
+				metrics.add("fetch", fetchEnd - fetchStart)
+			# When the trace was acquired. A trace from the ring can have waited in it for a while, so use the time
+			# the fetch thread got it.
+			traceTime = item[1] if ACQ_BACKGROUND_FETCH else fetchEnd
+			if recalGap:
+				recalGap["first-trace"] = traceTime
+				recalGap["gap"] = traceTime - recalGap["last-trace"]
+				dataQueue.put({"recal-gap" : recalGap})
+				log.warning("Recalibration gap: no traces from %f to %f (%0.3f seconds, %0.3f of them with the device stopped, %s traces discarded).",
+					recalGap["last-trace"], recalGap["first-trace"], recalGap["gap"], recalGap["restarted"] - recalGap["stopped"], recalGap["discarded"])
+				recalGap = None
+			lastTrace = traceTime
 			dataDict = {
 							"info": traceInfo,
 							"data": trace
 						}
 
 			acqInfo = dataDict["info"]
-			if runningSum.shape != dataDict["data"]["max"].shape:
-				runningSum = np.zeros_like(dataDict["data"]["max"])
-				runningSumItems = 0
+			if accumulator.size != dataDict["data"]["max"].shape[0]:
+				accumulator.reset(dataDict["data"]["max"].shape[0])
+				if plotAccumulator:
+					plotAccumulator.reset(dataDict["data"]["max"].shape[0])
 				startFreq = acqInfo["ret-start-freq"]
 				binSize = acqInfo["arr-bin-size"]
 				log.info("Running average array size changed! Either the system just started, or something is seriously wrong!")
@@ -100,37 +170,43 @@ def sweepSource(dataQueues, ctrlNs, printQueue):
 				changed = True
 
 			else:
-				runningSum += dataDict["data"]["max"]
-				runningSumItems += 1
+				accumulator.add(dataDict["data"]["max"], dataDict["data"].get("min"))
+				if plotAccumulator:
+					plotAccumulator.add(dataDict["data"]["max"])
 
+			if plotAccumulator and (plotAccumulator.count == NUM_PLOT_AVERAGE or (changed and plotAccumulator.count)):
+				if plotRing.put(time.time(), startFreq, binSize, plotAccumulator.count, plotAccumulator.results()["mean"]) and plotRing.notify():
+					plotQueue.put(ROW_READY)
+				plotAccumulator.reset()
 
 
-			# if we've reached the number of average items per output array, or the frequency has changed, requiring an early dump of the specra data.
-			if runningSumItems == NUM_AVERAGE or changed:
 
-				# Divide down to the average
-				arr = runningSum / runningSumItems
+			# if we've reached the number of average items per output array, or the frequency has changed, requiring an early dump of the specra data.
+			if accumulator.count == NUM_AVERAGE or changed:
 
 				# Build array to write out.
 				saveTime = time.time()
 				# log.info("Saving data record with timestamp %f", saveTime)
 
 				# Only write out to the file if we actually have data
-				if runningSumItems != 0:
+				if accumulator.count != 0:
 
-
-					dataQueue.put({"row" : (saveTime, startFreq, binSize, runningSumItems, arr)})
-					if plotQueue:
-						plotQueue.put({"row" : (saveTime, startFreq, binSize, runningSumItems, arr)})
+					stats = accumulator.results()
+					if logRing.put(saveTime, startFreq, binSize, accumulator.count, stats["mean"], *[stats[name] for name in extraStatistics]):
+						if logRing.notify():
+							dataQueue.put(ROW_READY)
+					else:
+						log.error("Log process isn't keeping up! Dropped a row (%s dropped in total).", logRing.dropped)
 
 
 					del(trace)
 
 
-					runningSum = np.zeros_like(runningSum)
-					log.info("Estimated items in processing queue %s", dataQueue.qsize())
-					log.info("Running sum shape = %s, items = %s", runningSum.shape, runningSumItems)
-					runningSumItems = 0
+					log.info("Rows waiting for the log process %s", logRing.available())
+					if plotRing:
+						log.info("Plot frames dropped %s", plotRing.dropped)
+					log.info("Accumulator size = %s, items = %s", accumulator.size, accumulator.count)
+					accumulator.reset()
 
 				# now = time.time()
 				# delta = now-loop_timer
@@ -143,18 +219,64 @@ def sweepSource(dataQueues, ctrlNs, printQueue):
 				if changed:
 					log.info("Retuned! Old freq = %s, new freq = %s", startFreq, acqInfo["ret-start-freq"])
 
-					runningSum += dataDict["data"]["max"]
+					accumulator.reset()
+					accumulator.add(dataDict["data"]["max"], dataDict["data"].get("min"))
+					if plotAccumulator:
+						plotAccumulator.add(dataDict["data"]["max"])
 					startFreq = acqInfo["ret-start-freq"]
 					binSize = acqInfo["arr-bin-size"]
-					runningSumItems = 1
 
+			# Hand the trace buffer back to the fetch thread
+			if ACQ_BACKGROUND_FETCH:
+				sh.backgroundAcq.release()
 
+			metrics.add("process", time.time() - fetchEnd)
+			metrics.sweeps += 1
 
+			# Recalibrate between integrations, so no row mixes traces from either side of the calibration.
+			if recalTemperature is not None and accumulator.count == 0:
+				dataQueue.put({"status" : "Recalibrating IF"})
+				discarded = 0
+				with metrics.timing("recal"):
+					if ACQ_BACKGROUND_FETCH:
+						# The traces still in the ring were taken before the calibration, and would start the next
+						# integration on the wrong side of it. Drop them (counted in the gap), with the fetch thread held
+						# off so none follow. recalibrate() then resumes it.
+						sh.backgroundAcq.pause()
+						while sh.backgroundAcq.get(timeout = 0):
+							sh.backgroundAcq.release()
+							discarded += 1
+					stopped, restarted = sh.recalibrate()
+					# Only stopped if the calibration changed the trace layout.
+					if ACQ_BACKGROUND_FETCH and not sh.backgroundAcq:
+						startFetching(sh, metrics)
+				if plotAccumulator:
+					plotAccumulator.reset()
+				recalGap = {"last-trace" : lastTrace, "stopped" : stopped, "restarted" : restarted, "discarded" : discarded, "temperature-change" : recalTemperature - temperature}
+				temperature = recalTemperature
+				recalTemperature = None
+
+
+
+		# Transient errors only cost us the sweep in flight. Drop it and carry on.
+		except AcquisitionError as e:
+			log.warning("Dropped sweep: %s", e)
+			# The error stopped the fetch thread.
+			if ACQ_BACKGROUND_FETCH:
+				startFetching(sh, metrics)
+
+		# The device lost its configuration, but the interface is fine. Reconfigure without tearing everything down.
+		except DeviceNotConfiguredError as e:
+			log.error("Device not configured (%s). Restarting acquisition.", e)
+			dataQueue.put({"status" : "Error: Device not configured. Restarting acquisition"})
+			with metrics.timing("reset"):
+				startAcquisition(sh, dataQueue, plotQueue, metrics)
 
 		except Exception:
 			log.error("IOError in Acquisition Thread!")
 			log.error(traceback.format_exc())
 
+			resetStart = time.time()
 			dataQueue.put({"status" : "Error: Device interface crashed. Reinitializing"})
 			log.error("Resetting hardware!")
 			# sh.preset()
@@ -169,43 +291,76 @@ def sweepSource(dataQueues, ctrlNs, printQueue):
 			log.error("Hardware shut down, completely re-initializing device interface!")
 			# sys.exit()
 			sh = SignalHound()
-			startAcquisition(sh, dataQueue, plotQueue)
+			startAcquisition(sh, dataQueue, plotQueue, metrics)
+			metrics.add("reset", time.time() - resetStart)
 
 		if loops % PRINT_LOOP_CNT == 0:
-			now = time.time()
-			delta = now-loop_timer
-			freq = 1 / (delta / PRINT_LOOP_CNT)
-			# log.info("Elapsed Time = %0.5f, Frequency = %s", delta, freq)
-			loop_timer = now
+			current = metrics.summary()
+			log.info("%0.1f sweeps/sec, duty cycle %0.1f%%, %0.3f seconds processing, %0.3f seconds lost to retunes, recals, diagnostics and resets, over %0.1f seconds",
+				current["sweep-rate"], current["duty-cycle"] * 100, current["process-time"], current["dead-time"], current["elapsed"])
+
+			if ACQ_BACKGROUND_FETCH and sh.backgroundAcq:
+				stats = sh.backgroundAcq.stats()
+				log.info("Acquisition duty cycle = %0.1f%%, %s traces, %0.3f seconds waiting on processing", stats["duty-cycle"] * 100, stats["traces"], stats["wait-time"])
+				log.info("Fetch stage %0.3f seconds, processing stage %0.3f seconds (%0.2f ms per trace), %0.3f seconds waiting on the device",
+					stats["fetch-time"], stats["process-time"], 1000.0 / stats["process-rate"] if stats["process-rate"] else 0, stats["idle-time"])
 
 		if loops % CAL_CHK_LOOP_CNT == 0:
-			diags = sh.getDeviceDiagnostics()
+			# The fetch thread has to be idle while we talk to the device. Pausing it keeps its ring, and the traces
+			# already fetched into it.
+			fetcher = sh.backgroundAcq if ACQ_BACKGROUND_FETCH else None
+			with metrics.timing("diagnostics"):
+				if fetcher:
+					fetcher.pause()
+				try:
+					diags = sh.getDeviceDiagnostics()
+				finally:
+					if fetcher:
+						fetcher.resume()
 			dataQueue.put({"status" : diags})
 
 			temptmp = diags["temperature"]
 			if abs(temperature - temptmp) > 2.0:    # Temperature deviations of > 2° cause IF shifts. Therefore, we do a re-cal if they're detected
-				dataQueue.put({"status" : "Recalibrating IF"})
-				sh.selfCal()
-				startAcquisition(sh, dataQueue, plotQueue)
-				log.warning("Temperature changed > 2.0 C. Delta is %f. Recalibrated!", abs(temperature - temptmp))
-				temperature = temptmp
+				log.warning("Temperature changed > 2.0 C. Delta is %f. Recalibrating at the end of this integration.", abs(temperature - temptmp))
+				recalTemperature = temptmp
 			else:
 				log.info("Temperature deviation = %f. Not doing recal, since drift < 2C", abs(temperature - temptmp))
 
 		loops += 1
 
+		if time.time() - metrics.startTime >= METRICS_INTERVAL:
+			lastMetrics["last-interval"] = snapshot(metrics, logRing, plotRing, dataQueue)
+			dataQueue.put({"metrics" : lastMetrics["last-interval"]})
+			metrics.reset()
+
 		if ctrlNs.run == False:
 			log.info("Stopping Acq-thread!")
 			break
 
 
+	if metricsEndpoint:
+		metricsEndpoint.shutdown()
+		metricsEndpoint.server_close()
+
 	sh.abort()
 	sh.closeDevice()
 
 	del(sh)
 
+	# The consumers have already attached, so the names can go. They'll drain what's left.
+	for ring in (logRing, plotRing):
+		if ring:
+			ring.close()
+			ring.unlink()
+
 
 
+	# Wake the consumers, rather than leaving them to notice the flag.
+	ctrlNs.acqRunning = False
+	dataQueue.put(SHUTDOWN)
+	if plotQueue:
+		plotQueue.put(SHUTDOWN)
+
 	log.info("Acq-thread closing dataQueue!")
 	dataQueue.close()
 	dataQueue.join_thread()
@@ -213,8 +368,6 @@ def sweepSource(dataQueues, ctrlNs, printQueue):
 		plotQueue.close()
 		plotQueue.cancel_join_thread()
 
-	ctrlNs.acqRunning = False
-
 	log.info("Acq-thread exiting!")
 	printQueue.close()
 	printQueue.join_thread()
@@ -29,11 +29,21 @@ import numpy as np
 
 import h5py
 
+from SignalHound.buffers import SpectrumRing
+
 import os
 import os.path
 import cPickle
+import Queue
+
+from settings import NUM_AVERAGE, FILE_ROTATION_INTERVAL, LOG_STATISTICS, QUEUE_WAIT_TIMEOUT
 
-from settings import NUM_AVERAGE, FILE_ROTATION_INTERVAL
+# Dataset each extra statistic in LOG_STATISTICS is written to.
+STATISTIC_DATASETS = {
+	"variance" : "Spectrum_Variance",
+	"min-hold" : "Spectrum_Min_Hold",
+	"max-hold" : "Spectrum_Max_Hold"
+}
 
 
 def logSweeps(dataQueue, ctrlNs, printQueue, test=False):
@@ -43,24 +53,35 @@ def logSweeps(dataQueue, ctrlNs, printQueue, test=False):
 	log.info("Logging thread starting")
 
 	# the size of the acquisiton array can vary. Therefore, we wait for the acq thread to send a message containing
-	# the array size before allocating the HDF5 array.
+	# the array size before allocating the HDF5 array. It also tells us where to find the shared-memory ring the
+	# rows come through, and which statistics each row carries.
+	ring = None
+	statistics = LOG_STATISTICS
+	arrWidth = None
 	if not test:
-		while 1:
-
-			if dataQueue.empty():
-				time.sleep(0.005)
-			else:
-				tmp = dataQueue.get()
-				if "arrSize" in tmp:
-					log.info("Have array size for acquisition. Creating HDF5 file and starting logging.")
-					arrWidth = tmp["arrSize"]
-					break
+		while ctrlNs.acqRunning:
+			try:
+				tmp = dataQueue.get(timeout = QUEUE_WAIT_TIMEOUT)
+			except Queue.Empty:
+				continue
+
+			if "arrSize" in tmp:
+				log.info("Have array size for acquisition. Creating HDF5 file and starting logging.")
+				arrWidth = tmp["arrSize"]
+				if "ring" in tmp:
+					ring = SpectrumRing.attach(tmp["ring"])
+					statistics = tmp["statistics"]
+				break
+			if "shutdown" in tmp:
+				break
 	else:
 		arrWidth = 20
 
 
-	while ctrlNs.acqRunning:
-		logIter(dataQueue, ctrlNs, printQueue, arrWidth, test)
+	# logIter() returns when it's time to rotate the log file, and returns False once acquisition has stopped.
+	while arrWidth and ctrlNs.acqRunning:
+		if not logIter(dataQueue, ctrlNs, printQueue, arrWidth, test, ring, statistics):
+			break
 
 	log.info("Log-thread closing queues!")
 	dataQueue.close()
@@ -69,7 +90,7 @@ def logSweeps(dataQueue, ctrlNs, printQueue, test=False):
 	printQueue.close()
 	printQueue.join_thread()
 
-def logIter(dataQueue, ctrlNs, printQueue, arrWidth, test=False):
+def logIter(dataQueue, ctrlNs, printQueue, arrWidth, test=False, ring=None, statistics=LOG_STATISTICS):
 
 
 	log = logging.getLogger("Main.LogProcess.Func")
@@ -96,75 +117,118 @@ def logIter(dataQueue, ctrlNs, printQueue, arrWidth, test=False):
 	# Main dataset - compressed, chunked, checksummed.
 	dset = out.create_dataset('Spectrum_Data', (0, arrWidth), maxshape=(None, arrWidth), dtype = np.float64, chunks=True, compression="gzip", fletcher32=True, shuffle=True)
 
+	# Extra statistics, with the same layout.
+	statSets = {}
+	for name in statistics:
+		if name in STATISTIC_DATASETS:
+			statSets[name] = out.create_dataset(STATISTIC_DATASETS[name], (0, arrWidth), maxshape=(None, arrWidth), dtype = np.float64, chunks=True, compression="gzip", fletcher32=True, shuffle=True)
+
 	# Cal and system status log dataset.
 	calset = out.create_dataset('Acq_info', (0, ), maxshape=(None, ), dtype=h5py.new_vlen(str))
 
 
 
 
-	runningSum = np.array(())
-	runningSumItems = 0
-	while 1:
+	def writeRow(saveTime, startFreq, binSize, runningSumItems, arr, stats):
+		# append it to the HDF5 file
+		curSize = dset.shape[0]
+		# print("Current shape = ", dset.shape)
+		dset.resize(curSize+1, axis=0)
 
-		if dataQueue.empty():
-			time.sleep(0.005)
-		else:
+		header = (saveTime, startFreq, binSize, runningSumItems)
+		dset[curSize] = np.concatenate((header, arr))
 
-			tmp = dataQueue.get()
-			# print "data" in tmp
-			# print "info" in tmp
-			# print "data" in tmp and "max" in tmp["data"]
-			if "row" in tmp:
-				saveTime, startFreq, binSize, runningSumItems, arr = tmp["row"]
-				# append it to the HDF5 file
-				curSize = dset.shape[0]
-				# print("Current shape = ", dset.shape)
-				dset.resize(curSize+1, axis=0)
+		for name, statArr in stats.items():
+			if name in statSets:
+				statSets[name].resize(curSize+1, axis=0)
+				statSets[name][curSize] = np.concatenate((header, statArr))
 
-				flatten = lambda *args: args
-				dset[curSize] = flatten(saveTime, startFreq, binSize, runningSumItems, *arr)
+		out.flush()  # FLush early, flush often
+		# Probably a bad idea without a SSD
 
-				out.flush()  # FLush early, flush often
-				# Probably a bad idea without a SSD
+		# The row's timestamp is when the acquisition queued it.
+		log.info("Writing row to file! (%0.1f ms after it was queued)", (time.time() - saveTime) * 1000)
 
+	def writeRingRows():
+		while ring and ring.available():
+			saveTime, startFreq, binSize, runningSumItems, arrays = ring.get(timeout = 0)
+			writeRow(saveTime, startFreq, binSize, runningSumItems, arrays[0], dict(zip(statistics[1:], arrays[1:])))
+			ring.release()
 
-				runningSum = np.zeros_like(runningSum)
-				log.info("Writing row to file!")
-				log.info("Estimated items in processing queue %s", dataQueue.qsize())
+	def isInfo(msg):
+		return "settings" in msg or "status" in msg or "gps-info" in msg or "metrics" in msg or "recal-gap" in msg
 
-				runningSumItems = 0
+	def writeInfo(msg):
+		if "settings" in msg:
+			msg["settings"]["averaging-interval"] = NUM_AVERAGE
 
-				if time.time() - loop_timer > FILE_ROTATION_INTERVAL:
-					log.info("Rotating log files")
-					break
+		data = [time.time(), msg]
 
+		dataPik = cPickle.dumps(data)
 
-			elif "settings" in tmp or "status" in tmp or "gps-info" in tmp:
+		calSz = calset.shape[0]
+		calset.resize([calSz+1,])
+		calset[calSz,...] = dataPik
 
-				if "settings" in tmp:
-					tmp["settings"]["averaging-interval"] = NUM_AVERAGE
+		# log.info("Status message - %s.", msg)
+		# log.info("StatusTable size = %s", calset.shape)
 
-				data = [time.time(), tmp]
+	running = True
+	while 1:
+
+		# Block until there's something to do. Spectrum rows come through the shared-memory ring, and are announced
+		# on the queue, along with everything else.
+		try:
+			tmp = dataQueue.get(timeout = QUEUE_WAIT_TIMEOUT)
+		except Queue.Empty:
+			tmp = None
 
-				dataPik = cPickle.dumps(data)
+		if tmp is None:
+			# Only one notice is outstanding at a time, so make sure a row never waits on one that raced with the last
+			# drain.
+			writeRingRows()
 
-				calSz = calset.shape[0]
-				calset.resize([calSz+1,])
-				calset[calSz,...] = dataPik
+		elif "ring-row" in tmp:
+			ring.clearNotice()
+			writeRingRows()
 
-				# log.info("Status message - %s.", tmp)
-				# log.info("StatusTable size = %s", calset.shape)
-			else:
-				log.error("WAT? Unknown packet!")
-				log.error(tmp)
+			if time.time() - loop_timer > FILE_ROTATION_INTERVAL:
+				log.info("Rotating log files")
+				break
 
+		elif "shutdown" in tmp:
+			running = False
 
-		if ctrlNs.acqRunning == False:
+		elif isInfo(tmp):
+			writeInfo(tmp)
+
+		else:
+			log.error("WAT? Unknown packet!")
+			log.error(tmp)
+
+
+		if not running or ctrlNs.acqRunning == False:
 			log.info("Stopping Log-thread!")
+			# The acquisition has closed the ring, so write out whatever is left in it, and the messages still queued
+			# (the last metrics snapshot, a final recalibration gap, etc). The acquisition's shutdown notice is the last
+			# thing it queues, so until it's in, wait a moment for the queue to catch up.
+			writeRingRows()
+			drained = not running
+			while 1:
+				try:
+					tmp = dataQueue.get_nowait() if drained else dataQueue.get(timeout = QUEUE_WAIT_TIMEOUT)
+				except Queue.Empty:
+					break
+				if "shutdown" in tmp:
+					drained = True
+				elif isInfo(tmp):
+					writeInfo(tmp)
+			running = False
 			break
 
 
 	out.close()
+	return running
 
 
 def dotest():
@@ -19,6 +19,8 @@
 import logging
 import time
 import socket
+import select
+import Queue
 import logSetup
 import numpy as np
 import traceback
@@ -56,14 +58,65 @@ def startApiServer(dataQueue, ctrlNs, printQueue):
 	numBins = None
 
 
-	runningSum = np.array(())
-	runningSumItems = 0
-
-
+	# Rows arrive through a shared-memory ring, once the acquisition process has sent us its name.
+	from SignalHound.buffers import SpectrumRing
+	from SignalHound.metrics import LatencyHistogram
+	ring = None
+
+	# Time from the acquisition queueing each row to it having been sent (or discarded, with nobody connected).
+	rowLatency = LatencyHistogram()
+
+	def sendRow(sok, startFreq, binSize, arr):
+		'''
+		Send a row to the connected client. Returns the socket, or ``None`` if the connection broke.
+		'''
+		outDict = {"startFreq":startFreq,
+					"numBins":arr.shape[0],
+					"binSize": binSize,
+					"data":arr}
+
+		pData = cPickle.dumps(outDict, protocol=cPickle.HIGHEST_PROTOCOL)
+		pData = "BEGIN_DATA"+pData+"END_DATA"
+
+		try:
+			# Holy shit, sok.send is MUCH faster then sok.sendall. Wat?
+			# I bet sendall() is sending each byte at a time from native python, rather then just calling send() from the OS
+			# API directly on the buffer to send. Stupid.
+			msgLen = len(pData)
+			totalsent = 0
+			while totalsent < msgLen:
+				sent = sok.send(pData[totalsent:])
+				if sent == 0:
+					raise RuntimeError("socket connection broken")
+				totalsent = totalsent + sent
+
+		except BufferError:
+			log.error("Transmission failed to properly transmit all bytes")
+			log.error(traceback.format_exc())
+
+		except socket.timeout:
+			log.error("Timeout on transmit?")
+			log.error(traceback.format_exc())
+		except AttributeError:
+			# I have NO idea how this was happening, but somehow sok.sendall was being called after
+			# sok had been set = None.
+			log.error("WAT?")
+			log.error(traceback.format_exc())
+
+
+		except socket.error:
+			log.error("Socket Error!")
+			log.error(traceback.format_exc())
+			sok = None
+			log.error("Closing socket connection.")
+
+		return sok
 
 	while 1:
 
-		if not sok:
+		# The listening socket doesn't block (it's only checked once it's readable), so a client that connects while
+		# we're idle is picked up within QUEUE_WAIT_TIMEOUT.
+		if not sok and select.select([conn], [], [], 0)[0]:
 			try:
 				sok, addr = conn.accept()
 
@@ -71,89 +124,55 @@ def startApiServer(dataQueue, ctrlNs, printQueue):
 				sok.settimeout(TX_TIMEOUT)
 
 				log.info("Have connection %s from %s", sok, addr)
-			except socket.timeout:
-				while not dataQueue.empty():
-					tmp = dataQueue.get()
-
-					if "settings" in tmp:
-						dat = tmp["settings"]
-						startFreq = dat["ret-start-freq"]
-						binSize = dat["arr-bin-size"]
-						numBins = dat["arr-size"]
-					dataChunks += 1
-
-		if sok != None:
-			if dataQueue.empty():
-				time.sleep(0.001)
-			else:
-				# log.info("Sending plot data out socket")
-				tmp = dataQueue.get()
-
-
-				if "settings" in tmp:
-					# log.info("Setting plot diagnostics for ")
-					dat = tmp["settings"]
-					startFreq = dat["ret-start-freq"]
-					binSize = dat["arr-bin-size"]
-					numBins = dat["arr-size"]
-
-
-				elif "row" in tmp:
-					arr = tmp["row"][4]
-					startFreq = tmp["row"][1]
-					binSize = tmp["row"][2]
-					numBins = tmp["row"][4].shape[0]
-
-
-					outDict = {"startFreq":startFreq,
-								"numBins":numBins,
-								"binSize": binSize,
-								"data":arr}
-
-					pData = cPickle.dumps(outDict, protocol=cPickle.HIGHEST_PROTOCOL)
-					pData = "BEGIN_DATA"+pData+"END_DATA"
-
-					runningSum = np.zeros_like(runningSum)
-					runningSumItems = 0
-					try:
-						# Holy shit, sok.send is MUCH faster then sok.sendall. Wat?
-						# I bet sendall() is sending each byte at a time from native python, rather then just calling send() from the OS
-						# API directly on the buffer to send. Stupid.
-						msgLen = len(pData)
-						totalsent = 0
-						while totalsent < msgLen:
-							sent = sok.send(pData[totalsent:])
-							if sent == 0:
-								raise RuntimeError("socket connection broken")
-							totalsent = totalsent + sent
-
-						dataChunks += 1
-					except BufferError:
-						log.error("Transmission failed to properly transmit all bytes")
-						log.error(traceback.format_exc())
-
-					except socket.timeout:
-						log.error("Timeout on transmit?")
-						log.error(traceback.format_exc())
-					except AttributeError:
-						# I have NO idea how this was happening, but somehow sok.sendall was being called after
-						# sok had been set = None.
-						log.error("WAT?")
-						log.error(traceback.format_exc())
-						continue
-
-
-					except socket.error:
-						log.error("Socket Error!")
-						log.error(traceback.format_exc())
-						sok = None
-						log.error("Closing socket connection.")
-
+			except socket.error:
+				log.error("Failed to accept connection!")
+				log.error(traceback.format_exc())
+				sok = None
+
+		# Block until the acquisition sends something. New rows in the ring are announced on the queue.
+		try:
+			tmp = dataQueue.get(timeout = settings.QUEUE_WAIT_TIMEOUT)
+		except Queue.Empty:
+			tmp = None
+
+		if tmp is None or "ring-row" in tmp:
+			# Rows are announced one notice at a time, so drain on timeouts too, in case one raced with the last drain.
+			if tmp:
+				ring.clearNotice()
+
+			while ring and ring.available():
+				row = ring.get(timeout = 0)
+				if not row:
+					break
+				rowTime, startFreq, binSize, rowItems, arrays = row
+				numBins = arrays.shape[1]
+				# The acquisition overwrites rows we fall behind on rather than waiting, so take a copy, and only send
+				# it if the row wasn't overwritten while we were copying it. Nobody to send rows to just keeps the
+				# ring drained.
+				arr = arrays[0].copy() if sok else None
+				if ring.release() and sok:
+					# log.info("Sending plot data out socket")
+					sok = sendRow(sok, startFreq, binSize, arr)
+				rowLatency.add(time.time() - rowTime)
+				dataChunks += 1
+
+		elif "ring" in tmp:
+			ring = SpectrumRing.attach(tmp["ring"])
+
+		elif "settings" in tmp:
+			# log.info("Setting plot diagnostics for ")
+			dat = tmp["settings"]
+			startFreq = dat["ret-start-freq"]
+			binSize = dat["arr-bin-size"]
+			numBins = dat["arr-size"]
+
+		elif "shutdown" in tmp:
+			log.info("Stopping API-thread!")
+			break
 
-				else:
-					log.error("WAT? Unknown packet!")
-					log.error("WAT? \"row\" in tmp - %s", "row" in tmp)
-					log.error(tmp)
+		else:
+			log.error("WAT? Unknown packet!")
+			log.error(tmp)
 
 		if ctrlNs.acqRunning == False:
 			log.info("Stopping API-thread!")
@@ -165,7 +184,13 @@ def startApiServer(dataQueue, ctrlNs, printQueue):
 		if delta >= 5:
 			if dataChunks:
 				freq = 1 / (delta/dataChunks)
-				log.info("Elapsed Time = %0.5f, Chunk Update Frequency = %s", delta, freq)
+				latency = rowLatency.summary()
+				if latency["count"]:
+					log.info("Elapsed Time = %0.5f, Chunk Update Frequency = %s, Row latency median %0.2f ms, 99th percentile %0.2f ms, max %0.2f ms, %s frames dropped",
+						delta, freq, latency["p50"] * 1000, latency["p99"] * 1000, latency["max"] * 1000, ring.dropped if ring else 0)
+				else:
+					log.info("Elapsed Time = %0.5f, Chunk Update Frequency = %s", delta, freq)
+				rowLatency.reset()
 				loop_timer = now
 				dataChunks = 0
 			else:
@@ -23,6 +23,7 @@ import time
 import numpy as np
 
 from app.SignalHound import SignalHound
+from app.SignalHound import metrics
 
 START_TIME = time.time()
 DATA_LOG = []
@@ -63,6 +64,33 @@ def testCallback(sh):
 
 	sh.abort()
 
+def benchSweepLoopCapture(sh, seconds = 10):
+	'''
+	Capture the raw sweep loop into the preallocated ring for ``seconds``, consuming it from the main
+	thread, and report the capture rate and the number of sweeps dropped because the ring was full.
+	'''
+
+	sh.configureCenterSpan(150e6, 100e6)
+	sh.configureLevel(-50, 10)
+	sh.configureGain(0)
+	sh.configureRawSweep(100, 8, 2)
+	sh.initiate("raw-sweep-loop", 0)
+	ring = sh.startRawSweepCapture()
+
+	received = 0
+	start = time.time()
+	for sweep, timestamp in ring.sweeps(timeout = 1):
+		sweep.mean()  # Stand-in for some real processing
+		received += 1
+		if time.time() - start > seconds:
+			break
+	delta = time.time() - start
+
+	sh.abort()
+
+	print "Sweep length %d samples, ring of %d sweeps" % (ring.sweepLen, ring.numSlots)
+	print "%d sweeps consumed in %0.3f seconds, %0.1f sweeps/sec, %d captured, %d dropped" % (received, delta, received / delta, ring.written, ring.dropped)
+
 def testIqStreaming(sh):
 	global START_TIME  #hacking about for determining callback interval times. I shouldn't be using global, but fukkit.
 
@@ -78,7 +106,7 @@ def testIqStreaming(sh):
 
 	sh.initiate("streaming", None)
 	print sh.queryStreamInfo()
-	print sh.rawDataArrSize
+	print sh._rawDataArrSize
 
 	out = open("dat.bin", "wb")
 
@@ -424,6 +452,557 @@ def testGpsSweeps(sh):
 
 	sh.abort()
 
+def benchFetchTrace(sh, numSweeps = 1000):
+	'''
+	Compare the allocation behaviour and sweep rate of the various fetchTrace() modes.
+	An "allocation" is counted every time a fetch hands back an array object that differs
+	from the one returned by the previous fetch.
+	'''
+
+	numSweeps = int(numSweeps)
+
+	sh.configureAcquisition("average", "log-scale")
+	sh.configureCenterSpan(center = 150e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureSweepCoupling(rbw = 2.465e3, vbw = 2.465e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+	sh.configureWindow(window = "hamming")
+	sh.configureProcUnits(units = "power")
+	sh.configureTrigger(trigType = "none", edge = "rising-edge", level = 0, timeout = 5)
+	sh.initiate(mode = "real-time", flag = "ignored")
+	traceLen = sh.queryTraceInfo()["arr-size"]
+	print "Trace length = ", traceLen
+
+	minBuf = np.empty(traceLen, dtype=np.double)
+	maxBuf = np.empty(traceLen, dtype=np.double)
+
+	def fetchCopy():
+		return sh.fetchTrace(copy=True)
+
+	def fetchPersistent():
+		return sh.fetchTrace()
+
+	def fetchInto():
+		sh.fetchTraceInto(minBuf, maxBuf)
+		return {"min" : minBuf, "max" : maxBuf}
+
+	modes = [
+		("fetchTrace(copy=True)", fetchCopy),
+		("fetchTrace()",          fetchPersistent),
+		("fetchTraceInto()",      fetchInto),
+	]
+
+	for name, func in modes:
+		last = func()
+		allocs = 0
+		start = time.time()
+		for dummy_x in xrange(numSweeps):
+			tmp = func()
+			allocs += (tmp["min"] is not last["min"]) + (tmp["max"] is not last["max"])
+			last = tmp
+		delta = time.time() - start
+
+		print "%s: %d sweeps in %0.3f seconds, %0.1f sweeps/sec, %0.2f allocations/sweep" % (name.ljust(22), numSweeps, delta, numSweeps / delta, allocs / float(numSweeps))
+
+	sh.abort()
+
+def benchIqStreaming(sh, seconds = 10):
+	'''
+	Stream IQ data through fetchRaw() for ``seconds`` and check that it keeps up with the device.
+
+	The achieved sample rate should match the "samples_per_sec" reported by queryStreamInfo(). If
+	the fetch loop is too slow the API drops samples, which shows up as a rate shortfall and as gaps
+	in the block timestamps. Also reports the worst-case fetch time and the per-block allocations
+	(blocks not returned as views into sh.iqRing).
+	'''
+
+	sh.configureCenterSpan(center = 100e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureIQ(1, 20e6)
+	sh.initiate(mode = "streaming", flag = "iq")
+
+	info = sh.queryStreamInfo()
+	print "Stream info:", info
+	blockTime = info["return_len"] / float(info["samples_per_sec"])
+
+	# Let the stream settle before timing anything
+	for dummy_x in xrange(10):
+		sh.fetchRaw()
+
+	blocks = 0
+	allocs = 0
+	gaps = 0
+	worst = 0
+	lastTs = None
+	start = time.time()
+	while time.time() - start < seconds:
+		fetchStart = time.time()
+		ret = sh.fetchRaw()
+		worst = max(worst, time.time() - fetchStart)
+
+		allocs += ret["data"].base is not sh.iqRing.data
+		ts = ret["timestamp"][0] + ret["timestamp"][1] / 1e9
+		if lastTs is not None and ts - lastTs > blockTime * 1.5:
+			gaps += 1
+		lastTs = ts
+		blocks += 1
+	delta = time.time() - start
+
+	rate = blocks * info["return_len"] / delta
+	print "%d blocks of %d samples in %0.3f seconds" % (blocks, info["return_len"], delta)
+	print "Sample rate: %0.4g samples/sec, device rate %0.4g samples/sec (%0.1f%%)" % (rate, info["samples_per_sec"], rate / info["samples_per_sec"] * 100)
+	print "Worst fetch time %0.3f ms (block period %0.3f ms), %d timestamp gaps, %0.2f allocations/block" % (worst * 1000, blockTime * 1000, gaps, allocs / float(blocks))
+
+	sh.abort()
+
+def benchFetchTraces(sh, numSweeps = 1000):
+	'''
+	Compare averaging ``numSweeps`` traces by accumulating fetchTrace() results in python (as the
+	spectra logger does) with fetching them as one block with fetchTraces() and reducing it.
+	'''
+
+	numSweeps = int(numSweeps)
+
+	sh.configureAcquisition("average", "log-scale")
+	sh.configureCenterSpan(center = 150e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureSweepCoupling(rbw = 2.465e3, vbw = 2.465e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+	sh.configureWindow(window = "hamming")
+	sh.configureProcUnits(units = "power")
+	sh.configureTrigger(trigType = "none", edge = "rising-edge", level = 0, timeout = 5)
+	sh.initiate(mode = "real-time", flag = "ignored")
+	traceLen = sh.queryTraceInfo()["arr-size"]
+	print "Trace length = ", traceLen
+
+	def accumulate():
+		runningSum = np.zeros(traceLen)
+		for dummy_x in xrange(numSweeps):
+			runningSum += sh.fetchTrace()["max"]
+		return runningSum / numSweeps
+
+	block64 = sh.fetchTraces(numSweeps)
+	block32 = sh.fetchTraces(numSweeps, dtype = np.float32)
+
+	def blockMean64():
+		return sh.fetchTraces(numSweeps, block = block64).rows.mean(axis = 0)
+
+	def blockMean32():
+		return sh.fetchTraces(numSweeps, block = block32).rows.mean(axis = 0, dtype = np.float64)
+
+	modes = [
+		("fetchTrace() + python sum", accumulate),
+		("fetchTraces(), float64",    blockMean64),
+		("fetchTraces(), float32",    blockMean32),
+	]
+
+	for name, func in modes:
+		start = time.time()
+		func()
+		delta = time.time() - start
+		print "%s: %d sweeps in %0.3f seconds, %0.1f sweeps/sec" % (name.ljust(26), numSweeps, delta, numSweeps / delta)
+
+	print "Block memory: float64 %d KB, float32 %d KB. ADC overflows in last block: %d" % (block64.max.nbytes / 1024, block32.max.nbytes / 1024, block32.adcOverflows)
+
+	sh.abort()
+
+def benchBackgroundAcquisition(sh, seconds = 10):
+	'''
+	Run a fetch-then-process loop for ``seconds``, first serially and then with the fetch in the background
+	thread, and compare the trace rate and the fraction of the time the device spent acquiring.
+	'''
+
+	sh.configureAcquisition("average", "log-scale")
+	sh.configureCenterSpan(center = 150e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureSweepCoupling(rbw = 9.863e3, vbw = 9.863e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+	sh.configureWindow(window = "hamming")
+	sh.configureProcUnits(units = "power")
+	sh.configureTrigger(trigType = "none", edge = "rising-edge", level = 0, timeout = 5)
+	sh.initiate(mode = "real-time", flag = "ignored")
+	traceLen = sh.queryTraceInfo()["arr-size"]
+
+	runningSum = np.zeros(traceLen)
+	def process(trace):
+		# Stand-in for the spectra logger's per-sweep work
+		np.add(runningSum, trace, out = runningSum)
+		np.sort(trace)
+
+	traces = 0
+	fetchTime = 0
+	start = time.time()
+	while time.time() - start < seconds:
+		fetchStart = time.time()
+		trace = sh.fetchTrace()["max"]
+		fetchTime += time.time() - fetchStart
+		process(trace)
+		traces += 1
+	delta = time.time() - start
+	print "Serial:     %d traces in %0.3f seconds, %0.1f traces/sec, duty cycle %0.1f%%" % (traces, delta, traces / delta, fetchTime / delta * 100)
+
+	acq = sh.startBackgroundAcquisition()
+	start = time.time()
+	for trace, timestamp in acq.traces(timeout = 1):
+		process(trace)
+		if time.time() - start > seconds:
+			break
+	stats = sh.stopBackgroundAcquisition()
+	print "Background: %d traces in %0.3f seconds, %0.1f traces/sec, duty cycle %0.1f%%, %0.3f seconds waiting on the consumer" % (stats["traces"], stats["elapsed"], stats["trace-rate"], stats["duty-cycle"] * 100, stats["wait-time"])
+	print "            fetch stage %0.3f seconds, processing stage %0.3f seconds (%0.0f traces/sec), %0.3f seconds waiting on the device" % (stats["fetch-time"], stats["process-time"], stats["process-rate"], stats["idle-time"])
+
+	sh.abort()
+
+def benchRetune(sh, numRetunes = 100):
+	'''
+	Hop a real-time acquisition between two bands ``numRetunes`` times, first with a full abort and reconfigure
+	(as the internal sweep mode used to), then with retune(), and compare the time from starting each retune to
+	having the first trace at the new frequency.
+	'''
+
+	numRetunes = int(numRetunes)
+
+	def configure(center):
+		sh.configureAcquisition("average", "log-scale")
+		sh.configureCenterSpan(center = center, span = 20e6)
+		sh.configureLevel(ref = 10, atten = "auto")
+		sh.configureGain(gain = 0)
+		sh.configureSweepCoupling(rbw = 9.863e3, vbw = 9.863e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+		sh.configureWindow(window = "hamming")
+		sh.configureProcUnits(units = "power")
+		sh.configureTrigger(trigType = "none", edge = "rising-edge", level = 0, timeout = 5)
+		sh.initiate(mode = "real-time", flag = "ignored")
+
+	def fullReconfigure(center):
+		sh.abort()
+		configure(center)
+
+	def fastRetune(center):
+		sh.retune(center)
+
+	configure(150e6)
+	for name, func in (("abort + reconfigure", fullReconfigure), ("retune()", fastRetune)):
+		latency = metrics.LatencyHistogram()
+		for x in xrange(numRetunes):
+			start = time.time()
+			func(150e6 + (x % 2) * 20e6)
+			sh.fetchTrace()
+			latency.add(time.time() - start)
+
+		stats = latency.summary()
+		print "%s: mean %0.2f ms, p50 %0.2f ms, p90 %0.2f ms, max %0.2f ms to the first trace" % (name.ljust(20), stats["mean"] * 1000, stats["p50"] * 1000, stats["p90"] * 1000, stats["max"] * 1000)
+
+	stats = sh.retuneLatency.summary()
+	print "retune() call alone: mean %0.2f ms, max %0.2f ms" % (stats["mean"] * 1000, stats["max"] * 1000)
+
+	sh.abort()
+
+def benchRecal(sh, numRecals = 5):
+	'''
+	Recalibrate a running real-time acquisition ``numRecals`` times, first with ``selfCal()`` and the full
+	reconfigure the logger used to do, then with recalibrate(), and compare the gap from stopping the acquisition
+	to having the first trace after the calibration.
+	'''
+
+	numRecals = int(numRecals)
+
+	def configure():
+		sh.configureAcquisition("average", "log-scale")
+		sh.configureCenterSpan(center = 150e6, span = 20e6)
+		sh.configureLevel(ref = 10, atten = "auto")
+		sh.configureGain(gain = 0)
+		sh.configureSweepCoupling(rbw = 9.863e3, vbw = 9.863e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+		sh.configureWindow(window = "hamming")
+		sh.configureProcUnits(units = "power")
+		sh.configureTrigger(trigType = "none", edge = "rising-edge", level = 0, timeout = 5)
+		sh.initiate(mode = "real-time", flag = "ignored")
+
+	def fullRecal():
+		sh.selfCal()
+		configure()
+		sh.getCurrentAcquisitionSettings()
+
+	configure()
+	for name, func in (("selfCal + reconfigure", fullRecal), ("recalibrate()", sh.recalibrate)):
+		latency = metrics.LatencyHistogram()
+		for x in xrange(numRecals):
+			sh.fetchTrace()
+			start = time.time()
+			func()
+			sh.fetchTrace()
+			latency.add(time.time() - start)
+
+		stats = latency.summary()
+		print "%s: mean %0.1f ms, max %0.1f ms from the last trace before the calibration to the first one after" % (name.ljust(22), stats["mean"] * 1000, stats["max"] * 1000)
+
+	stats = sh.recalLatency.summary()
+	print "recalibrate() call alone: mean %0.1f ms, max %0.1f ms" % (stats["mean"] * 1000, stats["max"] * 1000)
+
+	sh.abort()
+
+def configureMultiDeviceBand(sh, serial):
+	# Each device in bench-multi gets the same real-time setup. Module-level, so the worker processes can unpickle it.
+	sh.configureAcquisition("average", "log-scale")
+	sh.configureCenterSpan(center = 150e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureSweepCoupling(rbw = 9.863e3, vbw = 9.863e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+	sh.configureWindow(window = "hamming")
+	sh.configureProcUnits(units = "power")
+	sh.initiate(mode = "real-time", flag = "ignored")
+
+def benchMultiDevice(sh, seconds = 10):
+	'''
+	Run every connected device in parallel through the DeviceManager for ``seconds``, consuming the merged
+	stream, and report the per-device and aggregate sweep rates.
+	'''
+
+	from app.SignalHound.manager import DeviceManager
+
+	# The workers open the devices themselves.
+	serials = sh.listSerialNumbers()
+	sh.closeDevice()
+
+	mgr = DeviceManager(configureMultiDeviceBand, serials = serials)
+	mgr.start()
+
+	received = 0
+	outOfOrder = 0
+	last = 0
+	start = time.time()
+	for serial, timestamp, startFreq, binSize, trace in mgr.sweeps(timeout = 5):
+		received += 1
+		if timestamp < last:
+			outOfOrder += 1
+		last = timestamp
+		if time.time() - start > seconds:
+			break
+	stats = mgr.stop()
+
+	for serial, dev in sorted(stats["devices"].items()):
+		print "Device %s: %d sweeps, %0.1f sweeps/sec, %d dropped, %d errors" % (serial, dev["sweeps"], dev["sweep-rate"], dev["dropped"], dev["errors"])
+	print "%d devices: %0.1f sweeps/sec aggregate, %d merged sweeps consumed, %d out of order" % (len(serials), stats["sweep-rate"], received, outOfOrder)
+
+	sh.openDevice()
+
+def rowQueueConsumer(rowQueue, results):
+	# Consumer side of bench-transport. Module-level, so the consumer processes can unpickle it.
+	latency = 0.0
+	rows = 0
+	while True:
+		row = rowQueue.get()
+		if row is None:
+			break
+		latency += time.time() - row["row"][0]
+		rows += 1
+	results.put((rows, latency / max(rows, 1)))
+
+def rowRingConsumer(ringName, results):
+	from app.SignalHound.buffers import SpectrumRing
+	ring = SpectrumRing.attach(ringName)
+	latency = 0.0
+	rows = 0
+	for saveTime, startFreq, binSize, numScans, arrays in ring.rows():
+		latency += time.time() - saveTime
+		rows += 1
+	results.put((rows, latency / max(rows, 1)))
+
+def benchRowTransport(sh, numRows = 500):
+	'''
+	Send ``numRows`` 65536 bin spectrum rows to a consumer process, first pickled through an ``mp.Queue`` (as the
+	spectra logger used to), then through a shared-memory ``SpectrumRing``, and compare the producer CPU time per
+	row (the queue pickles in a feeder thread, so the put() itself looks cheap), the end-to-end row rate, and the
+	latency from sending a row to the consumer having it. Doesn't use the device.
+
+	Also checks the ring cleans up after itself. Run it on Windows too: the ring is a named page file mapping
+	there rather than a file (``os.ftruncate()`` isn't available, and a mapped file can't be deleted), and the
+	consumer is a spawned process attaching it by tag, so this is the only thing that exercises that path.
+	'''
+
+	import multiprocessing as mp
+	import os
+	from app.SignalHound.buffers import SpectrumRing
+
+	row = np.random.randn(65536)
+	results = mp.Queue()
+
+	rowQueue = mp.Queue()
+	consumer = mp.Process(target=rowQueueConsumer, args=(rowQueue, results))
+	consumer.start()
+	start, cpuStart = time.time(), sum(os.times()[:2])
+	for x in range(numRows):
+		rowQueue.put({"row" : (time.time(), 100e6, 1e3, x, row)})
+	rowQueue.put(None)
+	queueRows, queueLatency = results.get()
+	queueTime, queueCpu = time.time() - start, sum(os.times()[:2]) - cpuStart
+	consumer.join()
+
+	ring = SpectrumRing.create(32, row.shape[0])
+	consumer = mp.Process(target=rowRingConsumer, args=(ring.name, results))
+	consumer.start()
+	start, cpuStart = time.time(), sum(os.times()[:2])
+	for x in range(numRows):
+		# Wait rather than drop, so both paths deliver every row.
+		while not ring.put(time.time(), 100e6, 1e3, x, row):
+			time.sleep(0.0001)
+	ring.close()
+	ringRows, ringLatency = results.get()
+	ringTime, ringCpu = time.time() - start, sum(os.times()[:2]) - cpuStart
+	consumer.join()
+	ring.unlink()
+	if sys.platform == "win32":
+		# The consumer has exited, so this only works because we still have it mapped.
+		print "Ring still attachable by tag while the producer holds it: %s" % (SpectrumRing.attach(ring.name).numSlots == 32)
+	else:
+		print "Ring file removed: %s" % (not os.path.exists(ring.name))
+
+	for name, rows, elapsed, cpu, latency in (("mp.Queue", queueRows, queueTime, queueCpu, queueLatency), ("SpectrumRing", ringRows, ringTime, ringCpu, ringLatency)):
+		print "%-12s: %d rows, %0.0f rows/sec, %0.1f us producer CPU per row, %0.2f ms mean latency" % (name, rows, rows / elapsed, cpu / rows * 1e6, latency * 1000)
+
+def pollingConsumer(msgQueue, results):
+	# Consumer side of bench-consumers, as the logger's processes used to wait: empty() then a short sleep.
+	import os
+	cpuStart = sum(os.times()[:2])
+	idleCpu = None
+	latencies = []
+	while True:
+		if msgQueue.empty():
+			time.sleep(0.005)
+			continue
+		msg = msgQueue.get()
+		if msg is None:
+			break
+		if idleCpu is None:
+			idleCpu = sum(os.times()[:2]) - cpuStart
+		latencies.append(time.time() - msg)
+	results.put((idleCpu, latencies))
+
+def blockingConsumer(msgQueue, results):
+	# Consumer side of bench-consumers, as they wait now: a blocking get(), with a timeout to check the run flags.
+	import os
+	import Queue
+	cpuStart = sum(os.times()[:2])
+	idleCpu = None
+	latencies = []
+	while True:
+		try:
+			msg = msgQueue.get(timeout = 0.25)
+		except Queue.Empty:
+			continue
+		if msg is None:
+			break
+		if idleCpu is None:
+			idleCpu = sum(os.times()[:2]) - cpuStart
+		latencies.append(time.time() - msg)
+	results.put((idleCpu, latencies))
+
+def benchQueueConsumers(sh, seconds = 5, numMessages = 500):
+	'''
+	Compare a consumer process polling its queue (``empty()`` and a 5 ms sleep, as the logger's processes used to) with
+	one blocking in ``get()``. Each consumer first idles for ``seconds``, for its idle CPU use, and is then sent
+	``numMessages`` messages 10 ms apart, for the latency from ``put()`` to the consumer handling each message.
+	Doesn't use the device.
+	'''
+
+	import multiprocessing as mp
+
+	seconds = float(seconds)
+	numMessages = int(numMessages)
+	results = mp.Queue()
+
+	for name, target in (("polling", pollingConsumer), ("blocking", blockingConsumer)):
+		msgQueue = mp.Queue()
+		consumer = mp.Process(target=target, args=(msgQueue, results))
+		consumer.start()
+		time.sleep(seconds)
+		for x in range(numMessages):
+			msgQueue.put(time.time())
+			time.sleep(0.01)
+		msgQueue.put(None)
+		idleCpu, latencies = results.get()
+		consumer.join()
+
+		hist = metrics.LatencyHistogram(minValue=1e-5, binsPerDecade=20)
+		for latency in latencies:
+			hist.add(latency)
+		summary = hist.summary()
+		print "%-8s: idle CPU %5.2f%%, latency mean %0.3f ms, median %0.3f ms, 99th percentile %0.3f ms, max %0.3f ms" % (name,
+			idleCpu / seconds * 100, summary["mean"] * 1000, summary["p50"] * 1000, summary["p99"] * 1000, summary["max"] * 1000)
+
+def benchCtypesOverhead(sh, numCalls = 100000):
+	'''
+	Measure the per-call overhead of bbQueryTraceInfo and bbFetchTrace with and without the
+	ctypes prototypes from SignalHound.bbPrototypes.
+
+	The "before" numbers use a second, unprototyped handle to the same DLL, and build the call
+	arguments the way the wrapper used to (ct.c_* wrappers, ct.pointer(), fresh ctypes arrays).
+	bbFetchTrace is called with an arraySize of 0, so the DLL returns bbBufferTooSmallErr
+	immediately rather than blocking for a sweep, which leaves only the call overhead.
+	'''
+
+	import ctypes as ct
+
+	if not sh.libPath:
+		print "bench-ctypes needs the real DLL. It can't be run against the simulated device."
+		return
+
+	numCalls = int(numCalls)
+
+	sh.configureAcquisition("average", "log-scale")
+	sh.configureCenterSpan(center = 150e6, span = 20e6)
+	sh.configureLevel(ref = 10, atten = "auto")
+	sh.configureGain(gain = 0)
+	sh.configureSweepCoupling(rbw = 9.863e3, vbw = 9.863e3, sweepTime = 0.01, rbwType = "native", rejection = "no-spur-reject")
+	sh.initiate(mode = "real-time", flag = "ignored")
+	traceLen = sh.queryTraceInfo()["arr-size"]
+
+	rawDll = ct.CDLL(sh.libPath)
+	handleNum = sh.deviceHandle.value
+
+	minBuf = np.empty(traceLen, dtype=np.double)
+	maxBuf = np.empty(traceLen, dtype=np.double)
+
+	def oldQueryTraceInfo():
+		traceLen = ct.c_uint(0)
+		binSize = ct.c_double(0)
+		start = ct.c_double(0)
+		rawDll.bbQueryTraceInfo(ct.c_int(handleNum), ct.pointer(traceLen), ct.pointer(binSize), ct.pointer(start))
+
+	def newQueryTraceInfo():
+		traceLen = ct.c_uint(0)
+		binSize = ct.c_double(0)
+		start = ct.c_double(0)
+		sh.dll.bbQueryTraceInfo(sh.deviceHandle, ct.byref(traceLen), ct.byref(binSize), ct.byref(start))
+
+	def cachedQueryTraceInfo():
+		sh.queryTraceInfo()
+
+	def oldFetchTrace():
+		maxArr = (ct.c_double * traceLen)()
+		minArr = (ct.c_double * traceLen)()
+		rawDll.bbFetchTrace(ct.c_int(handleNum), 0, ct.pointer(minArr), ct.pointer(maxArr))
+
+	def newFetchTrace():
+		sh.dll.bbFetchTrace(sh.deviceHandle, 0, minBuf.ctypes.data, maxBuf.ctypes.data)
+
+	tests = [
+		("bbQueryTraceInfo, unprototyped", oldQueryTraceInfo),
+		("bbQueryTraceInfo, prototyped",   newQueryTraceInfo),
+		("queryTraceInfo(), cached",       cachedQueryTraceInfo),
+		("bbFetchTrace, unprototyped",     oldFetchTrace),
+		("bbFetchTrace, prototyped",       newFetchTrace),
+	]
+
+	for name, func in tests:
+		start = time.time()
+		for dummy_x in xrange(numCalls):
+			func()
+		delta = time.time() - start
+		print "%s: %0.3f microseconds/call" % (name.ljust(32), delta / numCalls * 1e6)
+
+	sh.abort()
+
 def testDeviceStatusQueries(sh):
 	sh.getFirmwareVersion()
 	sh.getAPIVersion()
@@ -494,6 +1073,17 @@ def printUsage():
 		print "	'int-traces' - Fetch formatted traces while continually restarting the acquisition, and log to disk"
 		print "	'iq' - Fetch IQ samples"
 		print "	'reset' - Reset the connected device"
+		print "	'bench-fetch' - Benchmark sweep rate and per-sweep allocations of the fetchTrace() variants"
+		print "	'bench-ctypes' - Benchmark per-call ctypes overhead with and without the function prototypes"
+		print "	'bench-iq' - Check that IQ streaming through fetchRaw() keeps up with the device sample rate"
+		print "	'bench-sweep-loop' - Capture the raw sweep loop into a preallocated ring, and count dropped sweeps"
+		print "	'bench-traces' - Compare python-level trace averaging with batched fetchTraces() blocks"
+		print "	'bench-background' - Compare trace rate and duty cycle of a serial fetch loop with the background fetch thread"
+		print "	'bench-multi' - Run every connected device in parallel, one process each, and report the aggregate sweep rate"
+		print "	'bench-retune' - Compare full reconfiguration with the retune() fast path when hopping between bands"
+		print "	'bench-recal' - Compare a self-calibration and full reconfiguration with the recalibrate() fast path"
+		print "	'bench-transport' - Compare sending spectrum rows to another process through mp.Queue and a shared-memory ring"
+		print "	'bench-consumers' - Compare idle CPU and put-to-handled latency of polling and blocking queue consumers"
 
 
 
@@ -515,7 +1105,18 @@ def go():
 		'int-traces' : interruptedSweeping,
 		'gps'        : testGpsSweeps,
 		'reset'      : resetDevice,
-		'iq'         : testIqStreaming
+		'iq'         : testIqStreaming,
+		'bench-fetch': benchFetchTrace,
+		'bench-ctypes': benchCtypesOverhead,
+		'bench-iq'   : benchIqStreaming,
+		'bench-sweep-loop' : benchSweepLoopCapture,
+		'bench-traces' : benchFetchTraces,
+		'bench-background' : benchBackgroundAcquisition,
+		'bench-multi' : benchMultiDevice,
+		'bench-retune' : benchRetune,
+		'bench-recal' : benchRecal,
+		'bench-transport' : benchRowTransport,
+		'bench-consumers' : benchQueueConsumers
 	}
 
 	if sys.argv[1] in funcs: